@@ -0,0 +1,40 @@
+import argparse
+import json
+import os
+import sys
+
+from .suite import run, compare, REGRESSION_THRESHOLD
+
+BASELINE_FILEPATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Times the key paths on synthetic histories.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="history sizes (up to 1e7)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    parser.add_argument("--output", help="write the results (json) to this file")
+    parser.add_argument("--baseline", default=BASELINE_FILEPATH, help="results (json) to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="tolerated slowdown (fraction)")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(json.dumps(results, indent=2))
+        return 0
+    if not os.path.exists(args.baseline):
+        print(json.dumps(results, indent=2))
+        return 0
+
+    with open(args.baseline) as file:
+        comparison = compare(results, json.load(file), args.threshold)
+    print(json.dumps({"results": results, "comparison": comparison}, indent=2))
+    return 1 if any(row["regression"] for row in comparison) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
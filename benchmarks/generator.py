@@ -0,0 +1,63 @@
+from datetime import time
+import numpy as np
+import pandas as pd
+
+from src.transactions import SALE, PURCHASE, SPLIT
+
+START_DATE = np.datetime64("2000-01-01T00:00:00", "s")
+SPAN_SECONDS = 30 * 365 * 24 * 3600  # histories are spread over ~30 years, whatever their size
+CURRENCIES = ["CAD", "USD", "EUR", "GBP"]
+INITIAL_EXCH_RATES = [1.0, 1.35, 1.45, 1.70]  # to CAD
+TARGET_CURRENCY = "CAD"
+SPLIT_RATIOS = [2.0, 3.0]
+SPLITS_PER_HISTORY = 3  # like a real ticker, whatever the number of trades (split factors multiply)
+SALE_PROBABILITY = 0.35
+TIMES_OF_DAY = np.array([time(s // 3600, s % 3600 // 60, s % 60) for s in range(24 * 3600)], dtype=object)
+
+def generate_history(size: int, seed: int = 0) -> pd.DataFrame:
+    # seeded synthetic history of size purchases, sales and splits (one row per record, in chronological order),
+    # in the format accepted by TransactionHistory.add_many
+    # timestamps are strictly increasing (several trades per day on large sizes), so there are never duplicates,
+    # and sales never exceed holdings: each sale sells part of what was bought since the previous sale
+    rng = np.random.default_rng(seed)
+
+    gaps = rng.integers(1, max(2, 2 * SPAN_SECONDS // max(size, 1)), size=size)
+    timestamps = START_DATE + np.cumsum(gaps).astype("timedelta64[s]")
+    dates = timestamps.astype("datetime64[D]")
+    seconds_of_day = (timestamps - dates).astype(int)
+
+    is_split = np.zeros(size, dtype=bool)
+    is_split[rng.choice(size, min(SPLITS_PER_HISTORY, size), replace=False)] = True
+    is_sale = ~is_split & (rng.random(size) < SALE_PROBABILITY)
+    types = np.where(is_split, SPLIT, np.where(is_sale, SALE, PURCHASE)).astype(object)
+
+    quantity = np.where(~is_split & ~is_sale, rng.integers(1, 100, size=size), 0).astype(float)
+    bought = np.cumsum(quantity)
+    sale_positions = np.flatnonzero(is_sale)
+    bought_since_previous_sale = np.diff(np.concatenate([[0.0], bought[sale_positions]]))
+    quantity[sale_positions] = np.floor(rng.random(len(sale_positions)) * bought_since_previous_sale)
+    # nothing to sell: buy a share instead
+    empty_sales = sale_positions[quantity[sale_positions] == 0]
+    types[empty_sales] = PURCHASE
+    quantity[empty_sales] = 1.0
+
+    # random walks for the unit price and the exchange rates
+    unit_price = np.round(50 * np.exp(np.cumsum(rng.normal(0, 0.01, size=size))), 2)
+    currency = rng.integers(0, len(CURRENCIES), size=size)
+    exch_drift = np.exp(np.cumsum(rng.normal(0, 0.001, size=size)))
+    exch_rate = np.where(currency == 0, 1.0, np.round(np.take(INITIAL_EXCH_RATES, currency) * exch_drift, 4))
+    closing_costs = np.round(rng.choice([0.0, 4.95, 9.99], size=size), 2)
+
+    transaction_values = lambda values: np.where(is_split, np.nan, values)
+    return pd.DataFrame({
+        "type": types,
+        "date": dates,
+        "time": TIMES_OF_DAY[seconds_of_day],
+        "quantity": transaction_values(quantity),
+        "unit_price": transaction_values(unit_price),
+        "closing_costs": transaction_values(closing_costs),
+        "tx_currency": np.where(is_split, None, np.take(CURRENCIES, currency).astype(object)),
+        "exch_rate": transaction_values(exch_rate),
+        "target_currency": np.where(is_split, None, TARGET_CURRENCY),
+        "ratio": np.where(is_split, rng.choice(SPLIT_RATIOS, size=size), np.nan),
+    })
@@ -0,0 +1,114 @@
+import platform
+import time as timer
+from datetime import date
+from typing import Callable
+import numpy as np
+import pandas as pd
+
+from src.stats import Statistics
+from src.transactions import Transaction, Split, TransactionHistory, TransactionFinder, DuplicateError, SALE, PURCHASE, SPLIT
+from .generator import generate_history
+
+DUPLICATE_SAMPLE_SIZE = 1000  # number of existing records re-added by the duplicate check benchmark
+REGRESSION_THRESHOLD = 0.10  # slower than the baseline by more than this fraction = regression
+MIN_RUN_TIME = 0.2  # each benchmark keeps running past repeat runs until it has been timed for this long (seconds)
+MIN_SLOWDOWN = 0.001  # slowdowns under this many seconds are timer noise and never a regression
+
+def _best_of(function: Callable, setup: Callable, repeat: int) -> float:
+    # best wall time (in seconds) of function(setup()) over at least repeat runs and MIN_RUN_TIME in total; setup isn't timed
+    best, total, runs = float("inf"), 0.0, 0
+    while runs < repeat or total < MIN_RUN_TIME:
+        argument = setup()
+        start = timer.perf_counter()
+        function(argument)
+        elapsed = timer.perf_counter() - start
+        best, total, runs = min(best, elapsed), total + elapsed, runs + 1
+    return best
+
+def _records(history: pd.DataFrame) -> list[Transaction | Split]:
+    tx_history = TransactionHistory()
+    tx_history.add_many(history)
+    return list(tx_history.iter_chronological())
+
+def _add_one_by_one(records: list[Transaction | Split]) -> TransactionHistory:
+    tx_history = TransactionHistory()
+    add = {PURCHASE: tx_history.add_purchase, SALE: tx_history.add_sale, SPLIT: tx_history.add_split}
+    for record in records:
+        add[record.type](record)
+    return tx_history
+
+def _add_duplicates(tx_history: TransactionHistory, duplicates: list[Transaction | Split]) -> None:
+    # every add goes through _append_dict, which rejects the record
+    add = {PURCHASE: tx_history.add_purchase, SALE: tx_history.add_sale, SPLIT: tx_history.add_split}
+    for record in duplicates:
+        try:
+            add[record.type](record)
+        except DuplicateError:
+            pass
+
+def _find_all(tx_history: TransactionHistory, years: list[int]) -> None:
+    for year in years:
+        TransactionFinder(tx_history, PURCHASE).with_year(year).with_quantity_greater_than(50).find_all()
+
+def _per_year_queries(statistics: Statistics, years: list[int]) -> None:
+    for year in years:
+        statistics.total_capital_gains_for(year)
+        statistics.list_capital_gains_for(year)
+        statistics.history_for(year)
+    statistics.ACB_at_end_of_day_many([date(year, 12, 31) for year in years])
+
+def run_size(size: int, seed: int = 0, repeat: int = 3) -> dict[str, float]:
+    # times the key paths on a generated history of size records: {benchmark name: best time in seconds}
+    history = generate_history(size, seed)
+    records = _records(history)
+    tx_history = _add_one_by_one(records)
+    rng = np.random.default_rng(seed)
+    duplicates = [records[i] for i in rng.integers(0, len(records), size=min(DUPLICATE_SAMPLE_SIZE, len(records)))]
+    years = sorted({record.date.year for record in records})
+    inputs = tx_history.get_data_for_statistics()
+    statistics = Statistics()
+    statistics.recalculate_statistics(inputs)
+
+    return {
+        "add_one_by_one": _best_of(_add_one_by_one, lambda: records, repeat),
+        "add_many": _best_of(lambda frame: TransactionHistory().add_many(frame), lambda: history, repeat),
+        "add_many_records": _best_of(lambda records: TransactionHistory().add_many(records), lambda: records, repeat),
+        "duplicate_checks": _best_of(lambda duplicates: _add_duplicates(tx_history, duplicates), lambda: duplicates, repeat),
+        "find_all": _best_of(lambda years: _find_all(tx_history, years), lambda: years, repeat),
+        "get_data_for_statistics": _best_of(lambda _: tx_history.get_data_for_statistics(), lambda: None, repeat),
+        "recalculate_statistics": _best_of(lambda inputs: Statistics().recalculate_statistics(inputs), lambda: inputs, repeat),
+        "per_year_queries": _best_of(lambda years: _per_year_queries(statistics, years), lambda: years, repeat),
+    }
+
+def run(sizes: list[int], seed: int = 0, repeat: int = 3) -> dict:
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+        },
+        "seed": seed,
+        "repeat": repeat,
+        "results": {str(size): run_size(size, seed, repeat) for size in sizes},
+    }
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD, min_slowdown: float = MIN_SLOWDOWN) -> list[dict]:
+    # one row per (size, benchmark) present in both: ratio = time / baseline time (> 1 means slower)
+    # a regression needs both ratio > 1 + threshold and a slowdown of more than min_slowdown seconds
+    comparison = []
+    for size, timings in results["results"].items():
+        baseline_timings = baseline["results"].get(size, {})
+        for name, seconds in timings.items():
+            if name not in baseline_timings:
+                continue
+            ratio = seconds / baseline_timings[name] if baseline_timings[name] > 0 else float("inf")
+            comparison.append({
+                "size": int(size),
+                "benchmark": name,
+                "seconds": seconds,
+                "baseline": baseline_timings[name],
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold and seconds - baseline_timings[name] > min_slowdown,
+            })
+    return comparison
@@ -1,9 +1,10 @@
 from datetime import date, time
 
 from src.asset import Stock, StockFactory
+from src.instrumentation import profiling
+
+def main():
 
-if __name__ == '__main__':
-    
     # initialize stock
     stock = StockFactory.get_instance('SAP SE')
 
@@ -60,9 +61,6 @@ if __name__ == '__main__':
         target_currency= 'CAD',
     )
 
-    # calculate statistics
-    stock.statistics().recalculate_statistics()
-
     # print results
     print("Full History:")
     print(stock.statistics().full_history())
@@ -74,4 +72,9 @@ if __name__ == '__main__':
     print(stock.statistics().list_capital_gains_for(2024))
 
     print("\nAdjusted Cost Base on Jan 3 2024 (end of day)")
-    print(stock.statistics().ACB_at_end_of_day(date(2024, 1, 3)))
\ No newline at end of file
+    print(stock.statistics().ACB_at_end_of_day(date(2024, 1, 3)))
+
+
+if __name__ == '__main__':
+    with profiling():  # see CAPITAL_GAINS_PROFILE in src/instrumentation.py
+        main()
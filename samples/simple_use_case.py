@@ -60,9 +60,6 @@ if __name__ == '__main__':
         target_currency= 'CAD',
     )
 
-    # calculate statistics
-    stock.statistics().recalculate_statistics()
-
     # print results
     print("Full History:")
     print(stock.statistics().full_history())
@@ -1,14 +1,25 @@
+from __future__ import annotations
 from datetime import date, time
-from typing import Type
+from typing import Optional, Type, TYPE_CHECKING
 
-from .transactions import Transaction, TransactionHistory
-from .stats import Statistics
+from .transactions import Transaction, Split, TransactionHistory, SALE, PURCHASE, SPLIT
+from .stats import Statistics, fingerprint
+from .instrumentation import Metrics
+from .fx import FXRateStore, MissingRateError
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class Asset:
     
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, tx_history: TransactionHistory = None, fx_rates: FXRateStore = None, statistics_cache: str = None) -> None:
+        # tx_history can be any storage engine with the TransactionHistory API (e.g. ColumnarTransactionHistory)
+        # fx_rates resolves the exchange rates (and target currency) that transactions don't provide
+        # statistics_cache: .npz file reused by the first statistics() of a process if the history hasn't changed since
         self._name = name
-        self._tx_history = TransactionHistory()
+        self._tx_history = tx_history if tx_history is not None else TransactionHistory()
+        self._fx_rates = fx_rates
+        self._statistics_cache = statistics_cache
         self._statistics = Statistics()
         self._statistics_up_to_date = True
 
@@ -17,23 +28,146 @@ class Asset:
     
     def set_name(self, name: str) -> str:
         self._name = name
+
+    def get_fx_rates(self) -> Optional[FXRateStore]:
+        return self._fx_rates
+
+    def set_fx_rates(self, fx_rates: FXRateStore) -> None:
+        self._fx_rates = fx_rates
+
+    def get_statistics_cache(self) -> Optional[str]:
+        return self._statistics_cache
+
+    def set_statistics_cache(self, filepath: Optional[str]) -> None:
+        self._statistics_cache = filepath
     
-    def purchase(self, date: date, quantity: float, unit_price: float, closing_costs: float, tx_currency: str, exch_rate: float, target_currency: str, time: time = time.min) -> None:
-        raise NotImplementedError
+    def purchase(self, date: date, quantity: float, unit_price: float, closing_costs: float, tx_currency: str, exch_rate: Optional[float] = None, target_currency: Optional[str] = None, time: time = time.min) -> None:
+        # exch_rate and target_currency default to the asset's FX rate store (see set_fx_rates)
+        target_currency = self._resolve_target_currency(target_currency)
+        if exch_rate is None:
+            exch_rate = self._resolve_exch_rate(tx_currency, target_currency, date)
+        self._tx_history.add_purchase(Transaction(
+            type= PURCHASE,
+            date= date,
+            quantity= quantity,
+            unit_price= unit_price,
+            closing_costs= closing_costs,
+            tx_currency= tx_currency,
+            exch_rate= exch_rate,
+            target_currency= target_currency,
+            time= time,
+        ))
+        self._statistics_up_to_date = False
     
-    def sell(self, date: date, quantity: float, unit_price: float, closing_costs: float, tx_currency: str, exch_rate: float, target_currency: str, time: time = time.min) -> None:
-        raise NotImplementedError
+    def sell(self, date: date, quantity: float, unit_price: float, closing_costs: float, tx_currency: str, exch_rate: Optional[float] = None, target_currency: Optional[str] = None, time: time = time.min) -> None:
+        # exch_rate and target_currency default to the asset's FX rate store (see set_fx_rates)
+        target_currency = self._resolve_target_currency(target_currency)
+        if exch_rate is None:
+            exch_rate = self._resolve_exch_rate(tx_currency, target_currency, date)
+        self._tx_history.add_sale(Transaction(
+            type= SALE,
+            date= date,
+            quantity= quantity,
+            unit_price= unit_price,
+            closing_costs= closing_costs,
+            tx_currency= tx_currency,
+            exch_rate= exch_rate,
+            target_currency= target_currency,
+            time= time,
+        ))
+        self._statistics_up_to_date = False
     
-    def statistics(self) -> Statistics:
-        if self._statistics_up_to_date == False:
+    def purchase_many(self, purchases: pd.DataFrame | dict) -> None:
+        # purchases: one row per purchase, with the arguments of purchase() as columns (time, exch_rate and target_currency are optional)
+        self._add_many(purchases, PURCHASE)
+
+    def sell_many(self, sales: pd.DataFrame | dict) -> None:
+        # sales: one row per sale, with the arguments of sell() as columns (time, exch_rate and target_currency are optional)
+        self._add_many(sales, SALE)
+
+    def _add_many(self, transactions: pd.DataFrame | dict, tx_type: str) -> None:
+        import pandas as pd
+
+        transactions = self._resolve_exch_rates(pd.DataFrame(transactions).assign(type=tx_type))
+        self._tx_history.add_many(transactions)
+        self._statistics_up_to_date = False
+
+    def _resolve_target_currency(self, target_currency: Optional[str]) -> str:
+        if target_currency is not None:
+            return target_currency
+        if self._fx_rates is None:
+            raise ValueError("Target currency is required when the asset has no FX rate store.")
+        return self._fx_rates.get_target_currency()
+
+    def _resolve_exch_rate(self, tx_currency: str, target_currency: str, date: date) -> float:
+        if tx_currency == target_currency:
+            return 1.0
+        if self._fx_rates is None:
+            raise MissingRateError(f"No exchange rate for {tx_currency}/{target_currency} on {date} (the asset has no FX rate store).")
+        return self._fx_rates.rate(tx_currency, target_currency, date)
+
+    def _resolve_exch_rates(self, transactions: pd.DataFrame) -> pd.DataFrame:
+        # fills the missing target currencies and exchange rates of a batch, with one as-of join per currency pair
+        import pandas as pd
+
+        missing_target = transactions["target_currency"].isna() if "target_currency" in transactions else pd.Series(True, index=transactions.index)
+        missing_rate = transactions["exch_rate"].isna() if "exch_rate" in transactions else pd.Series(True, index=transactions.index)
+        is_transaction = transactions["type"] != SPLIT
+        missing_target &= is_transaction
+        missing_rate &= is_transaction
+        if not missing_target.any() and not missing_rate.any():
+            return transactions
+
+        transactions = transactions.copy()
+        if missing_target.any():
+            transactions.loc[missing_target, "target_currency"] = self._resolve_target_currency(None)
+        if missing_rate.any():
+            rows = transactions.loc[missing_rate]
+            same_currency = (rows["tx_currency"] == rows["target_currency"]).to_numpy()
+            if self._fx_rates is None and not same_currency.all():
+                first = rows[~same_currency].iloc[0]
+                raise MissingRateError(f"No exchange rate for {first['tx_currency']}/{first['target_currency']} on {first['date']} (the asset has no FX rate store).")
+            dates = pd.to_datetime(rows["date"]).to_numpy(dtype="datetime64[ns]")
+            rates = self._fx_rates.rates(rows["tx_currency"].to_numpy(), rows["target_currency"].to_numpy(), dates) \
+                if self._fx_rates is not None else 1.0
+            transactions.loc[missing_rate, "exch_rate"] = rates
+        return transactions
 
-            self._statistics.recalculate_statistics(
-                self._tx_history.get_data_for_statistics()
-            )
+    def statistics(self) -> Statistics:
+        # the transaction history remembers the earliest (date, time) changed since the last update,
+        # so only the events from that point on need to be recomputed
+        dirty_since = self._tx_history.dirty_since()
+        # an asset without any transaction is computed too, so that it reports empty statistics
+        if self._statistics_up_to_date == False or dirty_since is not None or self._statistics.is_empty():
+
+            if self._statistics_cache is not None and self._statistics.is_empty():
+                # first computation: reused from the cache if the history is the same as when it was saved
+                # (the digest is kept up to date by the storage engine, so a hit doesn't build the statistics inputs)
+                key = fingerprint(self._tx_history.digest())
+                if not self._statistics.load_cache(self._statistics_cache, key):
+                    self._statistics.recalculate_statistics(self._tx_history.get_arrays_for_statistics())
+                    self._statistics.save_cache(self._statistics_cache, key)
+            else:
+                # a change can also affect the superficial loss test of the sales shortly before it
+                since = self._statistics.resume_point(dirty_since) if dirty_since is not None else None
+                self._statistics.update_statistics(
+                    self._tx_history.get_arrays_for_statistics(since=since),
+                    since=since,
+                )
+            self._tx_history.clear_dirty()
             self._statistics_up_to_date = True
 
         return self._statistics
 
+    def metrics(self) -> Metrics:
+        # operations recorded by the transaction history and the statistics of this asset (see src.instrumentation)
+        # e.g. asset.metrics().to_dict() or asset.metrics().dump(filepath) (json)
+        return self._tx_history._metrics.merge(self._statistics._metrics)
+
+    def reset_metrics(self) -> None:
+        self._tx_history._metrics.reset()
+        self._statistics._metrics.reset()
+
 class AssetFactory:  # Ensure Assets are singletons (per asset name & type)
     _assets: dict[str: Asset] = {}
 
@@ -59,11 +193,19 @@ class AssetFactory:  # Ensure Assets are singletons (per asset name & type)
     
 class Stock(Asset):
 
-    def __init__(self, name: str) -> None:
-        super().__init__(name)
+    def __init__(self, name: str, tx_history: TransactionHistory = None, fx_rates: FXRateStore = None, statistics_cache: str = None) -> None:
+        super().__init__(name, tx_history, fx_rates, statistics_cache)
 
-    def split(self, date: date, ratio: float) -> None:
-        raise NotImplementedError
+    def split(self, date: date, ratio: float, time: time = time.min) -> None:
+        # ratio = shares after the split / shares before (e.g. 2 for a 2-for-1 split, 0.1 for a 1-for-10 reverse split)
+        # earlier transactions are kept as they are: the statistics rescale their quantities on the fly
+        # an invalid ratio (<= 0) is rejected by Split
+        self._tx_history.add_split(Split(
+            date= date,
+            ratio= ratio,
+            time= time,
+        ))
+        self._statistics_up_to_date = False
 
 class StockFactory(AssetFactory):
     _assets: dict[str: Asset] = {}
@@ -75,8 +217,8 @@ class StockFactory(AssetFactory):
 
 class RealEstate(Asset):
 
-    def __init__(self, name: str) -> None:
-        super().__init__(name)
+    def __init__(self, name: str, tx_history: TransactionHistory = None, fx_rates: FXRateStore = None, statistics_cache: str = None) -> None:
+        super().__init__(name, tx_history, fx_rates, statistics_cache)
 
 class RealEstateFactory(AssetFactory):
     _assets: dict[str: Asset] = {}
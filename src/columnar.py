@@ -0,0 +1,399 @@
+from __future__ import annotations
+from datetime import date, datetime, time
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+import numpy as np
+
+from .transactions import Transaction, Split, DuplicateError, HistoryDigest, validate_frame, is_dataframe, times_to_timedelta64, \
+    record_hashes, string_hashes, SALE, PURCHASE, SPLIT, ADD, REMOVE, TRANSACTION_VALUE_COLUMNS, TRANSACTION_CURRENCY_COLUMNS
+from .instrumentation import Metrics, instrumented
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .stats import StatsInputs
+
+TYPE_CODES = {PURCHASE: 0, SALE: 1, SPLIT: 2}
+TYPES = np.array([PURCHASE, SALE, SPLIT], dtype=object)
+INITIAL_CAPACITY = 1024
+COLUMNS = ["timestamp", "type", "quantity", "unit_price", "closing_costs", "exch_rate", "ratio", "tx_currency", "target_currency", "alive"]
+
+def _to_datetime64(date: date, time: time) -> np.datetime64:
+    return np.datetime64(datetime.combine(date, time), "ns")
+
+class ColumnarTransactionHistory:
+    # struct-of-arrays alternative to TransactionHistory (same public API):
+    # every record is one row of a set of typed numpy arrays, which grow by doubling their capacity
+    # Transaction / Split objects are only created when a caller asks for them (e.g. TransactionFinder)
+
+    def __init__(self) -> None:
+        self._size = 0  # number of rows used (including removed rows)
+        self._num_removed = 0
+        self._capacity = INITIAL_CAPACITY
+        self._timestamp = np.empty(INITIAL_CAPACITY, dtype="datetime64[ns]")  # date + time
+        self._type = np.empty(INITIAL_CAPACITY, dtype=np.int8)
+        self._quantity = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._unit_price = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._closing_costs = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._exch_rate = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._ratio = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._tx_currency = np.empty(INITIAL_CAPACITY, dtype=np.int16)
+        self._target_currency = np.empty(INITIAL_CAPACITY, dtype=np.int16)
+        self._alive = np.empty(INITIAL_CAPACITY, dtype=bool)
+
+        self._currencies: list[str] = []  # currency code -> currency
+        self._currency_codes: dict[str, int] = {}  # currency -> currency code
+        self._rows_by_hash: Optional[dict[int, list[int]]] = {}  # hash of a record -> rows holding that record (see _hash_index)
+        self._dirty_since: Optional[tuple[date, time]] = None  # earliest (date, time) changed since last clear_dirty()
+        self._metrics = Metrics()  # filled only while instrumentation is enabled
+        self._changes: Optional[list[tuple[str, Transaction | Split]]] = None  # [(ADD / REMOVE, record)], see track_changes()
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, np.ndarray], currencies: list[str]) -> ColumnarTransactionHistory:
+        # adopts the given arrays as column buffers without copying them (e.g. memory-mapped arrays)
+        history = cls()
+        history._size = history._capacity = len(columns["timestamp"])
+        history._num_removed = int(history._size - np.count_nonzero(columns["alive"]))
+        for name in COLUMNS:
+            setattr(history, f"_{name}", columns[name])
+        history._currencies = list(currencies)
+        history._currency_codes = {currency: code for code, currency in enumerate(history._currencies)}
+        history._rows_by_hash = None  # only built if the history gets modified
+        return history
+
+    def to_columns(self) -> tuple[dict[str, np.ndarray], list[str]]:
+        # compact copy of the column buffers (removed rows are left out), and the currency table
+        alive = self._alive[:self._size]
+        return {name: getattr(self, f"_{name}")[:self._size][alive] for name in COLUMNS}, list(self._currencies)
+
+    def __len__(self) -> int:
+        return self._size - self._num_removed
+
+    @instrumented("add_purchase")
+    def add_purchase(self, purchase: Transaction) -> None:
+        if purchase.type != PURCHASE:
+            raise ValueError(f"Transaction is not a purchase.\n{purchase}")
+
+        self._append_row(purchase)
+
+    @instrumented("remove_purchase")
+    def remove_purchase(self, purchase: Transaction) -> None:
+        self._remove_row(purchase)
+
+    @instrumented("add_sale")
+    def add_sale(self, sale: Transaction) -> None:
+        if sale.type != SALE:
+            raise ValueError(f"Transaction is not a sale.\n{sale}")
+
+        self._append_row(sale)
+
+    @instrumented("remove_sale")
+    def remove_sale(self, sale: Transaction) -> None:
+        self._remove_row(sale)
+
+    @instrumented("add_split")
+    def add_split(self, split: Split) -> None:
+        self._append_row(split)
+
+    @instrumented("remove_split")
+    def remove_split(self, split: Split) -> None:
+        self._remove_row(split)
+
+    @instrumented("add_many")
+    def add_many(self, records: Iterable[Transaction | Split] | pd.DataFrame | dict) -> None:
+        # bulk insertion: the batch is validated as a dataframe, and appended to the column buffers in one go
+        # the whole batch is validated before anything is inserted, so a failing batch leaves the history unchanged
+        import pandas as pd
+
+        if isinstance(records, dict):
+            records = pd.DataFrame(records)
+        elif not is_dataframe(records):
+            records = pd.DataFrame([obj.to_dict() for obj in records], columns=Transaction.columns() + ["ratio"])
+        transactions, splits = validate_frame(records)
+
+        if transactions.duplicated().any():
+            raise DuplicateError(f"Duplicate record.\n{transactions[transactions.duplicated()].head(1).to_dict('records')[0]}")
+        if splits.duplicated().any():
+            raise DuplicateError(f"Duplicate record.\n{splits[splits.duplicated()].head(1).to_dict('records')[0]}")
+
+        # field tuples hash exactly like the corresponding Transaction / Split (dataclass hash of all fields),
+        # so existing records are found through _rows_by_hash; objects are only built on a hash match
+        tx_fields = zip(*(transactions[column].tolist() for column in Transaction.columns()))
+        split_fields = zip(splits["date"].tolist(), splits["ratio"].tolist(), splits["type"].tolist(), splits["time"].tolist())
+        hashes = []
+        for cls, all_fields in [(Transaction, tx_fields), (Split, split_fields)]:
+            for fields in all_fields:
+                record_hash = hash(fields)
+                if record_hash in self._hash_index() and self._find_row(cls(*fields), record_hash) is not None:
+                    raise DuplicateError(f"Duplicate record.\n{cls(*fields)}")
+                hashes.append(record_hash)
+
+        num_new = len(hashes)
+        if num_new == 0:
+            return
+        while self._size + num_new > self._capacity:
+            self._grow()
+
+        rows = slice(self._size, self._size + num_new)
+        num_tx = len(transactions)
+        dates = pd.to_datetime(pd.concat([transactions["date"], splits["date"]])).to_numpy(dtype="datetime64[ns]")
+        times = times_to_timedelta64(transactions["time"].tolist() + splits["time"].tolist())
+        timestamps = dates + times
+        self._timestamp[rows] = timestamps
+        self._type[rows] = np.concatenate([
+            transactions["type"].map(TYPE_CODES).to_numpy(dtype=np.int8),
+            np.full(len(splits), TYPE_CODES[SPLIT], dtype=np.int8),
+        ])
+        self._alive[rows] = True
+        for name in TRANSACTION_VALUE_COLUMNS:
+            getattr(self, f"_{name}")[rows] = np.concatenate([transactions[name].to_numpy(dtype=float), np.zeros(len(splits))])
+        self._ratio[rows] = np.concatenate([np.zeros(num_tx), splits["ratio"].to_numpy(dtype=float)])
+        for name in TRANSACTION_CURRENCY_COLUMNS:
+            # only the distinct currencies of the batch go through the currency table
+            codes, currencies = pd.factorize(transactions[name])
+            table = np.array([self._currency_code(currency) for currency in currencies], dtype=np.int16)
+            getattr(self, f"_{name}")[rows] = np.concatenate([table[codes], np.zeros(len(splits), dtype=np.int16)])
+
+        for row, record_hash in enumerate(hashes, start=self._size):
+            self._hash_index().setdefault(record_hash, []).append(row)
+        self._size += num_new
+        if self._changes is not None:
+            self._changes.extend((ADD, self._to_object(row)) for row in range(rows.start, rows.stop))
+
+        first = timestamps.min().astype("datetime64[us]").item()
+        self._mark_key((first.date(), first.time()))
+
+    @instrumented("remove_all")
+    def remove_all(self, matches: Iterable[Transaction | Split]) -> None:
+        # every record is checked before anything is removed, so a failing removal leaves the history unchanged
+        matches = set(matches)
+        rows = []
+        for obj in matches:
+            row = self._find_row(obj, self._record_hash(obj))
+            if row is None:
+                raise KeyError(f"Record does not exist.\n{obj}")
+            rows.append(row)
+        if not rows:
+            return
+
+        self._alive[rows] = False
+        self._num_removed += len(rows)
+        for obj, row in zip(matches, rows):
+            rows_with_hash = self._hash_index()[self._record_hash(obj)]
+            rows_with_hash.remove(row)
+            if rows_with_hash == []:
+                del self._hash_index()[self._record_hash(obj)]
+        self._mark_dirty(min(matches, key=lambda obj: (obj.date, obj.time)))
+        if self._changes is not None:
+            self._changes.extend((REMOVE, obj) for obj in matches)
+
+    def between(self, start: date, end: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        # all records from start to end (both dates included)
+        days = self._timestamp[:self._size].astype("datetime64[D]")
+        mask = self._mask(tx_type) & (days >= np.datetime64(start, "D")) & (days <= np.datetime64(end, "D"))
+        return [self._to_object(row) for row in self._chronological_rows(mask)]
+
+    def count_between(self, start: date, end: date) -> int:
+        days = self._timestamp[:self._size].astype("datetime64[D]")
+        return int((self._alive[:self._size] & (days >= np.datetime64(start, "D")) & (days <= np.datetime64(end, "D"))).sum())
+
+    def get_index(self, field: str) -> None:
+        # no secondary indexes: TransactionFinder always uses between / iter_chronological
+        return None
+
+    def on(self, date: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        return self.between(date, date, tx_type)
+
+    def iter_chronological(self, tx_type: Optional[str] = None) -> Iterator[Transaction | Split]:
+        for row in self._chronological_rows(self._mask(tx_type)):
+            yield self._to_object(row)
+
+    def dirty_since(self) -> Optional[tuple[date, time]]:
+        return self._dirty_since
+
+    def clear_dirty(self) -> None:
+        self._dirty_since = None
+
+    def track_changes(self, enabled: bool = True) -> None:
+        # see TransactionHistory.track_changes
+        self._changes = [] if enabled else None
+
+    def pop_changes(self) -> list[tuple[str, Transaction | Split]]:
+        changes = self._changes or []
+        if self._changes is not None:
+            self._changes = []
+        return changes
+
+    @instrumented("get_data_for_statistics")
+    def get_data_for_statistics(self, since: Optional[tuple[date, time]] = None) -> StatsInputs:
+        # dataframes are built straight from the column buffers, without any per-row conversion
+        # the date column holds datetime64 values (at midnight) and the time column holds timedelta64 values
+        import pandas as pd
+
+        arrays = self.get_arrays_for_statistics(since)
+        for tx_type, columns in arrays.items():
+            columns["date"] = columns["date"].astype("datetime64[ns]")
+            arrays[tx_type] = pd.DataFrame(columns, columns=Split.columns() if tx_type == SPLIT else Transaction.columns())
+        return arrays
+
+    @instrumented("get_arrays_for_statistics")
+    def get_arrays_for_statistics(self, since: Optional[tuple[date, time]] = None) -> StatsInputs:
+        # {type: {column: numpy array}}, see TransactionHistory.get_arrays_for_statistics
+        timestamps = self._timestamp[:self._size]
+        mask = self._alive[:self._size].copy()
+        if since is not None:
+            mask &= timestamps >= _to_datetime64(*since)
+
+        currencies = np.array(self._currencies, dtype=object)
+        inputs = {}
+        for tx_type in [SALE, PURCHASE, SPLIT]:
+            rows = self._chronological_rows(mask & (self._type[:self._size] == TYPE_CODES[tx_type]))
+            dates = timestamps[rows].astype("datetime64[D]")
+            columns = {
+                "type": TYPES[np.full(len(rows), TYPE_CODES[tx_type])],
+                "date": dates,
+            }
+            if tx_type == SPLIT:
+                columns["ratio"] = self._ratio[rows]
+            else:
+                columns["quantity"] = self._quantity[rows]
+                columns["unit_price"] = self._unit_price[rows]
+                columns["closing_costs"] = self._closing_costs[rows]
+                columns["tx_currency"] = currencies[self._tx_currency[rows]]
+                columns["exch_rate"] = self._exch_rate[rows]
+                columns["target_currency"] = currencies[self._target_currency[rows]]
+            columns["time"] = timestamps[rows] - dates
+            inputs[tx_type] = columns
+
+        return inputs
+
+    def digest(self) -> HistoryDigest:
+        # content hash of the history (see HistoryDigest), straight from the column buffers
+        # the fields that don't apply to a record (e.g. the currencies of a split) are not set in the buffers, so they are masked
+        alive = self._alive[:self._size]
+        types = self._type[:self._size][alive]
+        is_split = types == TYPE_CODES[SPLIT]
+        currency_hashes = string_hashes(self._currencies + [""])  # the last one is for splits
+        columns = {"timestamp": self._timestamp[:self._size][alive], "type": string_hashes(TYPES)[types],
+                   "ratio": np.where(is_split, self._ratio[:self._size][alive], 0.0)}
+        for name in TRANSACTION_VALUE_COLUMNS:
+            columns[name] = np.where(is_split, 0.0, getattr(self, f"_{name}")[:self._size][alive])
+        for name in TRANSACTION_CURRENCY_COLUMNS:
+            columns[name] = currency_hashes[np.where(is_split, len(self._currencies), getattr(self, f"_{name}")[:self._size][alive])]
+        return HistoryDigest().add(record_hashes(columns))
+
+    def _mask(self, tx_type: Optional[str]) -> np.ndarray:
+        mask = self._alive[:self._size].copy()
+        if tx_type is not None:
+            mask &= self._type[:self._size] == TYPE_CODES[tx_type]
+        return mask
+
+    def _chronological_rows(self, mask: np.ndarray) -> np.ndarray:
+        # rows are stored in insertion order, so a stable sort by timestamp gives (date, time, insertion sequence)
+        rows = np.flatnonzero(mask)
+        return rows[np.argsort(self._timestamp[rows], kind="stable")]
+
+    def _currency_code(self, currency: str) -> int:
+        code = self._currency_codes.get(currency)
+        if code is None:
+            code = len(self._currencies)
+            self._currencies.append(currency)
+            self._currency_codes[currency] = code
+        return code
+
+    def _hash_index(self) -> dict[int, list[int]]:
+        # {hash of a record: rows holding that record}, rebuilt from the columns after from_columns()
+        if self._rows_by_hash is None:
+            self._rows_by_hash = {}
+            for row in np.flatnonzero(self._alive[:self._size]):
+                self._rows_by_hash.setdefault(self._record_hash(self._to_object(row)), []).append(int(row))
+        return self._rows_by_hash
+
+    def _record_hash(self, obj: Transaction | Split) -> int:
+        # records are hashable, and equal records (e.g. quantity 1 and 1.0) have equal hashes
+        return hash(obj)
+
+    def _find_row(self, obj: Transaction | Split, record_hash: int) -> Optional[int]:
+        for row in self._hash_index().get(record_hash, []):
+            if self._to_object(row) == obj:
+                return row
+        return None
+
+    def _append_row(self, obj: Transaction | Split) -> None:
+        record_hash = self._record_hash(obj)
+        if self._find_row(obj, record_hash) is not None:
+            raise DuplicateError(f"Duplicate record.\n{obj}")
+
+        if self._size == self._capacity:
+            self._grow()
+
+        row = self._size
+        self._timestamp[row] = _to_datetime64(obj.date, obj.time)
+        self._type[row] = TYPE_CODES[obj.type]
+        self._alive[row] = True
+        if obj.type == SPLIT:
+            self._ratio[row] = obj.ratio
+        else:
+            self._quantity[row] = obj.quantity
+            self._unit_price[row] = obj.unit_price
+            self._closing_costs[row] = obj.closing_costs
+            self._exch_rate[row] = obj.exch_rate
+            self._tx_currency[row] = self._currency_code(obj.tx_currency)
+            self._target_currency[row] = self._currency_code(obj.target_currency)
+        self._size += 1
+
+        self._hash_index().setdefault(record_hash, []).append(row)
+        self._mark_dirty(obj)
+        if self._changes is not None:
+            self._changes.append((ADD, obj))
+
+    def _remove_row(self, obj: Transaction | Split) -> None:
+        record_hash = self._record_hash(obj)
+        row = self._find_row(obj, record_hash)
+        if row is None:
+            raise KeyError(f"Record does not exist.\n{obj}")
+
+        self._alive[row] = False
+        self._num_removed += 1
+        rows = self._hash_index()[record_hash]
+        rows.remove(row)
+        if rows == []:
+            del self._hash_index()[record_hash]
+        self._mark_dirty(obj)
+        if self._changes is not None:
+            self._changes.append((REMOVE, obj))
+
+    def _grow(self) -> None:
+        self._capacity *= 2
+        self._capacity = max(self._capacity, INITIAL_CAPACITY)
+        for name in COLUMNS:
+            column = getattr(self, f"_{name}")
+            grown = np.empty(self._capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, f"_{name}", grown)
+
+    def _to_object(self, row: int) -> Transaction | Split:
+        timestamp = self._timestamp[row].astype("datetime64[us]").item()
+        tx_type = TYPES[self._type[row]]
+        if tx_type == SPLIT:
+            return Split(
+                date= timestamp.date(),
+                ratio= float(self._ratio[row]),
+                time= timestamp.time(),
+            )
+        return Transaction(
+            type= tx_type,
+            date= timestamp.date(),
+            quantity= float(self._quantity[row]),
+            unit_price= float(self._unit_price[row]),
+            closing_costs= float(self._closing_costs[row]),
+            tx_currency= self._currencies[self._tx_currency[row]],
+            exch_rate= float(self._exch_rate[row]),
+            target_currency= self._currencies[self._target_currency[row]],
+            time= timestamp.time(),
+        )
+
+    def _mark_dirty(self, obj: Transaction | Split) -> None:
+        self._mark_key((obj.date, obj.time))
+
+    def _mark_key(self, key: tuple[date, time]) -> None:
+        if self._dirty_since is None or key < self._dirty_since:
+            self._dirty_since = key
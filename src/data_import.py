@@ -1,4 +1,105 @@
+import asyncio
+import csv
+import glob
+import heapq
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, time
+from typing import Callable, Iterable, Iterator, Optional
+import pandas as pd
+
 from .asset import Asset
+from .transactions import SALE, PURCHASE, SPLIT
+
+# Equate statements (csv export): statement column -> record field
+EQUATE_COLUMNS = {
+    "Date": "date",
+    "Time": "time",
+    "Transaction Type": "type",
+    "Quantity": "quantity",
+    "Price": "unit_price",
+    "Fees": "closing_costs",
+    "Currency": "tx_currency",
+    "Exchange Rate": "exch_rate",
+    "Split Ratio": "ratio",
+}
+# Equate transaction types -> transaction types (other rows, e.g. dividends paid in cash, are skipped)
+EQUATE_TYPES = {
+    "Purchase": PURCHASE,
+    "Buy": PURCHASE,
+    "Dividend Reinvestment": PURCHASE,
+    "Sale": SALE,
+    "Sell": SALE,
+    "Split": SPLIT,
+}
+EQUATE_TARGET_CURRENCY = 'CAD'
+IMPORT_QUEUE_SIZE = 4  # parsed statements waiting for the writer, see AsyncDataImportFromEquate
+IMPORT_BATCH_SIZE = 50_000  # number of records inserted at once by the writer
+
+def parse_equate_statement(filepath: str) -> Iterator[dict]:
+    # streaming parser: yields one normalized record (dict with the columns of Transaction / Split) per relevant row
+    with open(filepath, newline="") as file:
+        yield from _parse_equate_lines(file)
+
+def parse_equate_text(text: str) -> list[dict]:
+    # same as parse_equate_statement, for the content of a statement already read
+    return list(_parse_equate_lines(text.splitlines()))
+
+def _parse_equate_lines(lines: Iterable[str]) -> Iterator[dict]:
+    for row in csv.DictReader(lines):
+        tx_type = EQUATE_TYPES.get(row.get("Transaction Type", "").strip())
+        if tx_type is None:
+            continue
+
+        fields = {field: (row.get(column) or "").strip() for column, field in EQUATE_COLUMNS.items()}
+        record = {
+            "type": tx_type,
+            "date": date.fromisoformat(fields["date"]),
+            "time": time.fromisoformat(fields["time"]) if fields["time"] else time.min,
+        }
+        if tx_type == SPLIT:
+            record["ratio"] = float(fields["ratio"])
+        else:
+            record["quantity"] = abs(float(fields["quantity"]))
+            record["unit_price"] = float(fields["unit_price"])
+            record["closing_costs"] = float(fields["closing_costs"] or 0)
+            record["tx_currency"] = fields["tx_currency"]
+            record["exch_rate"] = float(fields["exch_rate"]) if fields["exch_rate"] else None  # resolved by the asset
+            record["target_currency"] = EQUATE_TARGET_CURRENCY
+        yield record
+
+def _parse_sorted(filepath: str) -> list[dict]:
+    # runs in a worker process: returns the records of one statement, in chronological order
+    return sorted(parse_equate_statement(filepath), key=_chronological_key)
+
+def _chronological_key(record: dict) -> tuple[date, time]:
+    return (record["date"], record["time"])
+
+def _read_text(filepath: str) -> str:
+    with open(filepath, newline="") as file:
+        return file.read()
+
+def _expand_filepaths(filepaths: str | list[str]) -> list[str]:
+    # directories (e.g. drop folders) stand for the statements (*.csv) they contain
+    filepaths = [filepaths] if isinstance(filepaths, str) else list(filepaths)
+    expanded = []
+    for filepath in filepaths:
+        if os.path.isdir(filepath):
+            expanded += sorted(glob.glob(os.path.join(filepath, "*.csv")))
+        else:
+            expanded.append(filepath)
+    return expanded
+
+
+@dataclass
+class ImportProgress:
+    files_total: int
+    files_parsed: int = 0
+    records_parsed: int = 0
+    records_written: int = 0
+    batches_written: int = 0
+
 
 class DataImport:
 
@@ -8,12 +109,108 @@ class DataImport:
 
     def import_data(self):
         raise NotImplementedError
-    
+
 
 class DataImportFromEquate(DataImport):
+    # import_filepath can be a single statement or a list of statements
+    # statements are parsed in parallel (one per worker process), then merged chronologically and bulk-added to the asset
 
-    def __init__(self, asset: Asset, import_filepath) -> None:
+    def __init__(self, asset: Asset, import_filepath: str | list[str], max_workers: int = None) -> None:
         super().__init__(asset, import_filepath)
+        self._max_workers = max_workers
 
     def import_data(self):
-        raise NotImplementedError
\ No newline at end of file
+        filepaths = [self._import_filepath] if isinstance(self._import_filepath, str) else list(self._import_filepath)
+
+        if len(filepaths) <= 1 or self._max_workers == 1:
+            parsed = [_parse_sorted(filepath) for filepath in filepaths]
+        else:
+            with ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+                parsed = list(executor.map(_parse_sorted, filepaths))
+
+        records = list(heapq.merge(*parsed, key=_chronological_key))
+        if records == []:
+            return
+
+        # missing exchange rates are resolved in bulk from the FX rate store of the asset
+        self._asset._tx_history.add_many(self._asset._resolve_exch_rates(pd.DataFrame(records)))
+        self._asset._statistics_up_to_date = False
+
+
+class AsyncDataImportFromEquate(DataImport):
+    # asyncio import pipeline, for many statements (import_filepath: statements and / or directories of statements):
+    # - readers: up to max_readers statements are read (in threads) and parsed (in the executor) at the same time
+    # - a bounded queue of queue_size parsed statements: readers wait while it is full (backpressure), so at most
+    #   max_readers + queue_size statements are held in memory
+    # - a single writer: records are inserted into the transaction history in batches of about batch_size
+    # reading, parsing and insertion overlap: the executor keeps parsing while the writer inserts
+    # on_progress (if given) is called with the ImportProgress after each statement parsed and each batch written
+    # a failure (e.g. a duplicate record) or a cancellation stops the readers and the executor; the batches already
+    # written stay in the history (each batch is inserted atomically), like the chunks of CSVFileManager.load_history
+
+    def __init__(self, asset: Asset, import_filepath: str | list[str], max_readers: int = 4, processes: bool = False,
+                 max_workers: int = None, queue_size: int = IMPORT_QUEUE_SIZE, batch_size: int = IMPORT_BATCH_SIZE,
+                 on_progress: Optional[Callable[[ImportProgress], None]] = None) -> None:
+        super().__init__(asset, import_filepath)
+        self._max_readers = max_readers
+        self._processes = processes  # parse in worker processes (CPU-bound statements) rather than threads
+        self._max_workers = max_workers
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._on_progress = on_progress
+
+    def import_data(self) -> ImportProgress:
+        return asyncio.run(self.import_data_async())
+
+    async def import_data_async(self) -> ImportProgress:
+        filepaths = _expand_filepaths(self._import_filepath)
+        progress = ImportProgress(files_total=len(filepaths))
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        executor = (ProcessPoolExecutor if self._processes else ThreadPoolExecutor)(max_workers=self._max_workers)
+        readers = asyncio.Semaphore(self._max_readers)
+        tasks = [asyncio.ensure_future(self._read(filepath, queue, executor, readers)) for filepath in filepaths]
+
+        try:
+            batch = []
+            for _ in filepaths:
+                records = await queue.get()
+                if isinstance(records, Exception):
+                    raise records
+                progress.files_parsed += 1
+                progress.records_parsed += len(records)
+                self._report(progress)
+                batch += records
+                if len(batch) >= self._batch_size:
+                    self._write(batch, progress)
+                    batch = []
+            self._write(batch, progress)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            executor.shutdown(wait=False, cancel_futures=True)
+        return progress
+
+    async def _read(self, filepath: str, queue: asyncio.Queue, executor: Executor, readers: asyncio.Semaphore) -> None:
+        # the reader keeps its slot until the queue takes the parsed statement
+        async with readers:
+            try:
+                text = await asyncio.to_thread(_read_text, filepath)
+                records = await asyncio.get_running_loop().run_in_executor(executor, parse_equate_text, text)
+            except Exception as error:
+                records = error  # re-raised by the writer
+            await queue.put(records)
+
+    def _write(self, batch: list[dict], progress: ImportProgress) -> None:
+        if batch == []:
+            return
+        # missing exchange rates are resolved in bulk from the FX rate store of the asset
+        self._asset._tx_history.add_many(self._asset._resolve_exch_rates(pd.DataFrame(batch)))
+        self._asset._statistics_up_to_date = False
+        progress.records_written += len(batch)
+        progress.batches_written += 1
+        self._report(progress)
+
+    def _report(self, progress: ImportProgress) -> None:
+        if self._on_progress is not None:
+            self._on_progress(progress)
@@ -1,4 +1,18 @@
+import csv
+import glob
+import os
+from datetime import date, time
+import numpy as np
+import pandas as pd
+
 from .asset import Asset
+from .columnar import ColumnarTransactionHistory, COLUMNS
+from .transactions import Transaction, Split, SPLIT, ADD, REMOVE
+
+CSV_COLUMNS = ["type", "date", "time", "quantity", "unit_price", "closing_costs", "tx_currency", "exch_rate", "target_currency", "ratio"]
+CSV_CHUNK_SIZE = 100_000  # number of rows held in memory at once while loading / saving
+JOURNAL_COLUMNS = ["op"] + CSV_COLUMNS
+JOURNAL_COMPACT_THRESHOLD = 100_000  # number of journaled operations after which a save rewrites the snapshot
 
 class FileManager:
 
@@ -9,7 +23,7 @@ class FileManager:
 
     def set_input_filepath(self, filepath: str) -> None:
         self._input_filepath = filepath
-    
+
     def set_output_filepath(self, filepath: str) -> None:
         self._output_filepath = filepath
 
@@ -18,15 +32,232 @@ class FileManager:
 
     def save_history(self) -> None:
         raise NotImplementedError
-    
+
 
 class CSVFileManager(FileManager):
+    # one row per purchase / sale / split, with the columns CSV_COLUMNS (split rows only have type, date, time and ratio)
+    # files are read and written in chunks of chunk_size rows, so memory use doesn't grow with the file size
 
-    def __init__(self, asset: Asset) -> None:
-        super().__init__(asset)
+    def __init__(self, asset: Asset, input_filepath: str = None, output_filepath: str = None, chunk_size: int = CSV_CHUNK_SIZE) -> None:
+        super().__init__(asset, input_filepath, output_filepath)
+        self._chunk_size = chunk_size
 
     def load_history(self) -> None:
-        raise NotImplementedError
-    
+        # each chunk goes through the bulk insertion path of the transaction history
+        # if a chunk is invalid (e.g. duplicates), the chunks before it stay loaded
+        if self._input_filepath is None:
+            raise ValueError("Input filepath is not set.")
+
+        # round_trip: the default float parser may be 1 ulp off, and reloaded records must equal the saved ones
+        with pd.read_csv(self._input_filepath, chunksize=self._chunk_size, dtype={"type": str, "tx_currency": str, "target_currency": str},
+                         float_precision="round_trip") as reader:
+            for chunk in reader:
+                chunk["date"] = pd.to_datetime(chunk["date"], format="ISO8601").dt.date
+                chunk["time"] = [time.fromisoformat(t) for t in chunk["time"]]
+                self._asset._tx_history.add_many(chunk)
+                self._asset._statistics_up_to_date = False
+
+    def save_history(self) -> None:
+        # rows are written as the history is walked in chronological order, without building a dataframe
+        if self._output_filepath is None:
+            raise ValueError("Output filepath is not set.")
+
+        with open(self._output_filepath, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_COLUMNS)
+            rows = []
+            for obj in self._asset._tx_history.iter_chronological():
+                rows.append(self._to_row(obj))
+                if len(rows) == self._chunk_size:
+                    writer.writerows(rows)
+                    rows = []
+            writer.writerows(rows)
+
+    @staticmethod
+    def _to_row(obj: Transaction | Split) -> list:
+        if obj.type == SPLIT:
+            return [obj.type, obj.date.isoformat(), obj.time.isoformat(), "", "", "", "", "", "", obj.ratio]
+        return [obj.type, obj.date.isoformat(), obj.time.isoformat(), obj.quantity, obj.unit_price, obj.closing_costs,
+                obj.tx_currency, obj.exch_rate, obj.target_currency, ""]
+
+    @staticmethod
+    def _from_row(row: list[str]) -> Transaction | Split:
+        # inverse of _to_row, parsing floats exactly like load_history: journaled removals must match the snapshot records
+        tx_type, day, tx_time, quantity, unit_price, closing_costs, tx_currency, exch_rate, target_currency, ratio = row
+        if tx_type == SPLIT:
+            return Split(date= date.fromisoformat(day), ratio= float(ratio), time= time.fromisoformat(tx_time))
+        return Transaction(tx_type, date.fromisoformat(day), float(quantity), float(unit_price), float(closing_costs),
+                           tx_currency, float(exch_rate), target_currency, time.fromisoformat(tx_time))
+
+
+class JournalFileManager(FileManager):
+    # append-only persistence: the filepath is a directory holding a snapshot (snapshot-<generation>.csv, in the format
+    # of CSVFileManager) and a journal of the records added / removed since (journal-<generation>.csv, one row per
+    # operation, with the columns JOURNAL_COLUMNS)
+    # - save_history appends the changes since the last save to the journal, with a single fsync per save
+    # - once the journal holds compact_threshold operations, the next save writes a new snapshot and starts a new journal
+    # - load_history loads the snapshot and replays the journal (a torn last line, e.g. after a crash, is dropped)
+    # the history is tracked from the creation of the manager: the first save rewrites the snapshot unless the history was
+    # loaded (into an empty asset) from the same directory, so that no change made before is missed
+
+    def __init__(self, asset: Asset, input_filepath: str = None, output_filepath: str = None,
+                 compact_threshold: int = JOURNAL_COMPACT_THRESHOLD, fsync: bool = True, chunk_size: int = CSV_CHUNK_SIZE) -> None:
+        super().__init__(asset, input_filepath, output_filepath)
+        self._compact_threshold = compact_threshold
+        self._fsync = fsync  # False trades durability on power loss for speed (the OS still gets every save)
+        self._chunk_size = chunk_size
+        self._generation: int = None  # generation of the snapshot / journal in output_filepath that matches the history
+        self._journal_size = 0  # number of operations in the journal of that generation
+        asset._tx_history.track_changes()
+
+    def set_output_filepath(self, filepath: str) -> None:
+        super().set_output_filepath(filepath)
+        self._generation = None
+
+    def load_history(self) -> None:
+        if self._input_filepath is None:
+            raise ValueError("Input filepath is not set.")
+        generation = self._latest_generation(self._input_filepath)
+        if generation is None:
+            raise FileNotFoundError(f"No snapshot in {self._input_filepath}.")
+
+        tx_history = self._asset._tx_history
+        was_empty = len(tx_history) == 0
+        tx_history.track_changes(False)  # the replayed records are already persisted
+        try:
+            CSVFileManager(self._asset, input_filepath=self._snapshot_path(self._input_filepath, generation),
+                           chunk_size=self._chunk_size).load_history()
+            num_operations = self._replay(self._journal_path(self._input_filepath, generation))
+        finally:
+            tx_history.track_changes()
+        self._asset._statistics_up_to_date = False
+
+        if was_empty and self._output_filepath is not None and os.path.abspath(self._input_filepath) == os.path.abspath(self._output_filepath):
+            self._generation = generation
+            self._journal_size = num_operations
+
+    def save_history(self) -> None:
+        if self._output_filepath is None:
+            raise ValueError("Output filepath is not set.")
+
+        if self._generation is None or self._journal_size >= self._compact_threshold:
+            self.compact()
+            return
+
+        changes = self._asset._tx_history.pop_changes()
+        if changes == []:
+            return
+        with open(self._journal_path(self._output_filepath, self._generation), "a", newline="") as file:
+            csv.writer(file).writerows([op] + CSVFileManager._to_row(obj) for op, obj in changes)
+            file.flush()
+            if self._fsync:
+                os.fsync(file.fileno())
+        self._journal_size += len(changes)
+
+    def compact(self) -> None:
+        # writes the whole history as the snapshot of a new generation, then drops the previous snapshot and journal
+        # the new snapshot only becomes visible once complete (atomic rename), so a crash leaves either generation loadable
+        if self._output_filepath is None:
+            raise ValueError("Output filepath is not set.")
+
+        os.makedirs(self._output_filepath, exist_ok=True)
+        previous = self._latest_generation(self._output_filepath)
+        generation = 0 if previous is None else previous + 1
+        self._asset._tx_history.pop_changes()
+
+        snapshot_path = self._snapshot_path(self._output_filepath, generation)
+        CSVFileManager(self._asset, output_filepath=snapshot_path + ".tmp", chunk_size=self._chunk_size).save_history()
+        if self._fsync:
+            with open(snapshot_path + ".tmp", "rb") as file:
+                os.fsync(file.fileno())
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+        with open(self._journal_path(self._output_filepath, generation), "w", newline="") as file:
+            csv.writer(file).writerow(JOURNAL_COLUMNS)
+
+        if previous is not None:
+            for path in (self._snapshot_path(self._output_filepath, previous), self._journal_path(self._output_filepath, previous)):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._generation = generation
+        self._journal_size = 0
+
+    def _replay(self, journal_path: str) -> int:
+        # applies the journal in order, grouping consecutive additions / removals into bulk operations
+        # returns the number of operations replayed
+        if not os.path.exists(journal_path):
+            return 0
+        with open(journal_path, "rb+") as file:
+            content = file.read()
+            complete = content.rfind(b"\n") + 1
+            if complete < len(content):
+                file.truncate(complete)  # torn write: later appends must start on a new line
+        lines = content[:complete].decode().splitlines()
+
+        tx_history = self._asset._tx_history
+        apply = {ADD: tx_history.add_many, REMOVE: tx_history.remove_all}
+        batch_op, batch = None, []
+        num_operations = 0
+        for op, *row in csv.reader(lines[1:]):
+            if op != batch_op and batch != []:
+                apply[batch_op](batch)
+                batch = []
+            batch_op = op
+            batch.append(CSVFileManager._from_row(row))
+            num_operations += 1
+        if batch != []:
+            apply[batch_op](batch)
+        return num_operations
+
+    @staticmethod
+    def _latest_generation(directory: str) -> int | None:
+        generations = [int(os.path.basename(path)[len("snapshot-"):-len(".csv")]) for path in glob.glob(os.path.join(directory, "snapshot-*.csv"))]
+        return max(generations, default=None)
+
+    @staticmethod
+    def _snapshot_path(directory: str, generation: int) -> str:
+        return os.path.join(directory, f"snapshot-{generation}.csv")
+
+    @staticmethod
+    def _journal_path(directory: str, generation: int) -> str:
+        return os.path.join(directory, f"journal-{generation}.csv")
+
+
+class NumpyFileManager(FileManager):
+    # columnar binary format: the filepath is a directory holding one .npy file per column of ColumnarTransactionHistory,
+    # plus currencies.npy (the currency table)
+    # loading memory-maps the columns: if the asset stores its history in an empty ColumnarTransactionHistory,
+    # the mapped arrays become its column buffers (copy-on-write), so nothing is parsed nor copied
+
+    def __init__(self, asset: Asset, input_filepath: str = None, output_filepath: str = None) -> None:
+        super().__init__(asset, input_filepath, output_filepath)
+
+    def load_history(self) -> None:
+        if self._input_filepath is None:
+            raise ValueError("Input filepath is not set.")
+
+        columns = {name: np.load(os.path.join(self._input_filepath, f"{name}.npy"), mmap_mode="c") for name in COLUMNS}
+        currencies = np.load(os.path.join(self._input_filepath, "currencies.npy")).tolist()
+        loaded = ColumnarTransactionHistory.from_columns(columns, currencies)
+
+        tx_history = self._asset._tx_history
+        if isinstance(tx_history, ColumnarTransactionHistory) and len(tx_history) == 0:
+            self._asset._tx_history = loaded
+        else:
+            tx_history.add_many(loaded.iter_chronological())
+        self._asset._statistics_up_to_date = False
+
     def save_history(self) -> None:
-        raise NotImplementedError
\ No newline at end of file
+        if self._output_filepath is None:
+            raise ValueError("Output filepath is not set.")
+
+        tx_history = self._asset._tx_history
+        if not isinstance(tx_history, ColumnarTransactionHistory):
+            columnar_history = ColumnarTransactionHistory()
+            columnar_history.add_many(tx_history.iter_chronological())
+            tx_history = columnar_history
+        columns, currencies = tx_history.to_columns()
+
+        os.makedirs(self._output_filepath, exist_ok=True)
+        for name, column in columns.items():
+            np.save(os.path.join(self._output_filepath, f"{name}.npy"), column)
+        np.save(os.path.join(self._output_filepath, "currencies.npy"), np.array(currencies, dtype=str))
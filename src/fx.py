@@ -0,0 +1,148 @@
+from __future__ import annotations
+import csv
+from datetime import date
+from functools import lru_cache
+from typing import TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DEFAULT_TARGET_CURRENCY = 'CAD'
+FX_CACHE_SIZE = 4096  # number of (pair, day) lookups remembered by FXRateStore.rate
+BANK_OF_CANADA_PREFIX = "FX"  # Bank of Canada daily rates: one column per pair, e.g. FXUSDCAD
+
+class MissingRateError(ValueError):
+    pass
+
+
+class FXRateStore:
+    # local table of daily exchange rates: {(from_currency, to_currency): (sorted datetime64[D] dates, rates)}
+    # a rate applies from its date until the next one (as-of lookup), so weekends and holidays use the last business day
+    # pairs are also usable in the other direction (1 / rate), and a currency always converts to itself at 1
+
+    def __init__(self, target_currency: str = DEFAULT_TARGET_CURRENCY) -> None:
+        self._target_currency = target_currency  # currency that transactions are converted to by default
+        self._pairs: dict[tuple[str, str], tuple[np.ndarray, np.ndarray]] = {}
+        self._cached_rate = lru_cache(maxsize=FX_CACHE_SIZE)(self._rate)
+
+    @classmethod
+    def from_csv(cls, filepath: str, target_currency: str = DEFAULT_TARGET_CURRENCY) -> FXRateStore:
+        store = cls(target_currency)
+        store.load_csv(filepath)
+        return store
+
+    @classmethod
+    def from_parquet(cls, filepath: str, target_currency: str = DEFAULT_TARGET_CURRENCY) -> FXRateStore:
+        store = cls(target_currency)
+        store.load_parquet(filepath)
+        return store
+
+    def get_target_currency(self) -> str:
+        return self._target_currency
+
+    def pairs(self) -> list[tuple[str, str]]:
+        return list(self._pairs.keys())
+
+    def load_csv(self, filepath: str) -> None:
+        # either a Bank of Canada daily rates file (columns date, FXUSDCAD, FXEURCAD, ...; the notes preceding
+        # the header line are skipped), or one row per rate with the columns date, from_currency, to_currency, rate
+        with open(filepath, newline="") as file:
+            rows = csv.reader(file)
+            for header in rows:
+                if header and header[0].strip().lower() == "date":
+                    break
+            else:
+                raise ValueError(f"No header line starting with 'date' in {filepath}.")
+            columns = {name.strip(): [] for name in header}
+            for row in rows:
+                if len(row) != len(header):
+                    continue  # blank lines and trailing notes
+                for name, value in zip(columns, row):
+                    columns[name].append(value.strip())
+        self._add_columns(columns)
+
+    def load_parquet(self, filepath: str) -> None:
+        # same layouts as load_csv
+        import pandas as pd
+
+        frame = pd.read_parquet(filepath)
+        frame["date"] = pd.to_datetime(frame["date"]).dt.strftime("%Y-%m-%d")
+        self._add_columns({name: frame[name].astype(str).tolist() for name in frame.columns})
+
+    def add_rates(self, from_currency: str, to_currency: str, dates, rates) -> None:
+        # merges the given daily rates into the pair (a rate given for an existing date replaces it)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        rates = np.asarray(rates, dtype=float)
+        if len(dates) != len(rates):
+            raise ValueError("Dates and rates must have the same length.")
+        if (rates <= 0).any() or np.isnan(rates).any():
+            raise ValueError(f"Invalid rates for {from_currency}/{to_currency}.")
+
+        existing_dates, existing_rates = self._pairs.get((from_currency, to_currency), (np.empty(0, dtype="datetime64[D]"), np.empty(0)))
+        all_dates = np.concatenate([dates, existing_dates])
+        all_rates = np.concatenate([rates, existing_rates])
+        # np.unique keeps the first occurrence of each date, i.e. the new rate
+        unique_dates, first = np.unique(all_dates, return_index=True)
+        self._pairs[(from_currency, to_currency)] = (unique_dates, all_rates[first])
+        self._cached_rate.cache_clear()
+
+    def rate(self, from_currency: str, to_currency: str, day: date) -> float:
+        # single lookup (e.g. one purchase), cached per (pair, day)
+        return self._cached_rate(from_currency, to_currency, day)
+
+    def rates(self, from_currencies, to_currencies, dates) -> np.ndarray:
+        # vectorized as-of join: the rate of each (from_currency, to_currency, date), with one searchsorted per pair
+        from_currencies = np.asarray(from_currencies, dtype=object)
+        to_currencies = np.asarray(to_currencies, dtype=object)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        result = np.ones(len(dates))
+
+        pairs = from_currencies + "/" + to_currencies if len(dates) else np.empty(0, dtype=object)
+        for pair in np.unique(pairs):
+            mask = pairs == pair
+            from_currency, to_currency = pair.split("/")
+            if from_currency != to_currency:
+                result[mask] = self._as_of(from_currency, to_currency, dates[mask])
+        return result
+
+    def _rate(self, from_currency: str, to_currency: str, day: date) -> float:
+        if from_currency == to_currency:
+            return 1.0
+        return float(self._as_of(from_currency, to_currency, np.array([day], dtype="datetime64[D]"))[0])
+
+    def _as_of(self, from_currency: str, to_currency: str, dates: np.ndarray) -> np.ndarray:
+        if (from_currency, to_currency) in self._pairs:
+            pair_dates, pair_rates = self._pairs[(from_currency, to_currency)]
+            inverse = False
+        elif (to_currency, from_currency) in self._pairs:
+            pair_dates, pair_rates = self._pairs[(to_currency, from_currency)]
+            inverse = True
+        else:
+            raise MissingRateError(f"No exchange rates for {from_currency}/{to_currency}.")
+
+        positions = np.searchsorted(pair_dates, dates, side="right") - 1
+        if (positions < 0).any():
+            first = dates[np.argmax(positions < 0)]
+            raise MissingRateError(f"No exchange rate for {from_currency}/{to_currency} on or before {first}.")
+        rates = pair_rates[positions]
+        return 1 / rates if inverse else rates
+
+    def _add_columns(self, columns: dict[str, list[str]]) -> None:
+        dates = np.array(columns["date"], dtype="datetime64[D]")
+        if {"from_currency", "to_currency", "rate"} <= set(columns):
+            pairs = np.array(columns["from_currency"], dtype=object) + "/" + np.array(columns["to_currency"], dtype=object)
+            rates = np.array([float(rate) if rate else np.nan for rate in columns["rate"]])
+            for pair in np.unique(pairs):
+                mask = (pairs == pair) & ~np.isnan(rates)
+                self.add_rates(*pair.split("/"), dates[mask], rates[mask])
+            return
+
+        for name, values in columns.items():
+            # e.g. FXUSDCAD: 1 USD = rate CAD
+            if not (name.startswith(BANK_OF_CANADA_PREFIX) and len(name) == len(BANK_OF_CANADA_PREFIX) + 6):
+                continue
+            code = name[len(BANK_OF_CANADA_PREFIX):]
+            rates = np.array([float(value) if value else np.nan for value in values])
+            present = ~np.isnan(rates)
+            self.add_rates(code[:3], code[3:], dates[present], rates[present])
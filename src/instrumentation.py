@@ -0,0 +1,143 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time as timer
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator
+
+METRICS_ENV_VAR = "CAPITAL_GAINS_METRICS"  # set to 1 to record metrics from the start
+PROFILE_ENV_VAR = "CAPITAL_GAINS_PROFILE"  # "cprofile[:output.prof]" or "tracemalloc[:output.txt]", see profiling()
+TRACEMALLOC_TOP = 25  # number of allocation sites reported by tracemalloc profiling
+CPROFILE_TOP = 25  # number of functions printed by cprofile profiling (without a filepath)
+
+_enabled = os.environ.get(METRICS_ENV_VAR, "") not in ("", "0")
+_NULL_CONTEXT = nullcontext()
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class Metrics:
+    # call counts, wall time (seconds) and allocated bytes, per instrumented operation
+    # allocations are only measured while tracemalloc is tracing (e.g. CAPITAL_GAINS_PROFILE=tracemalloc)
+
+    def __init__(self) -> None:
+        self._operations: dict[str, dict[str, float]] = {}
+
+    def record(self, name: str, wall_time: float, allocated_bytes: int = 0) -> None:
+        operation = self._operations.get(name)
+        if operation is None:
+            operation = self._operations[name] = {"calls": 0, "wall_time": 0.0, "allocated_bytes": 0}
+        operation["calls"] += 1
+        operation["wall_time"] += wall_time
+        operation["allocated_bytes"] += allocated_bytes
+
+    @contextmanager
+    def _measure(self, name: str) -> Iterator[None]:
+        tracing = tracemalloc.is_tracing()
+        allocated_before = tracemalloc.get_traced_memory()[0] if tracing else 0
+        start = timer.perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = timer.perf_counter() - start
+            allocated_bytes = max(tracemalloc.get_traced_memory()[0] - allocated_before, 0) if tracing else 0
+            self.record(name, wall_time, allocated_bytes)
+
+    def measure(self, name: str):
+        # context manager timing a block (e.g. a phase of a computation), a shared no-op when metrics are disabled
+        if not _enabled:
+            return _NULL_CONTEXT
+        return self._measure(name)
+
+    def merge(self, other: "Metrics") -> "Metrics":
+        merged = Metrics()
+        for metrics in (self, other):
+            for name, operation in metrics._operations.items():
+                target = merged._operations.setdefault(name, {"calls": 0, "wall_time": 0.0, "allocated_bytes": 0})
+                for key, value in operation.items():
+                    target[key] += value
+        return merged
+
+    def reset(self) -> None:
+        self._operations = {}
+
+    def to_dict(self) -> dict[str, dict[str, float]]:
+        return {name: dict(operation) for name, operation in self._operations.items()}
+
+    def dump(self, filepath: str) -> None:
+        with open(filepath, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+def instrumented(name: str) -> Callable:
+    # method decorator: records the call in self._metrics when metrics are enabled
+    # when they are disabled, the only overhead is one global lookup and one branch per call
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not _enabled:
+                return method(self, *args, **kwargs)
+            with self._metrics._measure(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiling() -> Iterator[None]:
+    # wraps a run in cProfile or tracemalloc, depending on CAPITAL_GAINS_PROFILE (does nothing if it isn't set):
+    # - cprofile[:filepath]: dumps the profile to filepath (pstats format), or prints the top functions (by cumulative time)
+    #   to stderr, so that the report doesn't mix with the output of the program
+    # - tracemalloc[:filepath]: also enables metrics (with allocations), and writes the top allocation sites
+    setting = os.environ.get(PROFILE_ENV_VAR, "")
+    mode, _, filepath = setting.partition(":")
+    mode = mode.strip().lower()
+
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if filepath:
+                profiler.dump_stats(filepath)
+            else:
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(CPROFILE_TOP)
+
+    elif mode == "tracemalloc":
+        was_enabled = _enabled
+        enable()
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            if not was_enabled:
+                disable()
+            report = "\n".join(str(stat) for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP])
+            if filepath:
+                with open(filepath, "w") as file:
+                    file.write(report + "\n")
+            else:
+                print(report, file=sys.stderr)
+
+    elif mode == "":
+        yield
+
+    else:
+        raise ValueError(f"Invalid {PROFILE_ENV_VAR}: {setting} (expected cprofile or tracemalloc)")
@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .asset import Asset, AssetFactory
+from .stats import Statistics, StatsInputs, fingerprint
+
+def _compute_statistics(inputs: StatsInputs) -> Statistics:
+    # runs in a worker process
+    statistics = Statistics()
+    statistics.recalculate_statistics(inputs)
+    return statistics
+
+
+class Portfolio:
+    # group of assets whose statistics are computed together, e.g. every asset registered in the factories
+
+    def __init__(self, assets: list[Asset]) -> None:
+        self._assets = assets
+
+    @classmethod
+    def from_factories(cls, *factories: type[AssetFactory]) -> "Portfolio":
+        return cls([asset for factory in factories for asset in factory._assets.values()])
+
+    def stale_assets(self) -> list[Asset]:
+        return [asset for asset in self._assets
+                if asset._statistics_up_to_date == False or asset._tx_history.dirty_since() is not None
+                or asset._statistics.is_empty()]
+
+    def refresh_statistics(self, max_workers: int = None) -> int:
+        # refreshes the statistics of every stale asset, and returns how many were refreshed (up to date assets are skipped)
+        # - an asset that already has statistics is updated incrementally by Asset.statistics(), from the resume point of
+        #   its earliest change: a few events are replayed in this process, instead of the whole history in a worker
+        # - otherwise, the statistics are loaded from the asset's cache as in Asset.statistics(), or recomputed in parallel
+        #   (one asset per task): each task is submitted as soon as its inputs are extracted, so that the extraction of
+        #   the next asset overlaps with the computations already running
+        stale_assets = self.stale_assets()
+        pending = []
+        for asset in stale_assets:
+            if not asset._statistics.is_empty() and asset._tx_history.dirty_since() is not None:
+                asset.statistics()
+                continue
+            cache = asset.get_statistics_cache() if asset._statistics.is_empty() else None
+            key = fingerprint(asset._tx_history.digest()) if cache is not None else None
+            if key is not None and asset._statistics.load_cache(cache, key):
+                self._mark_up_to_date(asset)
+            else:
+                pending.append((asset, key))
+
+        num_workers = max_workers or os.cpu_count() or 1  # the default of ProcessPoolExecutor
+        if len(pending) <= 1 or num_workers == 1:
+            results = [_compute_statistics(asset._tx_history.get_arrays_for_statistics()) for asset, _ in pending]
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(_compute_statistics, asset._tx_history.get_arrays_for_statistics()) for asset, _ in pending]
+                results = [future.result() for future in futures]
+
+        for (asset, key), statistics in zip(pending, results):
+            # the asset keeps its Statistics object, so that the metrics it recorded so far are not lost
+            asset._statistics.adopt(statistics)
+            if key is not None:
+                asset._statistics.save_cache(asset.get_statistics_cache(), key)
+            self._mark_up_to_date(asset)
+        return len(stale_assets)
+
+    @staticmethod
+    def _mark_up_to_date(asset: Asset) -> None:
+        asset._tx_history.clear_dirty()
+        asset._statistics_up_to_date = True
+
+    def capital_gains_by_year(self, max_workers: int = None) -> dict[int, float]:
+        # {year: total capital gains of the portfolio}
+        self.refresh_statistics(max_workers)
+
+        totals = {}
+        for asset in self._assets:
+            for year, total in asset._statistics.capital_gains_by_year().items():
+                totals[year] = totals.get(year, 0.0) + total
+        return dict(sorted(totals.items()))
@@ -0,0 +1,354 @@
+from __future__ import annotations
+import sqlite3
+from datetime import date, time
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+import numpy as np
+
+from .transactions import Transaction, Split, DuplicateError, HistoryDigest, validate_frame, is_dataframe, transactions_from_frame, \
+    record_hashes, SALE, PURCHASE, SPLIT, ADD, REMOVE, TRANSACTION_VALUE_COLUMNS, EPOCH_ORDINAL
+from .instrumentation import Metrics, instrumented
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .stats import StatsInputs
+
+SQLITE_CHUNK_SIZE = 50_000  # number of rows fetched at once while streaming records out of the database
+# record fields -> columns; splits store '' / 0 in the transaction columns and transactions store 0 in ratio,
+# so that every column is NOT NULL and the unique index can reject duplicates
+RECORD_COLUMNS = ["type", "date", "time", "quantity", "unit_price", "closing_costs", "tx_currency", "exch_rate", "target_currency", "ratio"]
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS records (
+        id INTEGER PRIMARY KEY,  -- insertion sequence, orders records with the same date and time
+        type TEXT NOT NULL,
+        date INTEGER NOT NULL,  -- date.toordinal()
+        time INTEGER NOT NULL,  -- microseconds since midnight
+        quantity REAL NOT NULL,
+        unit_price REAL NOT NULL,
+        closing_costs REAL NOT NULL,
+        tx_currency TEXT NOT NULL,
+        exch_rate REAL NOT NULL,
+        target_currency TEXT NOT NULL,
+        ratio REAL NOT NULL
+    )""",
+    # the duplicate check starts with (date, time), so it is also the chronological index
+    f"CREATE UNIQUE INDEX IF NOT EXISTS records_unique ON records (date, time, {', '.join(column for column in RECORD_COLUMNS if column not in ('date', 'time'))})",
+    "CREATE INDEX IF NOT EXISTS records_type ON records (type, date, time)",
+    "CREATE INDEX IF NOT EXISTS records_tx_currency ON records (tx_currency)",
+    # HistoryDigest of the records, see digest(): deleted by every change, in the same SQL transaction
+    "CREATE TABLE IF NOT EXISTS digest (count INTEGER NOT NULL, total TEXT NOT NULL)",
+]
+SELECT_RECORDS = f"SELECT {', '.join(RECORD_COLUMNS)} FROM records"
+CHRONOLOGICAL_ORDER = "ORDER BY date, time, id"
+
+def _time_to_int(t: time) -> int:
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond
+
+def _int_to_time(microseconds: int) -> time:
+    seconds, microsecond = divmod(microseconds, 1_000_000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return time(hour, minute, second, microsecond)
+
+def _to_row(obj: Transaction | Split) -> tuple:
+    # values of RECORD_COLUMNS
+    if obj.type == SPLIT:
+        return (SPLIT, obj.date.toordinal(), _time_to_int(obj.time), 0.0, 0.0, 0.0, "", 0.0, "", obj.ratio)
+    return (obj.type, obj.date.toordinal(), _time_to_int(obj.time), obj.quantity, obj.unit_price, obj.closing_costs,
+            obj.tx_currency, obj.exch_rate, obj.target_currency, 0.0)
+
+def _to_object(row: tuple) -> Transaction | Split:
+    tx_type, day, tx_time, quantity, unit_price, closing_costs, tx_currency, exch_rate, target_currency, ratio = row
+    if tx_type == SPLIT:
+        return Split(date= date.fromordinal(day), ratio= ratio, time= _int_to_time(tx_time))
+    return Transaction(
+        type= tx_type,
+        date= date.fromordinal(day),
+        quantity= quantity,
+        unit_price= unit_price,
+        closing_costs= closing_costs,
+        tx_currency= tx_currency,
+        exch_rate= exch_rate,
+        target_currency= target_currency,
+        time= _int_to_time(tx_time),
+    )
+
+class SQLiteTransactionHistory:
+    # out-of-core alternative to TransactionHistory (same public API): records live in a SQLite database
+    # (a file, or ":memory:"), with indexes on (date, time), type and currency
+    # TransactionFinder hands its criteria to select(), so searches run as SQL WHERE clauses,
+    # and the statistics inputs are streamed out of the database in chronological chunks (see iter_chunks_for_statistics)
+    # opening an existing database keeps its records, which are then all dirty (the statistics start empty)
+
+    def __init__(self, filepath: str = ":memory:", chunk_size: int = SQLITE_CHUNK_SIZE) -> None:
+        self._filepath = filepath
+        self._chunk_size = chunk_size
+        self._connection = sqlite3.connect(filepath)
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+        self._size = self._connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]  # kept up to date, COUNT(*) is a scan
+        self._dirty_since: Optional[tuple[date, time]] = None  # earliest (date, time) changed since last clear_dirty()
+        self._metrics = Metrics()  # filled only while instrumentation is enabled
+        self._changes: Optional[list[tuple[str, Transaction | Split]]] = None  # [(ADD / REMOVE, record)], see track_changes()
+        if self._size > 0:
+            first = self._connection.execute(f"SELECT date, time FROM records {CHRONOLOGICAL_ORDER} LIMIT 1").fetchone()
+            self._dirty_since = (date.fromordinal(first[0]), _int_to_time(first[1]))
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @instrumented("add_purchase")
+    def add_purchase(self, purchase: Transaction) -> None:
+        if purchase.type != PURCHASE:
+            raise ValueError(f"Transaction is not a purchase.\n{purchase}")
+
+        self._insert([purchase])
+
+    @instrumented("remove_purchase")
+    def remove_purchase(self, purchase: Transaction) -> None:
+        self._delete([purchase])
+
+    @instrumented("add_sale")
+    def add_sale(self, sale: Transaction) -> None:
+        if sale.type != SALE:
+            raise ValueError(f"Transaction is not a sale.\n{sale}")
+
+        self._insert([sale])
+
+    @instrumented("remove_sale")
+    def remove_sale(self, sale: Transaction) -> None:
+        self._delete([sale])
+
+    @instrumented("add_split")
+    def add_split(self, split: Split) -> None:
+        self._insert([split])
+
+    @instrumented("remove_split")
+    def remove_split(self, split: Split) -> None:
+        self._delete([split])
+
+    @instrumented("add_many")
+    def add_many(self, records: Iterable[Transaction | Split] | pd.DataFrame | dict) -> None:
+        # bulk insertion in one SQL transaction: a failing batch (e.g. a duplicate) is rolled back as a whole
+        if isinstance(records, dict):
+            import pandas as pd
+            records = pd.DataFrame(records)
+        if is_dataframe(records):
+            transactions, splits = validate_frame(records)
+            objs = transactions_from_frame(transactions) \
+                + [Split(date= d, ratio= r, time= t) for d, r, t in zip(splits["date"].tolist(), splits["ratio"].tolist(), splits["time"].tolist())]
+        else:
+            objs = list(records)
+            for obj in objs:
+                if obj.type not in (SALE, PURCHASE, SPLIT):
+                    raise ValueError(f"Invalid transaction type.\n{obj}")
+        self._insert(objs)
+
+    @instrumented("remove_all")
+    def remove_all(self, matches: Iterable[Transaction | Split]) -> None:
+        # every record is checked before anything is removed, so a failing removal leaves the history unchanged
+        self._delete(list(set(matches)))
+
+    def select(self, tx_type: str, start: Optional[date], end: Optional[date], predicates: list[tuple[str, tuple]]) -> list[Transaction | Split]:
+        # records of the given type, from start to end (both included, None = unbounded), that satisfy every predicate
+        # (field, (low, high, low_strict, high_strict)) of TransactionFinder, in chronological order
+        conditions, parameters = ["type = ?"], [tx_type]
+        if start is not None:
+            conditions.append("date BETWEEN ? AND ?")
+            parameters += [start.toordinal(), end.toordinal()]
+        for field, (low, high, low_strict, high_strict) in predicates:
+            if field not in RECORD_COLUMNS:
+                raise ValueError(f"Invalid search field: {field}")
+            if field == "time":
+                low, high = (None if t is None else _time_to_int(t) for t in (low, high))
+            if low is not None and low == high and not (low_strict or high_strict):
+                conditions.append(f"{field} = ?")
+                parameters.append(low)
+                continue
+            if low is not None:
+                conditions.append(f"{field} {'>' if low_strict else '>='} ?")
+                parameters.append(low)
+            if high is not None:
+                conditions.append(f"{field} {'<' if high_strict else '<='} ?")
+                parameters.append(high)
+        query = f"{SELECT_RECORDS} WHERE {' AND '.join(conditions)} {CHRONOLOGICAL_ORDER}"
+        return [_to_object(row) for row in self._connection.execute(query, parameters)]
+
+    def between(self, start: date, end: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        # all records from start to end (both dates included)
+        return self.select(tx_type, start, end, []) if tx_type is not None else \
+            [_to_object(row) for row in self._connection.execute(
+                f"{SELECT_RECORDS} WHERE date BETWEEN ? AND ? {CHRONOLOGICAL_ORDER}", (start.toordinal(), end.toordinal()))]
+
+    def count_between(self, start: date, end: date) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM records WHERE date BETWEEN ? AND ?", (start.toordinal(), end.toordinal())).fetchone()[0]
+
+    def get_index(self, field: str) -> None:
+        # no in-memory secondary indexes: TransactionFinder pushes its criteria down to select()
+        return None
+
+    def on(self, date: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        return self.between(date, date, tx_type)
+
+    def iter_chronological(self, tx_type: Optional[str] = None) -> Iterator[Transaction | Split]:
+        if tx_type is None:
+            cursor = self._connection.execute(f"{SELECT_RECORDS} {CHRONOLOGICAL_ORDER}")
+        else:
+            cursor = self._connection.execute(f"{SELECT_RECORDS} WHERE type = ? {CHRONOLOGICAL_ORDER}", (tx_type,))
+        for rows in iter(lambda: cursor.fetchmany(self._chunk_size), []):
+            for row in rows:
+                yield _to_object(row)
+
+    def dirty_since(self) -> Optional[tuple[date, time]]:
+        return self._dirty_since
+
+    def clear_dirty(self) -> None:
+        self._dirty_since = None
+
+    def track_changes(self, enabled: bool = True) -> None:
+        # see TransactionHistory.track_changes
+        self._changes = [] if enabled else None
+
+    def pop_changes(self) -> list[tuple[str, Transaction | Split]]:
+        changes = self._changes or []
+        if self._changes is not None:
+            self._changes = []
+        return changes
+
+    def digest(self) -> HistoryDigest:
+        # content hash of the history (see HistoryDigest), stored in the database until the next change,
+        # so that reopening an unchanged database doesn't read the records
+        # otherwise it is computed in one scan of the table, straight from the rows
+        # (splits and transactions store '' / 0 in the fields that don't apply, as HistoryDigest expects)
+        stored = self._connection.execute("SELECT count, total FROM digest").fetchone()
+        if stored is not None:
+            return HistoryDigest(stored[0], int(stored[1]))
+
+        digest = HistoryDigest()
+        cursor = self._connection.execute(SELECT_RECORDS)
+        for rows in iter(lambda: cursor.fetchmany(self._chunk_size), []):
+            values = dict(zip(RECORD_COLUMNS, zip(*rows)))
+            columns = {
+                "date": (np.array(values["date"], dtype=np.int64) - EPOCH_ORDINAL).astype("datetime64[D]"),
+                "time": np.array(values["time"], dtype=np.int64).astype("timedelta64[us]"),
+            }
+            for name in ("type", "tx_currency", "target_currency"):
+                columns[name] = np.array(values[name], dtype=object)
+            for name in TRANSACTION_VALUE_COLUMNS + ["ratio"]:
+                columns[name] = np.array(values[name], dtype=float)
+            digest = digest.add(record_hashes(columns))
+        with self._connection:
+            self._connection.execute("INSERT INTO digest VALUES (?, ?)", (digest.count, str(digest.total)))
+        return digest
+
+    @instrumented("get_data_for_statistics")
+    def get_data_for_statistics(self, since: Optional[tuple[date, time]] = None) -> StatsInputs:
+        # same format as ColumnarTransactionHistory.get_data_for_statistics
+        import pandas as pd
+
+        arrays = self.get_arrays_for_statistics(since)
+        for tx_type, columns in arrays.items():
+            columns["date"] = columns["date"].astype("datetime64[ns]")
+            arrays[tx_type] = pd.DataFrame(columns, columns=Split.columns() if tx_type == SPLIT else Transaction.columns())
+        return arrays
+
+    @instrumented("get_arrays_for_statistics")
+    def get_arrays_for_statistics(self, since: Optional[tuple[date, time]] = None) -> StatsInputs:
+        # {type: {column: numpy array}}, see TransactionHistory.get_arrays_for_statistics
+        chunks = {SALE: [], PURCHASE: [], SPLIT: []}
+        for chunk in self.iter_chunks_for_statistics(since):
+            for tx_type, columns in chunk.items():
+                chunks[tx_type].append(columns)
+
+        inputs = {}
+        for tx_type, columns in chunks.items():
+            if columns == []:
+                columns = [self._to_arrays(tx_type, [])]
+            inputs[tx_type] = {name: np.concatenate([chunk[name] for chunk in columns]) for name in columns[0]}
+        return inputs
+
+    def iter_chunks_for_statistics(self, since: Optional[tuple[date, time]] = None) -> Iterator[StatsInputs]:
+        # the records from since on, in chronological order, as a sequence of {type: {column: numpy array}} chunks
+        # of at most chunk_size rows each (every chunk has the three types); rows go straight from the cursor
+        # to numpy arrays, without Transaction / Split objects
+        condition, parameters = "", []
+        if since is not None:
+            condition = "WHERE date > ? OR (date = ? AND time >= ?)"
+            parameters = [since[0].toordinal(), since[0].toordinal(), _time_to_int(since[1])]
+        cursor = self._connection.execute(f"{SELECT_RECORDS} {condition} {CHRONOLOGICAL_ORDER}", parameters)
+        for rows in iter(lambda: cursor.fetchmany(self._chunk_size), []):
+            by_type = {SALE: [], PURCHASE: [], SPLIT: []}
+            for row in rows:
+                by_type[row[0]].append(row)
+            yield {tx_type: self._to_arrays(tx_type, type_rows) for tx_type, type_rows in by_type.items()}
+
+    @staticmethod
+    def _to_arrays(tx_type: str, rows: list[tuple]) -> dict[str, np.ndarray]:
+        values = dict(zip(RECORD_COLUMNS, zip(*rows))) if rows else {column: () for column in RECORD_COLUMNS}
+        columns = {
+            "type": np.full(len(rows), tx_type, dtype=object),
+            "date": (np.array(values["date"], dtype=np.int64) - EPOCH_ORDINAL).astype("datetime64[D]"),
+        }
+        if tx_type == SPLIT:
+            columns["ratio"] = np.array(values["ratio"], dtype=float)
+        else:
+            for name in TRANSACTION_VALUE_COLUMNS:
+                columns[name] = np.array(values[name], dtype=float)
+            columns["tx_currency"] = np.array(values["tx_currency"], dtype=object)
+            columns["target_currency"] = np.array(values["target_currency"], dtype=object)
+        columns["time"] = np.array(values["time"], dtype=np.int64).astype("timedelta64[us]").astype("timedelta64[ns]")
+        return {name: columns[name] for name in (Split.columns() if tx_type == SPLIT else Transaction.columns())}
+
+    def _insert(self, objs: list[Transaction | Split]) -> None:
+        if objs == []:
+            return
+        try:
+            with self._connection:
+                self._connection.execute("DELETE FROM digest")
+                self._connection.executemany(
+                    f"INSERT INTO records ({', '.join(RECORD_COLUMNS)}) VALUES ({', '.join('?' * len(RECORD_COLUMNS))})",
+                    [_to_row(obj) for obj in objs],
+                )
+        except sqlite3.IntegrityError as error:
+            # the unique index (a duplicate) or a NOT NULL constraint (e.g. a NaN field, stored as NULL)
+            duplicate = self._first_duplicate(objs)
+            if duplicate is None:
+                raise ValueError(f"Invalid record: {error}") from error
+            raise DuplicateError(f"Duplicate record.\n{duplicate}") from None
+
+        self._size += len(objs)
+        self._mark_dirty(min(objs, key=lambda obj: (obj.date, obj.time)))
+        if self._changes is not None:
+            self._changes.extend((ADD, obj) for obj in objs)
+
+    def _delete(self, objs: list[Transaction | Split]) -> None:
+        if objs == []:
+            return
+        conditions = " AND ".join(f"{column} = ?" for column in RECORD_COLUMNS)
+        with self._connection:
+            self._connection.execute("DELETE FROM digest")
+            for obj in objs:
+                if self._connection.execute(f"DELETE FROM records WHERE {conditions}", _to_row(obj)).rowcount == 0:
+                    raise KeyError(f"Record does not exist.\n{obj}")
+
+        self._size -= len(objs)
+        self._mark_dirty(min(objs, key=lambda obj: (obj.date, obj.time)))
+        if self._changes is not None:
+            self._changes.extend((REMOVE, obj) for obj in objs)
+
+    def _first_duplicate(self, objs: list[Transaction | Split]) -> Optional[Transaction | Split]:
+        # only called after a failed insertion: the first record already stored, or repeated in the batch (None if there is none)
+        conditions = " AND ".join(f"{column} = ?" for column in RECORD_COLUMNS)
+        seen = set()
+        for obj in objs:
+            if obj in seen or self._connection.execute(f"SELECT 1 FROM records WHERE {conditions}", _to_row(obj)).fetchone():
+                return obj
+            seen.add(obj)
+
+    def _mark_dirty(self, obj: Transaction | Split) -> None:
+        key = (obj.date, obj.time)
+        if self._dirty_since is None or key < self._dirty_since:
+            self._dirty_since = key
@@ -1,32 +1,471 @@
-from datetime import date
+from __future__ import annotations
+import hashlib
+import os
+import zipfile
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
 from dataclasses import dataclass
-import pandas as pd
+from typing import Optional, TYPE_CHECKING
+import numpy as np
+
+from .instrumentation import Metrics, instrumented
+from .transactions import Transaction, HistoryDigest, is_dataframe, times_to_timedelta64, SALE, PURCHASE, SPLIT
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SCAN_BLOCK_SIZE = 16  # number of events solved together by _linear_recurrence
+SCAN_CHUNK_SIZE = 4096  # number of blocks materialized at once by _linear_recurrence
+HOLDINGS_TOLERANCE = 1e-9  # holdings smaller than this (in absolute value) are considered to be zero
+SUPERFICIAL_LOSS_DAYS = 30  # a loss is superficial if identical property is acquired within 30 days before or after the sale
+STATS_ENGINE_VERSION = 1  # part of every fingerprint: bump it whenever the results of the engine change, to invalidate persisted caches
 
 @dataclass
 class StatsInputs:
-    events: dict[str, pd.DataFrame]
+    # {type: {column: numpy array}} (see TransactionHistory.get_arrays_for_statistics), or {type: dataframe}
+    events: dict[str, dict[str, np.ndarray] | pd.DataFrame]
+
+@dataclass(frozen=True)
+class YearlyCapitalGains:
+    # realized gains of one year: rows start:end of the (sorted) capital gains table, and their sums
+    start: int
+    end: int
+    capital_gain: float
+    proceeds: float
+    outlays: float
+    ACB: float
+    superficial_loss: float
+
+class UncoveredSaleError(ValueError):
+    pass
+
+def _as_arrays(events: dict[str, np.ndarray] | pd.DataFrame) -> dict[str, np.ndarray]:
+    # events of one type as {column: numpy array}, with datetime64[D] dates and timedelta64[ns] times
+    if not is_dataframe(events):
+        return events
+    import pandas as pd
+
+    arrays = {column: events[column].to_numpy() for column in events.columns}
+    arrays["date"] = pd.to_datetime(events["date"]).to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    if pd.api.types.is_timedelta64_dtype(events["time"]):
+        arrays["time"] = events["time"].to_numpy(dtype="timedelta64[ns]")
+    else:
+        arrays["time"] = times_to_timedelta64(events["time"].tolist())
+    return arrays
+
+def _to_frame(columns: dict[str, np.ndarray]) -> pd.DataFrame:
+    # dataframe view of a table of the engine, with datetime.date dates and datetime.time times
+    import pandas as pd
+
+    frame = dict(columns)
+    frame["date"] = columns["date"].astype(object)
+    frame["time"] = [(datetime.min + timedelta(microseconds=microseconds)).time()
+                     for microseconds in columns["time"].astype("timedelta64[us]").astype(np.int64).tolist()]
+    return pd.DataFrame(frame)
+
+def fingerprint(digest: HistoryDigest) -> str:
+    # cache key of a history (the digest() of its storage engine) for the current engine version, see Statistics.save_cache
+    return hashlib.blake2b(f"{STATS_ENGINE_VERSION}/{digest.count}/{digest.total}".encode(), digest_size=16).hexdigest()
+
+def _to_storable(values: np.ndarray) -> np.ndarray:
+    # object columns (types, currencies) are stored as strings, so that caches load without pickle (None -> "")
+    if values.dtype != object:
+        return values
+    return np.array(["" if value is None else value for value in values.tolist()], dtype=str)
+
+def _from_storable(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind != "U":
+        return values
+    return np.array([value or None for value in values.tolist()], dtype=object)
+
+def _linear_recurrence(m: np.ndarray, b: np.ndarray, x0: float = 0.0) -> np.ndarray:
+    # solves x[i] = m[i] * x[i-1] + b[i] (with x[-1] = x0 and 0 <= m[i] <= 1) without a python loop per element
+    # events are solved in blocks of SCAN_BLOCK_SIZE: inside a block, the weight of b[j] on x[i] is prod(m[j+1..i]),
+    # computed in log space (always <= 1, so it can never overflow), and the blocks are then chained recursively
+    n = len(m)
+    if n == 0:
+        return np.empty(0)
+
+    block = SCAN_BLOCK_SIZE
+    num_blocks = -(-n // block)
+    padding = num_blocks * block - n
+    m = np.concatenate([m, np.ones(padding)]).reshape(num_blocks, block)
+    b = np.concatenate([b, np.zeros(padding)]).reshape(num_blocks, block)
+
+    # a multiplier of 0 resets the recurrence: nothing before it has any influence on what comes after
+    reset = m == 0
+    log_m = np.log(np.where(reset, 1.0, m))
+    cum_log_m = np.cumsum(log_m, axis=1)
+    positions = np.arange(block)
+    last_reset = np.maximum.accumulate(np.where(reset, positions, -1), axis=1)
+
+    # contribution of x0 (or of the previous block) to each position of the block
+    carry = np.where(last_reset == -1, np.exp(cum_log_m), 0.0)
+
+    local = np.empty((num_blocks, block))
+    for start in range(0, num_blocks, SCAN_CHUNK_SIZE):
+        chunk = slice(start, start + SCAN_CHUNK_SIZE)
+        exponent = cum_log_m[chunk, :, None] - cum_log_m[chunk, None, :]  # [block, i, j]
+        valid = (positions[None, None, :] <= positions[None, :, None]) \
+                & (positions[None, None, :] >= last_reset[chunk, :, None])
+        weights = np.exp(np.where(valid, exponent, -np.inf))
+        local[chunk] = np.einsum("kij,kj->ki", weights, b[chunk])
+
+    # value of x at the end of each block, given the value at the end of the previous block
+    if num_blocks == 1:
+        block_ends = carry[:, -1] * x0 + local[:, -1]
+    else:
+        block_ends = _linear_recurrence(carry[:, -1], local[:, -1], x0)
+    block_starts = np.concatenate([[x0], block_ends[:-1]])
+
+    x = local + carry * block_starts[:, None]
+    return x.reshape(-1)[:n]
+
+def _split_factors(timestamps: np.ndarray, is_split: np.ndarray, ratios: np.ndarray) -> np.ndarray:
+    # cumulative split factor of each event: product of the ratios of the splits strictly after it
+    # (a split applies before the transactions of the same timestamp)
+    split_timestamps = timestamps[is_split]
+    factors_after = np.append(np.cumprod(ratios[is_split][::-1])[::-1], 1.0)  # factors_after[k] = prod(ratios[k:])
+    return factors_after[np.searchsorted(split_timestamps, timestamps, side="right")]
+
+def _split_column(splits: dict[str, np.ndarray], column: str, dtype: np.dtype) -> np.ndarray:
+    # column of the events table for the split rows (transaction fields are missing)
+    if column in splits:
+        return splits[column].astype(dtype)
+    if dtype == object:
+        return np.full(len(splits["type"]), None, dtype=object)
+    return np.full(len(splits["type"]), np.nan)
+
+def _superficial_loss_fractions(timestamps: np.ndarray, is_sale: np.ndarray, is_purchase: np.ndarray, quantity: np.ndarray,
+                                holdings: np.ndarray, prior_purchases: Optional[tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    # fraction of the loss of each sale that would be denied if the sale is a loss, 0 for other events:
+    # min(shares sold, shares acquired in the 61-day window around the sale, shares held at the end of the window) / shares sold
+    # events are sorted, so every window is found by binary search on cumulative sums (O(n log n) overall)
+    days = timestamps.astype("datetime64[D]")
+    window = np.timedelta64(SUPERFICIAL_LOSS_DAYS, "D")
+    purchase_days = days[is_purchase]
+    purchase_quantities = quantity[is_purchase]
+    if prior_purchases is not None:
+        purchase_days = np.concatenate([prior_purchases[0], purchase_days])
+        purchase_quantities = np.concatenate([prior_purchases[1], purchase_quantities])
+    acquired_before = np.concatenate([[0.0], np.cumsum(purchase_quantities)])
+
+    sale_days = days[is_sale]
+    start = np.searchsorted(purchase_days, sale_days - window, side="left")
+    end = np.searchsorted(purchase_days, sale_days + window, side="right")
+    acquired = acquired_before[end] - acquired_before[start]
+    held = holdings[np.searchsorted(days, sale_days + window, side="right") - 1]
+
+    fractions = np.zeros(len(days))
+    sold = quantity[is_sale]
+    fractions[is_sale] = np.minimum(np.minimum(sold, acquired), held) / np.where(sold > 0, sold, 1.0)
+    return fractions
 
 class Statistics:
+    # the engine works on numpy arrays only: dataframes are built (and pandas is imported) on the first call
+    # of a method returning one, e.g. full_history()
 
     def __init__(self) -> None:
-        self._history = None
+        self._history = None  # {column: numpy array}, one row per purchase / sale, in chronological order
         self._ACB = None  # adjusted cost base
-        self._capital_gains = None
-    
+        self._capital_gains = None  # {column: numpy array}, one row per sale, in chronological order
+        self._timestamps = None  # sorted datetime64 keys of the rows of _history
+        self._capital_gains_timestamps = None  # sorted datetime64 keys of the rows of _capital_gains
+        # state at the close of each day with at least one event, see _materialize()
+        self._end_of_day_dates = None  # sorted datetime64[D]
+        self._end_of_day_ACB = None
+        self._end_of_day_holdings = None
+        self._capital_gains_by_year = None  # {year: YearlyCapitalGains}, see _materialize()
+        self._history_frame = None  # dataframe views, built on demand
+        self._capital_gains_frame = None
+        self._metrics = Metrics()  # filled only while instrumentation is enabled, phases: sort, scan, aggregate, materialize
+
+    @instrumented("recalculate_statistics")
     def recalculate_statistics(self, inputs: StatsInputs) -> None:
-        raise NotImplementedError
-    
+        history, timestamps, capital_gains, capital_gains_timestamps = self._compute(inputs, 0.0, 0.0)
+
+        self._history = history
+        self._timestamps = timestamps
+        self._ACB = history["ACB"]
+        self._capital_gains = capital_gains
+        self._capital_gains_timestamps = capital_gains_timestamps
+        self._materialize()
+
+    @instrumented("update_statistics")
+    def update_statistics(self, inputs: StatsInputs, since: Optional[tuple[date, time]]) -> None:
+        # inputs only contain the events at or after (date, time) = since (see resume_point)
+        # every row before that point is kept, and the computation resumes from the holdings and ACB of the last kept row
+        if since is None or self._history is None:
+            self.recalculate_statistics(inputs)
+            return
+
+        since_timestamp = np.datetime64(datetime.combine(*since), "ns")
+        checkpoint = np.searchsorted(self._timestamps, since_timestamp, side="left")
+        if checkpoint == 0:
+            self.recalculate_statistics(inputs)
+            return
+
+        holdings = self._history["holdings"][checkpoint - 1]
+        ACB = self._history["ACB"][checkpoint - 1]
+        # purchases of the kept rows that are still within the superficial loss window of the recomputed sales
+        window_start = self._timestamps[checkpoint - 1].astype("datetime64[D]") - np.timedelta64(SUPERFICIAL_LOSS_DAYS, "D")
+        first = np.searchsorted(self._timestamps, window_start, side="left")
+        kept = slice(first, checkpoint)
+        is_purchase = self._history["type"][kept] == PURCHASE
+        is_split = self._history["type"][kept] == SPLIT
+        # in shares as of the checkpoint: rescaled by the kept splits following each purchase
+        split_factor = _split_factors(self._timestamps[kept], is_split, self._history["ratio"][kept])
+        prior_purchases = (self._timestamps[kept][is_purchase].astype("datetime64[D]"),
+                           (self._history["quantity"][kept].astype(float) * split_factor)[is_purchase])
+        history, timestamps, capital_gains, capital_gains_timestamps = self._compute(inputs, holdings, ACB, prior_purchases)
+
+        gains_checkpoint = np.searchsorted(self._capital_gains_timestamps, since_timestamp, side="left")
+        self._history = self._concat(self._history, checkpoint, history)
+        self._timestamps = np.concatenate([self._timestamps[:checkpoint], timestamps])
+        self._ACB = self._history["ACB"]
+        self._capital_gains = self._concat(self._capital_gains, gains_checkpoint, capital_gains)
+        self._capital_gains_timestamps = np.concatenate([self._capital_gains_timestamps[:gains_checkpoint], capital_gains_timestamps])
+        self._materialize()
+
+    def is_empty(self) -> bool:
+        # True until the statistics are computed (or loaded from a cache)
+        return self._history is None
+
+    def adopt(self, other: "Statistics") -> None:
+        # takes the statistics computed by another instance (e.g. in a worker process), adding its metrics to the ones of this one
+        metrics = self._metrics.merge(other._metrics)
+        self.__dict__.update(other.__dict__)
+        self._metrics = metrics
+
+    def save_cache(self, filepath: str, key: str) -> None:
+        # persists the computed tables (.npz, written atomically), keyed by key (see fingerprint)
+        arrays = {"key": np.array(key), "history_columns": np.array(list(self._history)), "timestamps": self._timestamps,
+                  "capital_gains_columns": np.array(list(self._capital_gains)), "capital_gains_timestamps": self._capital_gains_timestamps}
+        arrays.update({f"history/{column}": _to_storable(values) for column, values in self._history.items()})
+        arrays.update({f"capital_gains/{column}": _to_storable(values) for column, values in self._capital_gains.items()})
+        with open(filepath + ".tmp", "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(filepath + ".tmp", filepath)
+
+    def load_cache(self, filepath: str, key: str) -> bool:
+        # replaces the statistics with the cached ones if the cache was saved with the same key, returns whether it was
+        # the per-day and per-year views are rebuilt from the cached tables (no ACB computation)
+        try:
+            with np.load(filepath, allow_pickle=False) as cache:
+                if str(cache["key"]) != key:
+                    return False
+                history = {column: _from_storable(cache[f"history/{column}"]) for column in cache["history_columns"].tolist()}
+                capital_gains = {column: _from_storable(cache[f"capital_gains/{column}"]) for column in cache["capital_gains_columns"].tolist()}
+                timestamps = cache["timestamps"]
+                capital_gains_timestamps = cache["capital_gains_timestamps"]
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return False  # missing, or unreadable (e.g. written by another version)
+
+        self._history = history
+        self._timestamps = timestamps
+        self._ACB = history["ACB"]
+        self._capital_gains = capital_gains
+        self._capital_gains_timestamps = capital_gains_timestamps
+        self._materialize()
+        return True
+
+    @staticmethod
+    def resume_point(changed_since: tuple[date, time]) -> tuple[date, time]:
+        # earliest (date, time) to recompute after a change at changed_since: the superficial loss test of a sale
+        # depends on the events up to SUPERFICIAL_LOSS_DAYS after it, so earlier sales may be affected by the change
+        changed_date, _ = changed_since
+        return (changed_date - timedelta(days=SUPERFICIAL_LOSS_DAYS), time.min)
+
+    @instrumented("materialize")
+    def _materialize(self) -> None:
+        # compact (date, ACB, holdings) series at the close of each day, so that lookups never rescan the history
+        days = self._timestamps.astype("datetime64[D]")
+        last_of_day = np.ones(len(days), dtype=bool)
+        last_of_day[:-1] = days[1:] != days[:-1]
+        self._end_of_day_dates = days[last_of_day]
+        self._end_of_day_ACB = self._ACB[last_of_day]
+        self._end_of_day_holdings = self._history["holdings"][last_of_day]
+
+        # partition of the capital gains table by year (gains are sorted, so each year is one contiguous range)
+        years = self._capital_gains_timestamps.astype("datetime64[Y]").astype(int) + 1970
+        starts = np.flatnonzero(np.concatenate([[True], years[1:] != years[:-1]])) if len(years) else np.empty(0, dtype=int)
+        ends = np.append(starts[1:], len(years))
+        sums = {column: np.add.reduceat(self._capital_gains[column], starts) if len(starts) else []
+                for column in ("capital_gain", "proceeds", "outlays", "ACB", "superficial_loss")}
+        self._capital_gains_by_year = {
+            int(years[start]): YearlyCapitalGains(
+                start= int(start),
+                end= int(end),
+                capital_gain= float(sums["capital_gain"][i]),
+                proceeds= float(sums["proceeds"][i]),
+                outlays= float(sums["outlays"][i]),
+                ACB= float(sums["ACB"][i]),
+                superficial_loss= float(sums["superficial_loss"][i]),
+            )
+            for i, (start, end) in enumerate(zip(starts, ends))
+        }
+
+        self._history_frame = None
+        self._capital_gains_frame = None
+
+    def _compute(self, inputs: StatsInputs, initial_holdings: float, initial_ACB: float,
+                 prior_purchases: tuple[np.ndarray, np.ndarray] = None):
+        # initial_holdings and prior_purchases (days, quantities of the purchases preceding the inputs within the
+        # superficial loss window) are expressed in shares as of the first event of the inputs
+        purchases = _as_arrays(inputs.get(PURCHASE))
+        sales = _as_arrays(inputs.get(SALE))
+        splits = _as_arrays(inputs.get(SPLIT)) if inputs.get(SPLIT) is not None else None
+
+        # merge all events, and sort them once by (date, time)
+        # at equal timestamps, splits come first, then purchases, then sales (so that a same-time sale is covered by the purchase)
+        with self._metrics.measure("sort"):
+            events = {column: np.concatenate([purchases[column], sales[column]]) for column in Transaction.columns()}
+            events["ratio"] = np.full(len(events["type"]), np.nan)
+            if splits is not None and len(splits["type"]) > 0:
+                events = {column: np.concatenate([values, _split_column(splits, column, values.dtype)]) for column, values in events.items()}
+            timestamps = events["date"].astype("datetime64[ns]") + events["time"].astype("timedelta64[ns]")
+            is_sale = events["type"] == SALE
+            is_split = events["type"] == SPLIT
+            order = np.lexsort((np.where(is_split, 0, np.where(is_sale, 2, 1)), timestamps))
+            events = {column: values[order] for column, values in events.items()}
+            timestamps = timestamps[order]
+            is_sale = is_sale[order]
+            is_split = is_split[order]
+            is_purchase = ~is_sale & ~is_split
+
+        with self._metrics.measure("scan"):
+            # quantities are never rewritten: they are rescaled on the fly into shares as of after the last split,
+            # with the cumulative factor of the splits following each event (holdings are reported in shares of their time)
+            split_factor = _split_factors(timestamps, is_split, events["ratio"])
+            quantity = np.where(is_split, 0.0, events["quantity"].astype(float))
+            adjusted_quantity = quantity * split_factor
+            unit_price = events["unit_price"].astype(float)
+            closing_costs = events["closing_costs"].astype(float)
+            exch_rate = events["exch_rate"].astype(float)
+            initial_factor = float(np.prod(events["ratio"][is_split]))  # shares as of the first event -> adjusted shares
+
+            # running holdings (in adjusted shares)
+            initial_holdings = initial_holdings * initial_factor
+            holdings = initial_holdings + np.cumsum(np.where(is_sale, -adjusted_quantity, adjusted_quantity))
+            holdings[np.abs(holdings) < HOLDINGS_TOLERANCE] = 0.0
+            if (holdings < 0).any():
+                first = np.argmax(holdings < 0)
+                event = {column: values[first:first + 1].tolist()[0] for column, values in events.items()}
+                raise UncoveredSaleError(f"Sale exceeds holdings.\n{event}")
+            holdings_before = np.concatenate([[initial_holdings], holdings[:-1]])
+
+            cost = np.where(is_purchase, (quantity * unit_price + closing_costs) * exch_rate, 0.0)
+            proceeds = np.where(is_sale, quantity * unit_price * exch_rate, 0.0)
+            outlays = np.where(is_sale, closing_costs * exch_rate, 0.0)
+            net_proceeds = proceeds - outlays
+            safe_holdings_before = np.where(holdings_before > 0, holdings_before, 1.0)
+
+            with self._metrics.measure("superficial_losses"):
+                if prior_purchases is not None:
+                    prior_purchases = (prior_purchases[0], prior_purchases[1] * initial_factor)
+                denial_fraction = _superficial_loss_fractions(timestamps, is_sale, is_purchase, adjusted_quantity, holdings, prior_purchases)
+
+            # total ACB: ACB[i] = multiplier[i] * ACB[i-1] + increment[i]
+            # - purchase: the cost is added
+            # - sale: the ACB of the shares sold is removed; if the sale is a superficial loss, the denied part of
+            #   the loss (fraction * (ACB sold - net proceeds)) is added back, i.e. carried to the remaining / replacement shares
+            # whether a sale is a loss depends on the ACB, which superficial losses can only increase: the sales found to
+            # be superficial losses are added to the scan until the set is stable (usually after one or two scans)
+            superficial = np.zeros(len(is_sale), dtype=bool)
+            while True:
+                fraction = np.where(superficial, denial_fraction, 0.0)
+                multiplier = np.where(is_sale, (holdings + fraction * adjusted_quantity) / safe_holdings_before, 1.0)
+                increment = np.where(is_sale, -fraction * net_proceeds, cost)
+                ACB = _linear_recurrence(multiplier, increment, initial_ACB)
+                ACB_before = np.concatenate([[initial_ACB], ACB[:-1]])
+                ACB_sold = np.where(is_sale, ACB_before * adjusted_quantity / safe_holdings_before, 0.0)
+
+                losses = is_sale & (denial_fraction > 0) & (ACB_sold > net_proceeds)
+                if not (losses & ~superficial).any():
+                    break
+                superficial |= losses
+
+            holdings = holdings / split_factor  # back to shares of the time of each event
+            ACB_per_share = np.where(holdings > 0, ACB / np.where(holdings > 0, holdings, 1.0), 0.0)
+
+        with self._metrics.measure("aggregate"):
+            # capital gains of each sale (the denied part of a superficial loss isn't deductible)
+            superficial_loss = np.where(superficial, denial_fraction * (ACB_sold - net_proceeds), 0.0)
+            capital_gain = net_proceeds - ACB_sold + superficial_loss
+
+            events["holdings"] = holdings
+            events["ACB_per_share"] = ACB_per_share
+            events["ACB"] = ACB
+            events["capital_gain"] = np.where(is_sale, capital_gain, np.nan)
+            events["quantity"] = np.where(is_split, np.nan, quantity)
+
+            capital_gains = {
+                "date": events["date"][is_sale],
+                "time": events["time"][is_sale],
+                "quantity": quantity[is_sale],
+                "proceeds": proceeds[is_sale],
+                "outlays": outlays[is_sale],
+                "ACB": ACB_sold[is_sale],
+                "superficial_loss": superficial_loss[is_sale],
+                "capital_gain": capital_gain[is_sale],
+            }
+        return events, timestamps, capital_gains, timestamps[is_sale]
+
+    @staticmethod
+    def _concat(table: dict[str, np.ndarray], checkpoint: int, new_rows: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        # rows of table before checkpoint, followed by new_rows
+        return {column: np.concatenate([values[:checkpoint], new_rows[column]]) for column, values in table.items()}
+
     def history_for(self, year: date.year) -> pd.DataFrame:
-        raise NotImplementedError
-    
+        start, end = self._year_bounds(self._timestamps, year)
+        return self.full_history().iloc[start:end]
+
     def full_history(self) -> pd.DataFrame:
-        raise NotImplementedError
-    
+        if self._history_frame is None:
+            self._history_frame = _to_frame(self._history)
+        return self._history_frame
+
     def list_capital_gains_for(self, year: date.year) -> pd.DataFrame:
-        raise NotImplementedError
-    
+        if self._capital_gains_frame is None:
+            self._capital_gains_frame = _to_frame(self._capital_gains)
+        partition = self._capital_gains_by_year.get(year)
+        if partition is None:
+            return self._capital_gains_frame.iloc[0:0]
+        return self._capital_gains_frame.iloc[partition.start:partition.end]
+
     def total_capital_gains_for(self, year: date.year) -> float:
-        raise NotImplementedError
-    
+        partition = self._capital_gains_by_year.get(year)
+        return partition.capital_gain if partition is not None else 0.0
+
+    def yearly_capital_gains_for(self, year: date.year) -> Optional[YearlyCapitalGains]:
+        # pre-summed capital gains, proceeds, outlays and ACB of the sales of a year (None if there are none)
+        return self._capital_gains_by_year.get(year)
+
+    def capital_gains_by_year(self) -> dict[int, float]:
+        # {year: total capital gains}, for every year with at least one sale
+        return {year: partition.capital_gain for year, partition in self._capital_gains_by_year.items()}
+
     def ACB_at_end_of_day(self, date: date) -> float:
-        raise NotImplementedError
\ No newline at end of file
+        position = bisect_right(self._end_of_day_dates, np.datetime64(date, "D"))
+        if position == 0:
+            return 0.0
+        return float(self._end_of_day_ACB[position - 1])
+
+    def ACB_at_end_of_day_many(self, dates) -> np.ndarray:
+        # vectorized version of ACB_at_end_of_day: dates can be a list of dates or a datetime64 array
+        positions = np.searchsorted(self._end_of_day_dates, np.asarray(dates, dtype="datetime64[D]"), side="right")
+        ACB = self._end_of_day_ACB[np.maximum(positions - 1, 0)] if len(self._end_of_day_ACB) else np.zeros(len(positions))
+        return np.where(positions == 0, 0.0, ACB)
+
+    def holdings_at_end_of_day(self, date: date) -> float:
+        position = bisect_right(self._end_of_day_dates, np.datetime64(date, "D"))
+        if position == 0:
+            return 0.0
+        return float(self._end_of_day_holdings[position - 1])
+
+    @staticmethod
+    def _year_bounds(timestamps: np.ndarray, year: date.year) -> tuple[int, int]:
+        # timestamps are sorted, so all events of a year form one contiguous range
+        start = np.searchsorted(timestamps, np.datetime64(f"{year:04d}-01-01"), side="left")
+        end = np.searchsorted(timestamps, np.datetime64(f"{year + 1:04d}-01-01"), side="left")
+        return start, end
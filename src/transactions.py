@@ -1,14 +1,31 @@
 from __future__ import annotations
-from datetime import date, time
+import gc
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, time, timedelta
 from dataclasses import dataclass, field
-from typing import Optional
-import pandas as pd
+import hashlib
+from itertools import groupby, islice
+from operator import attrgetter, lt
+import sys
+from sys import intern
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+import numpy as np
 
-from .stats import StatsInputs
+from .instrumentation import Metrics, instrumented
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .stats import StatsInputs
 
 SALE = 'Sale'
 PURCHASE = 'Purchase'
 SPLIT = 'Split'
+TX_TYPES = {SALE: SALE, PURCHASE: PURCHASE}  # maps equal strings to the shared constants
+ADD = 'add'  # operations of the change log, see TransactionHistory.track_changes()
+REMOVE = 'remove'
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
 
 def flatten_dict_to_list(d):
     # takes a nested dict and flattens its leaf values into a list
@@ -23,7 +40,97 @@ def flatten_dict_to_list(d):
 class DuplicateError(ValueError):
     pass
 
-@dataclass
+# pandas is only imported by the methods that take or return dataframes, so the core starts without it
+def is_dataframe(obj) -> bool:
+    # a dataframe can only exist if pandas has already been imported
+    pandas = sys.modules.get("pandas")
+    return pandas is not None and isinstance(obj, pandas.DataFrame)
+
+def dates_to_datetime64(dates: list[date]) -> np.ndarray:
+    # through the ordinals: tens of times faster than converting each date object to datetime64
+    ordinals = np.fromiter(map(date.toordinal, dates), dtype=np.int64, count=len(dates))
+    return (ordinals - EPOCH_ORDINAL).astype("datetime64[D]")
+
+def times_to_timedelta64(times: list[time]) -> np.ndarray:
+    # much faster than parsing the string representation of each time
+    microseconds = [((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond for t in times]
+    return np.array(microseconds, dtype=np.int64).astype("timedelta64[us]").astype("timedelta64[ns]")
+
+TRANSACTION_VALUE_COLUMNS = ["quantity", "unit_price", "closing_costs", "exch_rate"]
+TRANSACTION_CURRENCY_COLUMNS = ["tx_currency", "target_currency"]
+
+def validate_frame(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # vectorized validation of a batch of records (one row per record, with the columns of Transaction / Split)
+    # returns (transactions, splits), with the columns of Transaction.columns() and Split.columns()
+    # dates are returned as datetime.date and times as datetime.time (missing times default to time.min)
+    import pandas as pd
+
+    missing = {"type", "date"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing columns: {sorted(missing)}")
+
+    invalid_types = ~df["type"].isin([SALE, PURCHASE, SPLIT])
+    if invalid_types.any():
+        raise ValueError(f"Invalid transaction type.\n{df[invalid_types].head(1).to_dict('records')[0]}")
+
+    df = df.copy()
+    if df["date"].isna().any():
+        raise ValueError("Missing dates.")
+    if pd.api.types.is_datetime64_any_dtype(df["date"]):
+        df["date"] = df["date"].dt.date
+    else:
+        dates = df["date"].tolist()
+        if not all(type(value) is date for value in dates):
+            # e.g. ISO strings or timestamps: records must hold datetime.date objects (numbers would be read as epoch offsets,
+            # and ambiguous formats such as 01/02/2024 are rejected)
+            invalid = next((value for value in dates if not isinstance(value, (date, str, np.datetime64))), None)
+            if invalid is not None:
+                raise ValueError(f"Invalid date: {invalid!r}")
+            try:
+                df["date"] = pd.to_datetime(df["date"], errors="raise", format="ISO8601").dt.date
+            except (TypeError, ValueError) as error:
+                raise ValueError(f"Invalid dates: {error}") from None
+    if "time" not in df.columns:
+        df["time"] = time.min
+    else:
+        times = df["time"].where(df["time"].notna(), time.min).tolist()
+        if not all(type(value) is time for value in times):
+            # e.g. ISO strings: records must hold datetime.time objects
+            try:
+                times = [value if isinstance(value, time) else time.fromisoformat(value) for value in times]
+            except (TypeError, ValueError) as error:
+                raise ValueError(f"Invalid times: {error}") from None
+        df["time"] = times
+
+    is_split = (df["type"] == SPLIT).to_numpy()
+    transactions = df.loc[~is_split]
+    splits = df.loc[is_split]
+
+    if len(transactions) > 0:
+        missing = set(TRANSACTION_VALUE_COLUMNS + TRANSACTION_CURRENCY_COLUMNS) - set(df.columns)
+        if missing:
+            raise ValueError(f"Missing columns: {sorted(missing)}")
+        transactions = transactions.astype({column: float for column in TRANSACTION_VALUE_COLUMNS})
+        if transactions[TRANSACTION_VALUE_COLUMNS + TRANSACTION_CURRENCY_COLUMNS].isna().any().any():
+            raise ValueError("Missing values in transactions.")
+    else:
+        transactions = pd.DataFrame(columns=Transaction.columns())
+
+    if len(splits) > 0:
+        if "ratio" not in df.columns:
+            raise ValueError("Missing columns: ['ratio']")
+        splits = splits.astype({"ratio": float})
+        if splits["ratio"].isna().any():
+            raise ValueError("Missing values in splits.")
+        invalid_ratios = ~(splits["ratio"] > 0)
+        if invalid_ratios.any():
+            raise ValueError(f"Invalid split ratio.\n{splits[invalid_ratios].head(1).to_dict('records')[0]}")
+    else:
+        splits = pd.DataFrame(columns=Split.columns())
+
+    return transactions[Transaction.columns()], splits[Split.columns()]
+
+@dataclass(frozen=True, slots=True)  # immutable and hashable (usable in sets and as dict keys), without a per-instance __dict__
 class Transaction:
     type: str
     date: date
@@ -40,7 +147,12 @@ class Transaction:
         return ["type", "date", "quantity", "unit_price", "closing_costs", "tx_currency", "exch_rate", "target_currency", "time"]
 
     def __post_init__(self):
-        assert self.type in [SALE, PURCHASE]
+        # type and currencies are interned, so that all records share the same few string objects
+        tx_type = TX_TYPES.get(self.type)
+        assert tx_type is not None
+        object.__setattr__(self, "type", tx_type)
+        object.__setattr__(self, "tx_currency", intern(str(self.tx_currency)))  # str(): intern rejects subclasses (e.g. numpy.str_)
+        object.__setattr__(self, "target_currency", intern(str(self.target_currency)))
 
     def to_dict(self):
         return {
@@ -55,7 +167,7 @@ class Transaction:
             "time": self.time,
         }
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Split:
     date: date
     ratio: float
@@ -66,6 +178,11 @@ class Split:
     def columns():
         return ["type", "date", "ratio", "time"]
 
+    def __post_init__(self):
+        # ratio = shares after the split / shares before
+        if not self.ratio > 0:
+            raise ValueError(f"Invalid split ratio: {self.ratio}")
+
     def to_dict(self):
         return {
             "type": self.type,
@@ -74,6 +191,267 @@ class Split:
             "time": self.time,
         }
 
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    # bulk insertions allocate one object per record: without this, the cyclic garbage collector would rescan
+    # the growing set of live records many times during the batch (records never form reference cycles)
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def transactions_from_frame(transactions: pd.DataFrame) -> list[Transaction]:
+    # Transaction objects of a frame returned by validate_frame, which has already checked every row:
+    # types and currencies are interned once per distinct value, and the fields are set through the slot descriptors,
+    # which skips the per-row __init__ / __post_init__ (about 3x faster on large batches)
+    values = {column: transactions[column].tolist() for column in Transaction.columns()}
+    for column in ["type"] + TRANSACTION_CURRENCY_COLUMNS:
+        interned = {value: TX_TYPES[value] if column == "type" else intern(str(value)) for value in set(values[column])}
+        values[column] = [interned[value] for value in values[column]]
+
+    objs = [object.__new__(Transaction) for _ in range(len(transactions))]
+    for column in Transaction.columns():
+        deque(map(getattr(Transaction, column).__set__, objs, values[column]), maxlen=0)  # runs the setters without a Python loop
+    return objs
+
+def records_to_arrays(objs: list[Transaction | Split], columns: list[str]) -> dict[str, np.ndarray]:
+    # {column: numpy array} of the given records of one type, in the format of get_arrays_for_statistics
+    arrays = {}
+    for column in columns:
+        values = [getattr(obj, column) for obj in objs]
+        if column == "date":
+            arrays[column] = dates_to_datetime64(values)
+        elif column == "time":
+            arrays[column] = times_to_timedelta64(values)
+        elif column in ("type", "tx_currency", "target_currency"):
+            arrays[column] = np.array(values, dtype=object)
+        else:
+            arrays[column] = np.array(values, dtype=float)
+    return arrays
+
+def frame_to_arrays(frame: pd.DataFrame) -> dict[str, np.ndarray]:
+    # {column: numpy array} of a frame returned by validate_frame (transactions or splits), see records_to_arrays
+    arrays = {}
+    for column in frame.columns:
+        if column == "date":
+            arrays[column] = dates_to_datetime64(frame[column].tolist())
+        elif column == "time":
+            arrays[column] = times_to_timedelta64(frame[column].tolist())
+        elif column in ("type", "tx_currency", "target_currency"):
+            arrays[column] = frame[column].to_numpy(dtype=object)
+        else:
+            arrays[column] = frame[column].to_numpy(dtype=float)
+    return arrays
+
+HASHED_STRING_COLUMNS = ["type", "tx_currency", "target_currency"]
+HASHED_VALUE_COLUMNS = TRANSACTION_VALUE_COLUMNS + ["ratio"]
+HASH_SEED = 0x9E3779B97F4A7C15
+
+def string_hashes(values: Iterable[str]) -> np.ndarray:
+    # stable 64-bit hash of each string (hash() of a str changes from one process to the next), computed once per distinct value
+    values = values.tolist() if isinstance(values, np.ndarray) else list(values)
+    distinct = {value: int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "little") for value in set(values)}
+    return np.fromiter(map(distinct.__getitem__, values), dtype=np.uint64, count=len(values))
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer: every bit of the input affects every bit of the output
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def record_hashes(columns: dict[str, np.ndarray]) -> np.ndarray:
+    # stable 64-bit hash of each record, from its columns in the format of get_arrays_for_statistics,
+    # or with a "timestamp" column (datetime64[ns]) instead of "date" and "time"
+    # type and currencies may also be given as their string_hashes; missing fields (e.g. the ratio of a transaction) count as 0 / ''
+    if "timestamp" in columns:
+        timestamps = columns["timestamp"].astype("datetime64[ns]")
+    else:
+        timestamps = columns["date"].astype("datetime64[ns]") + columns["time"].astype("timedelta64[ns]")
+    hashes = _mix(np.full(len(timestamps), HASH_SEED, dtype=np.uint64) ^ timestamps.view(np.uint64))
+    for column in HASHED_STRING_COLUMNS:
+        values = columns.get(column)
+        if values is None:
+            values = np.full(len(timestamps), string_hashes([""])[0])
+        elif values.dtype != np.uint64:
+            values = string_hashes(values)
+        hashes = _mix(hashes ^ values)
+    for column in HASHED_VALUE_COLUMNS:
+        values = columns.get(column)
+        if values is None:
+            values = np.zeros(len(timestamps))
+        hashes = _mix(hashes ^ (values.astype(float) + 0.0).view(np.uint64))  # + 0.0: -0.0 hashes like 0.0, as they compare equal
+    return hashes
+
+@dataclass(frozen=True, slots=True)
+class HistoryDigest:
+    # content hash of a set of records: their number and the sum (mod 2**64) of their record_hashes,
+    # so that storage engines update it as records are added and removed, without rehashing the rest of the history
+    # it doesn't depend on the order of the records (records at the same timestamp keep their order when a history is reloaded)
+    count: int = 0
+    total: int = 0
+
+    @classmethod
+    def from_inputs(cls, inputs: StatsInputs) -> HistoryDigest:
+        # digest of the records of get_arrays_for_statistics()
+        digest = cls()
+        for columns in inputs.values():
+            digest = digest.add(record_hashes(columns))
+        return digest
+
+    def add(self, hashes: np.ndarray) -> HistoryDigest:
+        return HistoryDigest(self.count + len(hashes), (self.total + int(hashes.sum(dtype=np.uint64))) % 2**64)
+
+    def remove(self, hashes: np.ndarray) -> HistoryDigest:
+        return HistoryDigest(self.count - len(hashes), (self.total - int(hashes.sum(dtype=np.uint64))) % 2**64)
+
+class SortedTransactionIndex:
+    # merged sequence of sales, purchases and splits, always sorted by (date, time, insertion sequence)
+    # insertions and lookups use bisect, so range queries never need to flatten or re-sort the history
+
+    def __init__(self) -> None:
+        self._keys: list[tuple[date, time, int]] = []
+        self._items: list[Transaction | Split] = []
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def insert(self, obj: Transaction | Split) -> None:
+        key = (obj.date, obj.time, self._next_seq)
+        self._next_seq += 1
+        position = bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._items.insert(position, obj)
+
+    def insert_many(self, objs: list[Transaction | Split]) -> Transaction | Split:
+        # returns the earliest record of the batch
+        keys = [(obj.date, obj.time, self._next_seq + i) for i, obj in enumerate(objs)]
+        self._next_seq += len(objs)
+
+        # batches are usually already in chronological order: one pass checks it, and the sort is skipped
+        if not all(map(lt, keys, islice(keys, 1, None))):
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            keys = [keys[i] for i in order]
+            objs = [objs[i] for i in order]
+
+        if self._keys == [] or keys == [] or keys[0] > self._keys[-1]:
+            # appending after the last record (the usual case): no merge needed
+            self._keys.extend(keys)
+            self._items.extend(objs)
+        else:
+            # timsort merges the two sorted runs in linear time
+            # sequence numbers are unique, so sorting (key, obj) pairs never compares two objects
+            merged = sorted(zip(self._keys + keys, self._items + objs))
+            self._keys = [key for key, _ in merged]
+            self._items = [obj for _, obj in merged]
+        return objs[0]
+
+    def remove_many(self, objs: set[Transaction | Split]) -> None:
+        # single linear pass, whatever the number of records removed
+        kept = [(key, obj) for key, obj in zip(self._keys, self._items) if obj not in objs]
+        self._keys = [key for key, _ in kept]
+        self._items = [obj for _, obj in kept]
+
+    def remove(self, obj: Transaction | Split) -> None:
+        # only the records sharing the same (date, time) need to be compared
+        start = bisect_left(self._keys, (obj.date, obj.time))
+        end = bisect_left(self._keys, (obj.date, obj.time, float("inf")))
+        for position in range(start, end):
+            if self._items[position] == obj:
+                del self._keys[position]
+                del self._items[position]
+                return
+        raise KeyError(f"Record does not exist.\n{obj}")
+
+    def between(self, start: date, end: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        # all records from start to end (both dates included)
+        first, last = self._bounds(start, end)
+        return self._filter_type(self._items[first:last], tx_type)
+
+    def count_between(self, start: date, end: date) -> int:
+        first, last = self._bounds(start, end)
+        return max(last - first, 0)
+
+    def on(self, date: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        return self.between(date, date, tx_type)
+
+    def since(self, since: tuple[date, time], tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        # all records at or after (date, time) = since
+        first = bisect_left(self._keys, since)
+        return self._filter_type(self._items[first:], tx_type)
+
+    def iter_chronological(self, tx_type: Optional[str] = None) -> Iterator[Transaction | Split]:
+        for obj in self._items:
+            if tx_type is None or obj.type == tx_type:
+                yield obj
+
+    def _bounds(self, start: date, end: date) -> tuple[int, int]:
+        first = bisect_left(self._keys, (start,))
+        last = bisect_left(self._keys, (end + timedelta(days=1),)) if end < date.max else len(self._keys)
+        return first, last
+
+    @staticmethod
+    def _filter_type(items: list[Transaction | Split], tx_type: Optional[str]) -> list[Transaction | Split]:
+        if tx_type is None:
+            return items
+        return [obj for obj in items if obj.type == tx_type]
+
+INDEXABLE_FIELDS = ["time", "ratio", "quantity", "unit_price", "closing_costs", "tx_currency", "exch_rate", "target_currency"]
+
+class SecondaryIndex:
+    # optional index of the records of a TransactionHistory on one field (e.g. tx_currency, quantity)
+    # {(type, value): {record,}} for equality lookups, plus the sorted distinct values of each type for range lookups
+
+    def __init__(self, field: str) -> None:
+        self._field = field
+        self._postings: dict[tuple[str, object], set[Transaction | Split]] = {}
+        self._values: dict[str, list] = {SALE: [], PURCHASE: [], SPLIT: []}
+
+    def insert(self, obj: Transaction | Split) -> None:
+        value = getattr(obj, self._field, None)
+        if value is None:
+            return
+        posting = self._postings.get((obj.type, value))
+        if posting is None:
+            posting = self._postings[(obj.type, value)] = set()
+            values = self._values[obj.type]
+            values.insert(bisect_left(values, value), value)
+        posting.add(obj)
+
+    def remove(self, obj: Transaction | Split) -> None:
+        value = getattr(obj, self._field, None)
+        posting = self._postings.get((obj.type, value))
+        if posting is None:
+            return
+        posting.discard(obj)
+        if not posting:
+            del self._postings[(obj.type, value)]
+            values = self._values[obj.type]
+            del values[bisect_left(values, value)]
+
+    def count(self, tx_type: str, low, high, low_strict: bool = False, high_strict: bool = False) -> int:
+        return sum(len(self._postings[(tx_type, value)]) for value in self._range(tx_type, low, high, low_strict, high_strict))
+
+    def find(self, tx_type: str, low, high, low_strict: bool = False, high_strict: bool = False) -> set[Transaction | Split]:
+        # low / high can be None (unbounded); equality lookups use low == high
+        if low is not None and low == high and not (low_strict or high_strict):
+            return self._postings.get((tx_type, low), set())
+        found = set()
+        for value in self._range(tx_type, low, high, low_strict, high_strict):
+            found |= self._postings[(tx_type, value)]
+        return found
+
+    def _range(self, tx_type: str, low, high, low_strict: bool, high_strict: bool) -> list:
+        values = self._values[tx_type]
+        if low is not None and low == high and not (low_strict or high_strict):
+            return [low] if (tx_type, low) in self._postings else []
+        start = 0 if low is None else (bisect_right if low_strict else bisect_left)(values, low)
+        end = len(values) if high is None else (bisect_left if high_strict else bisect_right)(values, high)
+        return values[start:end]
+
 class TransactionHistory:
 
     def __init__(self) -> None:
@@ -81,60 +459,259 @@ class TransactionHistory:
         self._sales: dict[date.year: dict[date: list[Transaction]]] = {}
         self._purchases: dict[date.year: dict[date: list[Transaction]]] = {}
         self._splits: dict[date.year: dict[date: list[Split]]] = {}
+        self._dirty_since: Optional[tuple[date, time]] = None  # earliest (date, time) changed since last clear_dirty()
+        self._index = SortedTransactionIndex()  # all of the above, merged in chronological order
+        # hash-based duplicate index: {type: {Transaction,}}
+        self._records: dict[str: set[Transaction | Split]] = {SALE: set(), PURCHASE: set(), SPLIT: set()}
+        self._secondary_indexes: dict[str, SecondaryIndex] = {}  # {field: SecondaryIndex}, see create_index()
+        self._metrics = Metrics()  # filled only while instrumentation is enabled
+        self._changes: Optional[list[tuple[str, Transaction | Split]]] = None  # [(ADD / REMOVE, record)], see track_changes()
+        self._digest = HistoryDigest()  # of the records, except the ones below (see digest())
+        self._unhashed_added: list[Transaction | Split] = []
+        self._unhashed_removed: list[Transaction | Split] = []
 
     def __len__(self) -> int:
-        return self._len_nested_dict(self._sales) \
-                + self._len_nested_dict(self._purchases) \
-                + self._len_nested_dict(self._splits)
+        return len(self._records[SALE]) \
+                + len(self._records[PURCHASE]) \
+                + len(self._records[SPLIT])
 
+    @instrumented("add_purchase")
     def add_purchase(self, purchase: Transaction) -> None:
         if purchase.type != PURCHASE:
             raise ValueError(f"Transaction is not a purchase.\n{purchase}")
         
         self._append_dict(self._purchases, purchase)
     
+    @instrumented("remove_purchase")
     def remove_purchase(self, purchase: Transaction) -> None:
         self._pop_from_dict(self._purchases, purchase)
     
+    @instrumented("add_sale")
     def add_sale(self, sale: Transaction) -> None:
         if sale.type != SALE:
             raise ValueError(f"Transaction is not a sale.\n{sale}")
         
         self._append_dict(self._sales, sale)
     
+    @instrumented("remove_sale")
     def remove_sale(self, sale: Transaction) -> None:
         self._pop_from_dict(self._sales, sale)
     
+    @instrumented("add_split")
     def add_split(self, split: Split) -> None:
         self._append_dict(self._splits, split)
     
+    @instrumented("remove_split")
     def remove_split(self, split: Split) -> None:
         self._pop_from_dict(self._splits, split)
     
-    def get_data_for_statistics(self) -> StatsInputs:
-        sales_dicts = [item.to_dict() for item in flatten_dict_to_list(self._sales)]
-        purchases_dicts = [item.to_dict() for item in flatten_dict_to_list(self._purchases)]
-        splits_dicts = [item.to_dict() for item in flatten_dict_to_list(self._splits)]
+    @instrumented("add_many")
+    def add_many(self, records: Iterable[Transaction | Split] | pd.DataFrame | dict) -> None:
+        # bulk insertion of purchases, sales and splits, given as records, as a dataframe or as a dict of columns
+        # the whole batch is validated before anything is inserted, so a failing batch leaves the history unchanged
+        if isinstance(records, dict):
+            import pandas as pd
+            records = pd.DataFrame(records)
+        with gc_paused():
+            if is_dataframe(records):
+                transactions, splits = validate_frame(records)
+                objs = transactions_from_frame(transactions) \
+                    + [Split(date= d, ratio= r, time= t) for d, r, t in zip(splits["date"].tolist(), splits["ratio"].tolist(), splits["time"].tolist())]
+            else:
+                objs = list(records)
+
+            by_type = {SALE: [], PURCHASE: [], SPLIT: []}
+            for obj in objs:
+                records_of_type = by_type.get(obj.type)
+                if records_of_type is None:
+                    raise ValueError(f"Invalid transaction type.\n{obj}")
+                records_of_type.append(obj)
+
+            # duplicates inside the batch, then against existing records (each record is hashed once)
+            batch = {}
+            for tx_type, records_of_type in by_type.items():
+                batch[tx_type] = set(records_of_type)
+                if len(batch[tx_type]) < len(records_of_type):
+                    raise DuplicateError(f"Duplicate record.\n{self._first_repeated(records_of_type)}")
+            for tx_type, new_records in batch.items():
+                duplicates = new_records & self._records[tx_type]
+                if duplicates:
+                    raise DuplicateError(f"Duplicate record.\n{next(iter(duplicates))}")
+
+            if objs == []:
+                return
+
+            attr_dicts = {SALE: self._sales, PURCHASE: self._purchases, SPLIT: self._splits}
+            for tx_type, records_of_type in by_type.items():
+                attr_dict = attr_dicts[tx_type]
+                # batches are mostly chronological: one dictionary update per run of records on the same day
+                for day, records_of_day in groupby(records_of_type, key=attrgetter("date")):
+                    attr_dict.setdefault(day.year, {}).setdefault(day, []).extend(records_of_day)
+            for tx_type, new_records in batch.items():
+                self._records[tx_type] |= new_records
+            earliest = self._index.insert_many(objs)
+            for secondary_index in self._secondary_indexes.values():
+                for obj in objs:
+                    secondary_index.insert(obj)
+            self._mark_dirty(earliest)
+            if self._changes is not None:
+                self._changes.extend((ADD, obj) for obj in objs)
+            if is_dataframe(records):
+                self._digest = self._digest.add(np.concatenate([record_hashes(frame_to_arrays(transactions)), record_hashes(frame_to_arrays(splits))]))
+            else:
+                self._unhashed_added.extend(objs)
+
+    @staticmethod
+    def _first_repeated(objs: list[Transaction | Split]) -> Transaction | Split:
+        seen = set()
+        for obj in objs:
+            if obj in seen:
+                return obj
+            seen.add(obj)
+
+    @instrumented("remove_all")
+    def remove_all(self, matches: Iterable[Transaction | Split]) -> None:
+        # bulk removal, e.g. of the results of TransactionFinder.find_all()
+        # every record is checked before anything is removed, so a failing removal leaves the history unchanged
+        matches = set(matches)
+        for obj in matches:
+            if obj.type not in self._records or obj not in self._records[obj.type]:
+                raise KeyError(f"Record does not exist.\n{obj}")
+        if not matches:
+            return
+
+        # rebuild each affected day once, and drop the days and years left empty
+        attr_dicts = {SALE: self._sales, PURCHASE: self._purchases, SPLIT: self._splits}
+        affected_days = {(obj.type, obj.date) for obj in matches}
+        for tx_type, day in affected_days:
+            attr_dict = attr_dicts[tx_type]
+            active_year = attr_dict[day.year]
+            remaining = [obj for obj in active_year[day] if obj not in matches]
+            if remaining:
+                active_year[day] = remaining
+            else:
+                del active_year[day]
+                if not active_year:
+                    del attr_dict[day.year]
+
+        for obj in matches:
+            self._records[obj.type].discard(obj)
+            for secondary_index in self._secondary_indexes.values():
+                secondary_index.remove(obj)
+        self._index.remove_many(matches)
+        self._mark_dirty(min(matches, key=lambda obj: (obj.date, obj.time)))
+        if self._changes is not None:
+            self._changes.extend((REMOVE, obj) for obj in matches)
+        self._unhashed_removed.extend(matches)
+
+    def create_index(self, field: str) -> None:
+        # optional secondary index, used by TransactionFinder to avoid scanning the whole history
+        if field not in INDEXABLE_FIELDS:
+            raise ValueError(f"Field '{field}' cannot be indexed.")
+        if field in self._secondary_indexes:
+            return
+        secondary_index = SecondaryIndex(field)
+        for obj in self._index.iter_chronological():
+            secondary_index.insert(obj)
+        self._secondary_indexes[field] = secondary_index
+
+    def drop_index(self, field: str) -> None:
+        self._secondary_indexes.pop(field, None)
+
+    def get_index(self, field: str) -> Optional[SecondaryIndex]:
+        return self._secondary_indexes.get(field)
+
+    def between(self, start: date, end: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        return self._index.between(start, end, tx_type)
+
+    def count_between(self, start: date, end: date) -> int:
+        # number of records (of all types) from start to end, without building the list
+        return self._index.count_between(start, end)
+
+    def on(self, date: date, tx_type: Optional[str] = None) -> list[Transaction | Split]:
+        return self._index.on(date, tx_type)
+
+    def iter_chronological(self, tx_type: Optional[str] = None) -> Iterator[Transaction | Split]:
+        return self._index.iter_chronological(tx_type)
+
+    def dirty_since(self) -> Optional[tuple[date, time]]:
+        return self._dirty_since
+
+    def track_changes(self, enabled: bool = True) -> None:
+        # while enabled, every added / removed record is logged (e.g. for journaled persistence), see pop_changes()
+        self._changes = [] if enabled else None
+
+    def pop_changes(self) -> list[tuple[str, Transaction | Split]]:
+        # [(ADD / REMOVE, record)] in the order they happened since the last call
+        changes = self._changes or []
+        if self._changes is not None:
+            self._changes = []
+        return changes
+
+    def clear_dirty(self) -> None:
+        self._dirty_since = None
+
+    def digest(self) -> HistoryDigest:
+        # content hash of the history (see HistoryDigest), kept up to date without going through all the records:
+        # dataframes are hashed as they are inserted, and the other records added / removed since the last call are hashed here
+        if self._unhashed_added != [] or self._unhashed_removed != []:
+            self._digest = self._digest.add(self._hashes(self._unhashed_added)).remove(self._hashes(self._unhashed_removed))
+            self._unhashed_added = []
+            self._unhashed_removed = []
+        return self._digest
+
+    @staticmethod
+    def _hashes(objs: list[Transaction | Split]) -> np.ndarray:
+        splits = [obj for obj in objs if obj.type == SPLIT]
+        transactions = [obj for obj in objs if obj.type != SPLIT]
+        return np.concatenate([record_hashes(records_to_arrays(transactions, Transaction.columns())),
+                               record_hashes(records_to_arrays(splits, Split.columns()))])
+
+    @instrumented("get_data_for_statistics")
+    def get_data_for_statistics(self, since: Optional[tuple[date, time]] = None) -> StatsInputs:
+        # if since is provided, only the events happening at or after (date, time) = since are returned
+        # events come out of the index already in chronological order
+        import pandas as pd
+
+        items = self._index.iter_chronological() if since is None else self._index.since(since)
+        dicts = {SALE: [], PURCHASE: [], SPLIT: []}
+        for item in items:
+            dicts[item.type].append(item.to_dict())
 
         return {
-            SALE: pd.DataFrame(sales_dicts, columns=Transaction.columns()),
-            PURCHASE: pd.DataFrame(purchases_dicts, columns=Transaction.columns()),
-            SPLIT: pd.DataFrame(splits_dicts, columns=Split.columns()),
+            SALE: pd.DataFrame(dicts[SALE], columns=Transaction.columns()),
+            PURCHASE: pd.DataFrame(dicts[PURCHASE], columns=Transaction.columns()),
+            SPLIT: pd.DataFrame(dicts[SPLIT], columns=Split.columns()),
         }
+
+    @instrumented("get_arrays_for_statistics")
+    def get_arrays_for_statistics(self, since: Optional[tuple[date, time]] = None) -> StatsInputs:
+        # same events as get_data_for_statistics, as {type: {column: numpy array}} (no pandas involved)
+        # dates are datetime64[D] and times are timedelta64[ns]
+        items = self._index.iter_chronological() if since is None else self._index.since(since)
+        records = {SALE: [], PURCHASE: [], SPLIT: []}
+        for item in items:
+            records[item.type].append(item)
+
+        return {tx_type: records_to_arrays(objs, Split.columns() if tx_type == SPLIT else Transaction.columns())
+                for tx_type, objs in records.items()}
     
+    def _mark_dirty(self, obj: Transaction | Split) -> None:
+        key = (obj.date, obj.time)
+        if self._dirty_since is None or key < self._dirty_since:
+            self._dirty_since = key
+
     def _append_dict(self, attr_dict: dict, new_obj: Transaction | Split) -> None:
         date = new_obj.date
         year = date.year
+        records = self._records[new_obj.type]
         
         active_year = attr_dict.get(year)
         active_date = None
-        contains_duplicate = False
         if active_year is not None:
             active_date = active_year.get(date)
-        if active_date is not None:
-            contains_duplicate = any([True for obj in active_date if obj == new_obj])
         
-        if contains_duplicate == True:
+        if new_obj in records:
             # duplicate exists
             raise DuplicateError(f"Duplicate record.\n{new_obj}")
         elif active_date is not None:
@@ -147,10 +724,23 @@ class TransactionHistory:
             # year and date don't exist yet
             attr_dict.update({year: {date: [new_obj]}})
 
+        records.add(new_obj)
+        self._index.insert(new_obj)
+        for secondary_index in self._secondary_indexes.values():
+            secondary_index.insert(new_obj)
+        self._mark_dirty(new_obj)
+        if self._changes is not None:
+            self._changes.append((ADD, new_obj))
+        self._unhashed_added.append(new_obj)
+
     def _pop_from_dict(self, attr_dict: dict, obj_to_remove: Transaction | Split) -> None:
         date = obj_to_remove.date
         year = date.year
         key_error_text = f"Record does not exist.\n{obj_to_remove}"
+        records = self._records[obj_to_remove.type]
+
+        if obj_to_remove not in records:
+            raise KeyError(key_error_text)
 
         active_year = attr_dict.get(year)
         if active_year is None:
@@ -164,24 +754,35 @@ class TransactionHistory:
             active_date.remove(obj_to_remove)
         except ValueError:
             raise KeyError(key_error_text)
-        
-    def _len_nested_dict(self, attr_dict: dict) -> int:
-        total_len = 0
-        for year, sub_dict in attr_dict.items():
-            for date, sub_list in sub_dict.items():
-                total_len += len(sub_list)
-        return total_len
+
+        # don't leave empty days and years behind
+        if not active_date:
+            del active_year[date]
+            if not active_year:
+                del attr_dict[year]
+
+        records.discard(obj_to_remove)
+        self._index.remove(obj_to_remove)
+        for secondary_index in self._secondary_indexes.values():
+            secondary_index.remove(obj_to_remove)
+        self._mark_dirty(obj_to_remove)
+        if self._changes is not None:
+            self._changes.append((REMOVE, obj_to_remove))
+        self._unhashed_removed.append(obj_to_remove)
 
 class TransactionFinder: 
     # useful class e.g. if we want to delete certain transactions from the transaction history,
     # we can identify them first with TransactionFinder, 
-    # and then delete them with the methods provided by TransactionHistory
+    # and then delete them all at once with delete() (or TransactionHistory.remove_all)
 
     def __init__(self, tx_history: TransactionHistory, tx_type: str):
         self._tx_history = tx_history
+        self._metrics = tx_history._metrics  # searches are recorded with the operations of the transaction history
         self._type = tx_type # SALE / PURCHASE / SPLIT
         self._year = None
         self._date = None
+        self._date_range = None  # (start, end), both included
+        self._range_parameters = {}  # {field: (low, high, low_strict, high_strict)}, low / high can be None (unbounded)
         self._search_parameters = {}
                                 # time
                                 # ratio
@@ -212,6 +813,39 @@ class TransactionFinder:
         self._date = date
         return self
 
+    def with_date_between(self, start: date, end: date) -> TransactionFinder:
+        # both dates are included
+        self._date_range = (start, end)
+        return self
+
+    def with_time_between(self, start: time, end: time) -> TransactionFinder:
+        self._range_parameters["time"] = (start, end, False, False)
+        return self
+
+    def with_quantity_between(self, low: float, high: float) -> TransactionFinder:
+        self._range_parameters["quantity"] = (low, high, False, False)
+        return self
+
+    def with_quantity_greater_than(self, quantity: float) -> TransactionFinder:
+        self._range_parameters["quantity"] = (quantity, None, True, False)
+        return self
+
+    def with_quantity_less_than(self, quantity: float) -> TransactionFinder:
+        self._range_parameters["quantity"] = (None, quantity, False, True)
+        return self
+
+    def with_unit_price_between(self, low: float, high: float) -> TransactionFinder:
+        self._range_parameters["unit_price"] = (low, high, False, False)
+        return self
+
+    def with_unit_price_greater_than(self, unit_price: float) -> TransactionFinder:
+        self._range_parameters["unit_price"] = (unit_price, None, True, False)
+        return self
+
+    def with_unit_price_less_than(self, unit_price: float) -> TransactionFinder:
+        self._range_parameters["unit_price"] = (None, unit_price, False, True)
+        return self
+
     def with_time(self, time: time) -> TransactionFinder:
         self._search_parameters["time"] = time
         return self
@@ -246,48 +880,89 @@ class TransactionFinder:
         self._search_parameters["target_currency"] = target_currency
         return self
 
+    def delete(self) -> int:
+        # removes every transaction found from the transaction history, in one pass, and returns how many were removed
+        transactions_found = self.find_all()
+        self._tx_history.remove_all(transactions_found)
+        return len(transactions_found)
+
+    @instrumented("find_all")
     def find_all(self) -> list[Transaction | Split]:
-        # Set the correct search space based on transaction type
-        if self._type == SALE:
-            search_space = self._tx_history._sales
-        elif self._type == PURCHASE:
-            search_space = self._tx_history._purchases
-        elif self._type == SPLIT:
-            search_space = self._tx_history._splits
-        else:
+        if self._type not in [SALE, PURCHASE, SPLIT]:
             raise ValueError(f"Type '{self._type}' is not allowed.")
-        
-        # restrict search space by date and year (if provided)
-        # if date is provided, search inside relevant list
-        if self._date is not None:
-            date_dict = search_space.get(self._date.year)
-            if date_dict is None:
-                return []
-            candidates_list = date_dict.get(self._date)
-            
-        # if date is not provided but year is provided, flatten all date dicts from that year into one list and search inside that list
-        elif self._year is not None:
-            date_dict = search_space.get(self._year)
-            if date_dict is None:
-                return []
-            candidates_list = flatten_dict_to_list(date_dict)
-
-        # if neither date nor year is provided, flatten all dicts from all years into one list and search inside that list
+
+        start, end = self._date_bounds()
+        if start is not None and start > end:
+            return []
+
+        # storage engines that evaluate the criteria themselves (e.g. SQLiteTransactionHistory) get the whole search
+        if hasattr(self._tx_history, "select"):
+            return self._tx_history.select(self._type, start, end, self._predicates())
+
+        # query planner: every way of getting candidates comes with an estimate of how many candidates it returns,
+        # and the most selective one is used (all criteria are checked on the candidates afterwards)
+        # the chronological index covers date / year / date range, secondary indexes (if created) cover the other fields
+        if start is not None:
+            plans = [(self._tx_history.count_between(start, end), lambda: self._tx_history.between(start, end, self._type))]
         else:
-            candidates_list = flatten_dict_to_list(search_space)
+            plans = [(len(self._tx_history), lambda: list(self._tx_history.iter_chronological(self._type)))]
+
+        predicates = self._predicates()
+        for parameter, bounds in predicates:
+            secondary_index = self._tx_history.get_index(parameter)
+            if secondary_index is not None:
+                plans.append((
+                    secondary_index.count(self._type, *bounds),
+                    lambda secondary_index=secondary_index, bounds=bounds: sorted(
+                        secondary_index.find(self._type, *bounds), key=lambda obj: (obj.date, obj.time)
+                    ),
+                ))
+
+        _, get_candidates = min(plans, key=lambda plan: plan[0])
+        candidates_list = get_candidates()
 
         # return early if we have no candidates remaining
-        if candidates_list is None or candidates_list == []:
+        if candidates_list == []:
             return []
         
         # create final list of transactions found
         transctions_found = []
         for candidate in candidates_list:
-            successful = True
-            for parameter, expected_value in self._search_parameters.items():
+            successful = start is None or start <= candidate.date <= end
+            for parameter, bounds in predicates:
                 # ensure that all search criteria are respected
-                successful = successful and getattr(candidate, parameter) == expected_value
+                successful = successful and self._within(getattr(candidate, parameter), *bounds)
             if successful:
                 transctions_found.append(candidate)
         
-        return transctions_found
\ No newline at end of file
+        return transctions_found
+
+    def _date_bounds(self) -> tuple[Optional[date], Optional[date]]:
+        # intersection of the date, year and date range criteria (if provided)
+        start, end = None, None
+        ranges = []
+        if self._date is not None:
+            ranges.append((self._date, self._date))
+        if self._year is not None:
+            ranges.append((date(self._year, 1, 1), date(self._year, 12, 31)))
+        if self._date_range is not None:
+            ranges.append(self._date_range)
+        for range_start, range_end in ranges:
+            start = range_start if start is None else max(start, range_start)
+            end = range_end if end is None else min(end, range_end)
+        return start, end
+
+    def _predicates(self) -> list[tuple[str, tuple]]:
+        # equality criteria are ranges with low == high
+        equalities = [(parameter, (value, value, False, False)) for parameter, value in self._search_parameters.items()]
+        return equalities + list(self._range_parameters.items())
+
+    @staticmethod
+    def _within(value, low, high, low_strict: bool, high_strict: bool) -> bool:
+        if low is not None and low == high and not (low_strict or high_strict):
+            return value == low
+        if low is not None and (value <= low if low_strict else value < low):
+            return False
+        if high is not None and (value >= high if high_strict else value > high):
+            return False
+        return True
\ No newline at end of file
@@ -1,10 +1,24 @@
 import pytest
+import datetime
+import os
+import subprocess
+import sys
 from test.globals import *
 
 from src.asset import Asset, Stock, RealEstate, AssetFactory, StockFactory, RealEstateFactory
+from src.stats import Statistics
 
 class TestAsset:
 
+    def test_statistics_without_transactions(self):
+        statistics = Stock(NAME + "_EMPTY").statistics()
+        assert statistics.total_capital_gains_for(DATE.year) == 0.0
+        assert statistics.ACB_at_end_of_day(DATE) == 0.0
+        assert statistics.holdings_at_end_of_day(DATE) == 0.0
+        assert statistics.capital_gains_by_year() == {}
+        assert len(statistics.full_history()) == 0
+        assert len(statistics.list_capital_gains_for(DATE.year)) == 0
+
     def test_purchase_voids_statistics(self):
         asset = Asset(NAME)
         asset._statistics_up_to_date = True
@@ -47,6 +61,52 @@ class TestAsset:
 
         assert asset._statistics_up_to_date == False
 
+    def test_incremental_statistics_match_full_recalculation(self):
+        asset = Asset(NAME)
+        for day in range(10):
+            asset.purchase(DATE + datetime.timedelta(days=day), QUANTITY * 2, UNIT_PRICE + day, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+            asset.sell(DATE + datetime.timedelta(days=day), QUANTITY, UNIT_PRICE + 2 * day, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY, time=TIME.replace(hour=12))
+        asset.statistics()
+
+        # append, then insert in the middle of the history
+        asset.sell(DATE + datetime.timedelta(days=20), QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        asset.purchase(DATE + datetime.timedelta(days=5), QUANTITY, UNIT_PRICE * 3, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY, time=TIME.replace(hour=6))
+        incremental = asset.statistics()
+
+        full = Statistics()
+        full.recalculate_statistics(asset._tx_history.get_data_for_statistics())
+
+        assert list(incremental.full_history()["ACB"]) == pytest.approx(list(full.full_history()["ACB"]))
+        assert incremental.total_capital_gains_for(DATE.year) == pytest.approx(full.total_capital_gains_for(DATE.year))
+
+    def test_incremental_statistics_with_superficial_loss(self):
+        asset = Asset(NAME)
+        asset.purchase(DATE, 30, 10, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        asset.purchase(DATE + datetime.timedelta(days=25), 10, 10, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        asset.sell(DATE + datetime.timedelta(days=50), 20, 8, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        asset.statistics()
+
+        # the sale is recomputed, and the purchase of day 25 (kept) still counts as acquired within its window
+        asset.purchase(DATE + datetime.timedelta(days=70), 5, 8, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        incremental = asset.statistics()
+
+        full = Statistics()
+        full.recalculate_statistics(asset._tx_history.get_data_for_statistics())
+        loss = 20 * 2 * EXCH_RATE
+        assert incremental.list_capital_gains_for(DATE.year)["superficial_loss"].iloc[0] == pytest.approx(loss * 15 / 20)
+        assert incremental.total_capital_gains_for(DATE.year) == pytest.approx(full.total_capital_gains_for(DATE.year))
+        assert list(incremental.full_history()["ACB"]) == pytest.approx(list(full.full_history()["ACB"]))
+
+    def test_statistics_resume_from_dirty_timestamp(self):
+        asset = Asset(NAME)
+        asset.purchase(DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        asset.statistics()
+        assert asset._tx_history.dirty_since() is None
+
+        asset.sell(DATE + datetime.timedelta(days=1), QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert asset._tx_history.dirty_since() == (DATE + datetime.timedelta(days=1), TIME)
+        assert len(asset.statistics().full_history()) == 2
+
 
 class TestStock:
 
@@ -61,6 +121,29 @@ class TestStock:
 
         assert stock._statistics_up_to_date == False
 
+    def test_split_invalid_ratio(self):
+        with pytest.raises(ValueError):
+            Stock(NAME).split(date= DATE, ratio= 0)
+
+    def test_split_incremental_statistics(self):
+        stock = Stock(NAME)
+        for day in range(0, 200, 20):
+            stock.purchase(DATE + datetime.timedelta(days=day), QUANTITY * 2, UNIT_PRICE + day, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+            stock.sell(DATE + datetime.timedelta(days=day + 1), QUANTITY, UNIT_PRICE + day, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        first_rows = stock.statistics().full_history().head(10).copy()
+
+        stock.split(date= DATE + datetime.timedelta(days=150), ratio= RATIO)
+        incremental = stock.statistics()
+
+        full = Statistics()
+        full.recalculate_statistics(stock._tx_history.get_data_for_statistics())
+        assert list(incremental.full_history()["holdings"]) == pytest.approx(list(full.full_history()["holdings"]))
+        assert list(incremental.full_history()["ACB"]) == pytest.approx(list(full.full_history()["ACB"]))
+        assert incremental.total_capital_gains_for(DATE.year) == pytest.approx(full.total_capital_gains_for(DATE.year))
+        # rows before the split are kept as they were
+        assert list(incremental.full_history().head(10)["holdings"]) == list(first_rows["holdings"])
+        assert incremental.full_history()["holdings"].iloc[-1] == 8 * RATIO + 2
+
 
 class TestAssetFactory:
 
@@ -145,4 +228,82 @@ class TestSubFactories:
         RealEstateFactory.get_instance(DIFFERENT_NAME)
 
         assert RealEstateFactory.list_assets() == [ NAME, DIFFERENT_NAME ] \
-            or RealEstateFactory.list_assets() == [ DIFFERENT_NAME, NAME ]
\ No newline at end of file
+            or RealEstateFactory.list_assets() == [ DIFFERENT_NAME, NAME ]
+
+class TestBulkIngestion:
+
+    def test_purchase_many_and_sell_many(self):
+        asset = Asset(NAME)
+        asset.purchase_many({
+            "date": [DATE, DATE + datetime.timedelta(days=1)],
+            "quantity": [QUANTITY * 2, QUANTITY * 2],
+            "unit_price": [UNIT_PRICE, UNIT_PRICE + 1],
+            "closing_costs": [CLOSING_COSTS, CLOSING_COSTS],
+            "tx_currency": [TX_CURRENCY, TX_CURRENCY],
+            "exch_rate": [EXCH_RATE, EXCH_RATE],
+            "target_currency": [TARGET_CURRENCY, TARGET_CURRENCY],
+        })
+        asset._statistics_up_to_date = True
+        asset.sell_many({
+            "date": [DATE + datetime.timedelta(days=2)],
+            "quantity": [QUANTITY],
+            "unit_price": [UNIT_PRICE],
+            "closing_costs": [CLOSING_COSTS],
+            "tx_currency": [TX_CURRENCY],
+            "exch_rate": [EXCH_RATE],
+            "target_currency": [TARGET_CURRENCY],
+        })
+
+        assert asset._statistics_up_to_date == False
+        assert len(asset._tx_history) == 3
+        assert list(asset.statistics().full_history()["holdings"]) == [2, 4, 3]
+
+
+class TestStatisticsCache:
+
+    def make_stock(self, statistics_cache: str) -> Stock:
+        stock = Stock(NAME, statistics_cache=statistics_cache)
+        stock.purchase(DATE, QUANTITY * 4, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        stock.sell(DATE + datetime.timedelta(days=40), QUANTITY, UNIT_PRICE * 2, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        return stock
+
+    def test_reused_when_unchanged(self, tmp_path, monkeypatch):
+        filepath = str(tmp_path / "statistics.npz")
+        expected = self.make_stock(filepath).statistics().total_capital_gains_for(DATE.year)
+        assert os.path.exists(filepath)
+
+        # a new process with the same history: no computation
+        monkeypatch.setattr(Statistics, "recalculate_statistics", lambda *args: pytest.fail("statistics were recomputed"))
+        stock = self.make_stock(filepath)
+        assert stock.statistics().total_capital_gains_for(DATE.year) == expected
+        assert stock.statistics().holdings_at_end_of_day(DATE + datetime.timedelta(days=40)) == QUANTITY * 3
+
+    def test_recomputed_when_changed(self, tmp_path):
+        filepath = str(tmp_path / "statistics.npz")
+        self.make_stock(filepath).statistics()
+
+        stock = self.make_stock(filepath)
+        stock.sell(DATE + datetime.timedelta(days=41), QUANTITY, UNIT_PRICE * 2, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert stock.statistics().holdings_at_end_of_day(DATE + datetime.timedelta(days=41)) == QUANTITY * 2
+
+        # later changes are applied incrementally
+        stock.purchase(DATE + datetime.timedelta(days=42), QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert stock.statistics().holdings_at_end_of_day(DATE + datetime.timedelta(days=42)) == QUANTITY * 3
+
+
+class TestStartup:
+
+    def test_core_does_not_import_pandas(self):
+        # purchases, sales and ACB lookups must work without importing pandas
+        script = "\n".join([
+            "import sys",
+            "from datetime import date",
+            "from src.asset import Stock",
+            "stock = Stock('startup')",
+            "stock.purchase(date= date(2024, 1, 1), quantity= 2, unit_price= 5, closing_costs= 0, tx_currency= 'EUR', exch_rate= 1.5, target_currency= 'CAD')",
+            "stock.sell(date= date(2024, 1, 2), quantity= 1, unit_price= 6, closing_costs= 0, tx_currency= 'EUR', exch_rate= 1.5, target_currency= 'CAD')",
+            "assert stock.statistics().ACB_at_end_of_day(date(2024, 1, 2)) == 7.5",
+            "assert stock.statistics().total_capital_gains_for(2024) == 1.5",
+            "assert 'pandas' not in sys.modules",
+        ])
+        subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
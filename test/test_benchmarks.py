@@ -0,0 +1,46 @@
+import pandas as pd
+
+from src.stats import Statistics
+from src.transactions import TransactionHistory, SALE, SPLIT
+from benchmarks.generator import generate_history
+from benchmarks.suite import run, compare, MIN_SLOWDOWN
+
+
+class TestGenerator:
+
+    def test_seeded(self):
+        pd.testing.assert_frame_equal(generate_history(500, seed=1), generate_history(500, seed=1))
+        assert not generate_history(500, seed=1).equals(generate_history(500, seed=2))
+
+    def test_valid_history(self):
+        history = generate_history(20_000)
+        assert len(history) == 20_000
+        assert set(history["type"]) == {"Purchase", SALE, SPLIT}
+        assert history["tx_currency"].nunique() > 1
+        assert history["date"].duplicated().any()  # same-day trades
+
+        tx_history = TransactionHistory()
+        tx_history.add_many(history)
+        statistics = Statistics()
+        statistics.recalculate_statistics(tx_history.get_data_for_statistics())  # sales never exceed holdings
+        assert len(statistics.full_history()) == len(history)
+
+
+class TestSuite:
+
+    def test_run_and_compare(self):
+        results = run([200], repeat=1)
+        assert set(results["results"]["200"]) >= {"add_one_by_one", "recalculate_statistics", "per_year_queries"}
+
+        slower = {"results": {"200": {name: seconds / 2 for name, seconds in results["results"]["200"].items()}}}
+        comparison = compare(results, slower, min_slowdown=0)
+        assert all(row["regression"] for row in comparison if row["baseline"] > 0)
+        assert not any(row["regression"] for row in compare(results, results))
+
+    def test_small_slowdowns_ignored(self):
+        baseline = {"results": {"1000": {"fast": 0.0004, "slow": 0.5}}}
+        results = {"results": {"1000": {"fast": 0.0004 * 1.5, "slow": 0.5 + MIN_SLOWDOWN / 2}}}
+        assert not any(row["regression"] for row in compare(results, baseline))  # 50% slower but only by 0.2 ms; 0.1% slower
+
+        results = {"results": {"1000": {"fast": 0.0004 + MIN_SLOWDOWN * 2, "slow": 0.6}}}
+        assert all(row["regression"] for row in compare(results, baseline))
@@ -0,0 +1,132 @@
+import pandas as pd
+import pytest
+import datetime
+from test.globals import *
+
+from src.transactions import Split, Transaction, TransactionHistory, TransactionFinder, DuplicateError, SALE, PURCHASE, SPLIT
+from src.columnar import ColumnarTransactionHistory
+from src.stats import Statistics
+
+
+def make_transaction(tx_type, date=DATE, quantity=QUANTITY, time=TIME, tx_currency=TX_CURRENCY):
+    return Transaction(
+        type= tx_type,
+        date= date,
+        quantity= quantity,
+        unit_price= UNIT_PRICE,
+        closing_costs= CLOSING_COSTS,
+        tx_currency= tx_currency,
+        exch_rate= EXCH_RATE,
+        target_currency= TARGET_CURRENCY,
+        time= time,
+    )
+
+
+@pytest.fixture
+def histories():
+    # the same records, stored in both storage engines
+    records = [
+        make_transaction(PURCHASE, quantity=QUANTITY * 10),
+        make_transaction(PURCHASE, time=datetime.time(hour=14, minute=12), tx_currency="USD"),
+        make_transaction(SALE, time=datetime.time(hour=15)),
+        make_transaction(SALE, date=DATE + datetime.timedelta(days=366)),
+        Split(date= DATE + datetime.timedelta(days=1), ratio= RATIO),
+    ]
+    tx_history = TransactionHistory()
+    columnar_history = ColumnarTransactionHistory()
+    for history in [tx_history, columnar_history]:
+        for record in records:
+            if record.type == PURCHASE:
+                history.add_purchase(record)
+            elif record.type == SALE:
+                history.add_sale(record)
+            else:
+                history.add_split(record)
+    return tx_history, columnar_history
+
+
+class TestColumnarTransactionHistory:
+
+    def test_len(self, histories):
+        tx_history, columnar_history = histories
+        assert len(columnar_history) == len(tx_history) == 5
+
+    def test_grow(self):
+        columnar_history = ColumnarTransactionHistory()
+        for day in range(3000):
+            columnar_history.add_purchase(make_transaction(PURCHASE, date=DATE + datetime.timedelta(days=day)))
+        assert len(columnar_history) == 3000
+        assert len(columnar_history.on(DATE + datetime.timedelta(days=2999))) == 1
+
+    def test_no_duplicate(self, histories):
+        _, columnar_history = histories
+        with pytest.raises(DuplicateError):
+            columnar_history.add_purchase(make_transaction(PURCHASE, quantity=QUANTITY * 10))
+
+    def test_remove(self, histories):
+        _, columnar_history = histories
+        columnar_history.remove_sale(make_transaction(SALE, time=datetime.time(hour=15)))
+        assert len(columnar_history) == 4
+
+        with pytest.raises(KeyError):
+            columnar_history.remove_sale(make_transaction(SALE, time=datetime.time(hour=15)))
+
+    def test_iter_chronological(self, histories):
+        tx_history, columnar_history = histories
+        assert list(columnar_history.iter_chronological()) == list(tx_history.iter_chronological())
+
+    def test_finder(self, histories):
+        _, columnar_history = histories
+        finder = TransactionFinder(tx_history=columnar_history, tx_type=PURCHASE)
+        assert len(finder.with_year(2024).find_all()) == 2
+        assert len(finder.reset().with_tx_currency("USD").find_all()) == 1
+
+    def test_get_data_for_statistics(self, histories):
+        _, columnar_history = histories
+        inputs = columnar_history.get_data_for_statistics()
+        assert list(inputs[PURCHASE].columns) == Transaction.columns()
+        assert list(inputs[SPLIT].columns) == Split.columns()
+        assert list(inputs[PURCHASE]["tx_currency"]) == [TX_CURRENCY, "USD"]
+        assert inputs[SALE]["time"].iloc[0] == pd.Timedelta(hours=15)
+
+    def test_same_statistics(self, histories):
+        tx_history, columnar_history = histories
+        expected = Statistics()
+        expected.recalculate_statistics(tx_history.get_data_for_statistics())
+        actual = Statistics()
+        actual.recalculate_statistics(columnar_history.get_data_for_statistics())
+
+        assert list(actual.full_history()["ACB"]) == pytest.approx(list(expected.full_history()["ACB"]))
+        assert actual.total_capital_gains_for(2025) == pytest.approx(expected.total_capital_gains_for(2025))
+
+
+class TestColumnarAddMany:
+
+    def test_add_many_matches_single_inserts(self, histories):
+        tx_history, _ = histories
+        columnar_history = ColumnarTransactionHistory()
+        columnar_history.add_many(tx_history.iter_chronological())
+
+        assert len(columnar_history) == 5
+        assert list(columnar_history.iter_chronological()) == list(tx_history.iter_chronological())
+
+    def test_add_many_duplicate_with_existing(self, histories):
+        tx_history, columnar_history = histories
+        with pytest.raises(DuplicateError):
+            columnar_history.add_many([make_transaction(SALE, date=DATE + datetime.timedelta(days=10)), make_transaction(PURCHASE, quantity=QUANTITY * 10)])
+        assert len(columnar_history) == 5
+
+    def test_add_many_then_single_duplicate(self):
+        columnar_history = ColumnarTransactionHistory()
+        columnar_history.add_many([make_transaction(PURCHASE)])
+        with pytest.raises(DuplicateError):
+            columnar_history.add_purchase(make_transaction(PURCHASE))
+
+
+class TestColumnarRemoveAll:
+
+    def test_finder_delete(self, histories):
+        _, columnar_history = histories
+        assert TransactionFinder(tx_history=columnar_history, tx_type=SALE).delete() == 2
+        assert len(columnar_history) == 3
+        assert list(columnar_history.iter_chronological(SALE)) == []
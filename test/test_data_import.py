@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+import datetime
+from test.globals import *
+
+from src.asset import Asset
+from src.data_import import DataImportFromEquate, AsyncDataImportFromEquate, parse_equate_statement
+from src.fx import FXRateStore
+from src.transactions import SALE, PURCHASE, SPLIT, DuplicateError
+
+HEADER = "Date,Time,Transaction Type,Quantity,Price,Fees,Currency,Exchange Rate,Split Ratio\n"
+
+
+@pytest.fixture
+def statements(tmp_path) -> list[str]:
+    contents = [
+        HEADER
+        + "2024-01-01,,Purchase,10,100,1,EUR,1.5,\n"
+        + "2024-01-01,,Cash Dividend,,,,EUR,1.5,\n"
+        + "2024-01-15,10:30:00,Sell,-4,110,1,EUR,1.5,\n",
+        HEADER
+        + "2024-02-01,,Dividend Reinvestment,0.5,105,0,EUR,1.5,\n"
+        + "2024-02-10,,Split,,,,,,2\n",
+        HEADER
+        + "2024-03-01,,Sale,2,60,0,EUR,1.5,\n",
+    ]
+    filepaths = []
+    for i, content in enumerate(contents):
+        filepath = tmp_path / f"statement_{i}.csv"
+        filepath.write_text(content)
+        filepaths.append(str(filepath))
+    return filepaths
+
+
+class TestDataImportFromEquate:
+
+    def test_parse_statement(self, statements):
+        records = list(parse_equate_statement(statements[0]))
+
+        assert [record["type"] for record in records] == [PURCHASE, SALE]
+        assert records[1]["quantity"] == 4
+        assert records[1]["time"] == datetime.time(10, 30)
+        assert records[0]["target_currency"] == 'CAD'
+
+    def test_import_single_statement(self, statements):
+        asset = Asset(NAME)
+        DataImportFromEquate(asset, statements[0]).import_data()
+
+        assert len(asset._tx_history) == 2
+        assert asset._statistics_up_to_date == False
+
+    def test_import_parallel(self, statements):
+        asset = Asset(NAME)
+        DataImportFromEquate(asset, list(reversed(statements)), max_workers=2).import_data()
+
+        items = list(asset._tx_history.iter_chronological())
+        assert [item.type for item in items] == [PURCHASE, SALE, PURCHASE, SPLIT, SALE]
+        assert items[3].ratio == 2
+
+    def test_import_same_as_serial(self, statements):
+        serial = Asset(NAME)
+        DataImportFromEquate(serial, statements, max_workers=1).import_data()
+        parallel = Asset(NAME)
+        DataImportFromEquate(parallel, statements, max_workers=3).import_data()
+
+        assert list(serial._tx_history.iter_chronological()) == list(parallel._tx_history.iter_chronological())
+
+    def test_missing_exchange_rates_resolved(self, tmp_path):
+        filepath = tmp_path / "statement.csv"
+        filepath.write_text(HEADER + "2024-01-03,,Purchase,10,100,1,USD,,\n2024-01-04,,Purchase,10,100,1,CAD,,\n")
+        fx_rates = FXRateStore()
+        fx_rates.add_rates("USD", "CAD", [datetime.date(2024, 1, 2)], [1.33])
+        asset = Asset(NAME, fx_rates=fx_rates)
+        DataImportFromEquate(asset, str(filepath)).import_data()
+
+        assert [purchase.exch_rate for purchase in asset._tx_history.iter_chronological()] == [1.33, 1]
+
+
+class TestAsyncDataImportFromEquate:
+
+    @pytest.mark.parametrize("processes", [False, True])
+    def test_same_as_sync_import(self, statements, processes):
+        expected = Asset(NAME)
+        DataImportFromEquate(expected, statements).import_data()
+        asset = Asset(NAME)
+        progress = AsyncDataImportFromEquate(asset, list(reversed(statements)), max_readers=2, processes=processes, max_workers=2).import_data()
+
+        assert list(asset._tx_history.iter_chronological()) == list(expected._tx_history.iter_chronological())
+        assert (progress.files_total, progress.files_parsed, progress.records_parsed, progress.records_written) == (3, 3, 5, 5)
+        assert asset._statistics_up_to_date == False
+
+    def test_drop_folder(self, statements, tmp_path):
+        asset = Asset(NAME)
+        AsyncDataImportFromEquate(asset, [str(tmp_path)]).import_data()
+        assert len(asset._tx_history) == 5
+
+    def test_batches_and_progress(self, statements):
+        # with a queue of one statement, readers wait for the writer
+        reports = []
+        asset = Asset(NAME)
+        progress = AsyncDataImportFromEquate(asset, statements, max_readers=1, queue_size=1, batch_size=2,
+                                  on_progress=lambda progress: reports.append((progress.files_parsed, progress.records_written))).import_data()
+
+        assert len(asset._tx_history) == 5
+        assert reports[-1] == (3, 5)
+        assert [written for _, written in reports] == sorted(written for _, written in reports)
+        assert progress.batches_written == 3  # statements of 2, 2 and 1 records
+
+    def test_failure_stops_the_pipeline(self, statements):
+        asset = Asset(NAME)
+        with pytest.raises(DuplicateError):
+            AsyncDataImportFromEquate(asset, statements + [statements[0]], max_readers=1, batch_size=1).import_data()
+        assert 0 < len(asset._tx_history) < 7
+
+    def test_parse_error(self, statements, tmp_path):
+        invalid = tmp_path / "invalid.txt"
+        invalid.write_text(HEADER + "not a date,,Purchase,10,100,1,EUR,1.5,\n")
+        with pytest.raises(ValueError):
+            AsyncDataImportFromEquate(Asset(NAME), statements + [str(invalid)]).import_data()
+
+    def test_cancel(self, statements):
+        asset = Asset(NAME)
+
+        async def run():
+            task = None
+            def on_progress(progress):
+                if progress.records_written > 0:
+                    task.cancel()
+            pipeline = AsyncDataImportFromEquate(asset, statements, max_readers=1, queue_size=1, batch_size=1, on_progress=on_progress)
+            task = asyncio.ensure_future(pipeline.import_data_async())
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # the readers are stopped with the writer
+            assert [t for t in asyncio.all_tasks() if t is not asyncio.current_task()] == []
+
+        asyncio.run(run())
+        assert 0 < len(asset._tx_history) < 5
@@ -0,0 +1,210 @@
+import numpy as np
+import pytest
+import datetime
+from test.globals import *
+
+from src.asset import Asset
+from src.columnar import ColumnarTransactionHistory
+from src.file_manager import CSVFileManager, NumpyFileManager, JournalFileManager
+from src.transactions import Split, DuplicateError, PURCHASE
+
+
+@pytest.fixture
+def asset() -> Asset:
+    asset = Asset(NAME)
+    for day in range(5):
+        asset.purchase(DATE + datetime.timedelta(days=day), QUANTITY * 2, UNIT_PRICE + day, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        asset.sell(DATE + datetime.timedelta(days=day), QUANTITY, UNIT_PRICE, CLOSING_COSTS, "USD", 1.25, TARGET_CURRENCY, time=datetime.time(hour=10, minute=30, microsecond=5))
+    asset._tx_history.add_split(Split(date= DATE + datetime.timedelta(days=2), ratio= RATIO))
+    return asset
+
+
+class TestCSVFileManager:
+
+    def test_save_load_roundtrip(self, asset, tmp_path):
+        filepath = str(tmp_path / "history.csv")
+        CSVFileManager(asset, output_filepath=filepath, chunk_size=3).save_history()
+
+        loaded = Asset(NAME)
+        CSVFileManager(loaded, input_filepath=filepath, chunk_size=3).load_history()
+
+        assert len(loaded._tx_history) == len(asset._tx_history) == 11
+        assert list(loaded._tx_history.iter_chronological()) == list(asset._tx_history.iter_chronological())
+        assert loaded._statistics_up_to_date == False
+
+    def test_roundtrip_exact_floats(self, tmp_path):
+        # prices that the default float parser of pandas reads back 1 ulp off
+        asset = Asset(NAME)
+        asset.purchase(DATE, QUANTITY, 950.4636963259353, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        filepath = str(tmp_path / "history.csv")
+        CSVFileManager(asset, output_filepath=filepath).save_history()
+
+        loaded = Asset(NAME)
+        CSVFileManager(loaded, input_filepath=filepath).load_history()
+        assert list(loaded._tx_history.iter_chronological()) == list(asset._tx_history.iter_chronological())
+
+        # so that a re-imported trade is still a duplicate
+        with pytest.raises(DuplicateError):
+            loaded.purchase(DATE, QUANTITY, 950.4636963259353, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+
+    def test_load_duplicates(self, asset, tmp_path):
+        filepath = str(tmp_path / "history.csv")
+        CSVFileManager(asset, output_filepath=filepath).save_history()
+
+        with pytest.raises(DuplicateError):
+            CSVFileManager(asset, input_filepath=filepath).load_history()
+
+    def test_no_filepath(self, asset):
+        with pytest.raises(ValueError):
+            CSVFileManager(asset).save_history()
+        with pytest.raises(ValueError):
+            CSVFileManager(asset).load_history()
+
+
+class TestNumpyFileManager:
+
+    def test_save_load_roundtrip(self, asset, tmp_path):
+        directory = str(tmp_path / "history")
+        NumpyFileManager(asset, output_filepath=directory).save_history()
+
+        loaded = Asset(NAME, ColumnarTransactionHistory())
+        NumpyFileManager(loaded, input_filepath=directory).load_history()
+
+        assert isinstance(loaded._tx_history._timestamp, np.memmap)
+        assert list(loaded._tx_history.iter_chronological()) == list(asset._tx_history.iter_chronological())
+        assert loaded.statistics().total_capital_gains_for(DATE.year) == pytest.approx(asset.statistics().total_capital_gains_for(DATE.year))
+
+    def test_modify_after_load(self, asset, tmp_path):
+        directory = str(tmp_path / "history")
+        NumpyFileManager(asset, output_filepath=directory).save_history()
+
+        loaded = Asset(NAME, ColumnarTransactionHistory())
+        NumpyFileManager(loaded, input_filepath=directory).load_history()
+        with pytest.raises(DuplicateError):
+            loaded.purchase(DATE, QUANTITY * 2, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        loaded.purchase(DATE, QUANTITY * 3, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        loaded.sell(DATE, QUANTITY * 2, UNIT_PRICE, CLOSING_COSTS, "USD", 1.25, TARGET_CURRENCY, time=datetime.time(hour=10, minute=30, microsecond=5))
+
+        assert len(loaded._tx_history) == 13
+
+        # the file itself is left untouched (copy-on-write)
+        reloaded = Asset(NAME, ColumnarTransactionHistory())
+        NumpyFileManager(reloaded, input_filepath=directory).load_history()
+        assert len(reloaded._tx_history) == 11
+
+    def test_load_into_object_history(self, asset, tmp_path):
+        directory = str(tmp_path / "history")
+        NumpyFileManager(asset, output_filepath=directory).save_history()
+
+        loaded = Asset(NAME)
+        NumpyFileManager(loaded, input_filepath=directory).load_history()
+        assert list(loaded._tx_history.iter_chronological()) == list(asset._tx_history.iter_chronological())
+
+
+class TestJournalFileManager:
+
+    def test_save_load_roundtrip(self, asset, tmp_path):
+        directory = str(tmp_path / "journal")
+        JournalFileManager(asset, output_filepath=directory).save_history()
+
+        loaded = Asset(NAME)
+        JournalFileManager(loaded, input_filepath=directory).load_history()
+        assert list(loaded._tx_history.iter_chronological()) == list(asset._tx_history.iter_chronological())
+        assert loaded._statistics_up_to_date == False
+
+    @pytest.mark.parametrize("tx_history", [None, ColumnarTransactionHistory])
+    def test_saves_append_changes(self, asset, tmp_path, tx_history):
+        directory = str(tmp_path / "journal")
+        JournalFileManager(asset, output_filepath=directory).save_history()
+
+        session = Asset(NAME, tx_history() if tx_history else None)
+        file_manager = JournalFileManager(session, input_filepath=directory, output_filepath=directory)
+        file_manager.load_history()
+        snapshot = (tmp_path / "journal" / "snapshot-0.csv").read_text()
+
+        session.purchase(DATE, QUANTITY * 7, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        session._tx_history.add_split(Split(date= DATE + datetime.timedelta(days=10), ratio= RATIO))
+        file_manager.save_history()
+        session._tx_history.remove_all([obj for obj in session._tx_history.iter_chronological() if obj.type == PURCHASE and obj.quantity == QUANTITY * 2])
+        file_manager.save_history()
+
+        # the snapshot is left untouched, the journal holds one row per operation
+        assert (tmp_path / "journal" / "snapshot-0.csv").read_text() == snapshot
+        assert len((tmp_path / "journal" / "journal-0.csv").read_text().splitlines()) == 1 + 2 + 5
+
+        reloaded = Asset(NAME)
+        JournalFileManager(reloaded, input_filepath=directory).load_history()
+        assert list(reloaded._tx_history.iter_chronological()) == list(session._tx_history.iter_chronological())
+        assert len(reloaded._tx_history) == 8
+
+    def test_remove_after_snapshot(self, tmp_path):
+        # the journaled removals must match the records loaded from the snapshot exactly, whatever their prices
+        rng = np.random.default_rng(0)
+        asset = Asset(NAME)
+        for day in range(20):
+            asset.purchase(DATE + datetime.timedelta(days=day), QUANTITY, float(rng.uniform(1, 1000)), CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        directory = str(tmp_path / "journal")
+        file_manager = JournalFileManager(asset, output_filepath=directory)
+        file_manager.save_history()
+        asset._tx_history.remove_all(list(asset._tx_history.iter_chronological())[:3])
+        file_manager.save_history()
+
+        loaded = Asset(NAME)
+        JournalFileManager(loaded, input_filepath=directory).load_history()
+        assert list(loaded._tx_history.iter_chronological()) == list(asset._tx_history.iter_chronological())
+        assert len(loaded._tx_history) == 17
+
+    def test_compaction(self, asset, tmp_path):
+        directory = str(tmp_path / "journal")
+        file_manager = JournalFileManager(asset, output_filepath=directory, compact_threshold=2, fsync=False)
+        file_manager.save_history()
+        for day in range(3):
+            asset.purchase(DATE + datetime.timedelta(days=day), QUANTITY * 9, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+            file_manager.save_history()
+
+        # the third save found 2 journaled operations, and wrote a new snapshot instead
+        assert sorted(path.name for path in (tmp_path / "journal").iterdir()) == ["journal-1.csv", "snapshot-1.csv"]
+        loaded = Asset(NAME)
+        JournalFileManager(loaded, input_filepath=directory).load_history()
+        assert set(loaded._tx_history.iter_chronological()) == set(asset._tx_history.iter_chronological())
+
+    def test_torn_last_line(self, asset, tmp_path):
+        directory = str(tmp_path / "journal")
+        file_manager = JournalFileManager(asset, output_filepath=directory)
+        file_manager.save_history()
+        expected = list(asset._tx_history.iter_chronological())
+        asset.purchase(DATE, QUANTITY * 9, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        file_manager.save_history()
+
+        journal = tmp_path / "journal" / "journal-0.csv"
+        journal.write_bytes(journal.read_bytes()[:-10])
+        loaded = Asset(NAME)
+        file_manager = JournalFileManager(loaded, input_filepath=directory, output_filepath=directory)
+        file_manager.load_history()
+        assert list(loaded._tx_history.iter_chronological()) == expected
+
+        # later saves append after the last complete line
+        loaded.purchase(DATE, QUANTITY * 8, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        file_manager.save_history()
+        reloaded = Asset(NAME)
+        JournalFileManager(reloaded, input_filepath=directory).load_history()
+        assert len(reloaded._tx_history) == len(expected) + 1
+
+    def test_first_save_writes_snapshot(self, asset, tmp_path):
+        # changes made before the manager existed are not in the journal, so the first save rewrites the snapshot
+        directory = str(tmp_path / "journal")
+        JournalFileManager(asset, output_filepath=directory).save_history()
+        asset.purchase(DATE, QUANTITY * 9, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        JournalFileManager(asset, output_filepath=directory).save_history()
+
+        loaded = Asset(NAME)
+        JournalFileManager(loaded, input_filepath=directory).load_history()
+        assert len(loaded._tx_history) == 12
+
+    def test_no_filepath(self, asset, tmp_path):
+        with pytest.raises(ValueError):
+            JournalFileManager(asset).save_history()
+        with pytest.raises(ValueError):
+            JournalFileManager(asset).load_history()
+        with pytest.raises(FileNotFoundError):
+            JournalFileManager(asset, input_filepath=str(tmp_path)).load_history()
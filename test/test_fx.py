@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import datetime
+from test.globals import *
+
+from src.asset import Asset
+from src.fx import FXRateStore, MissingRateError
+
+BANK_OF_CANADA_CSV = (
+    '"SERIES"\n'
+    '"FXUSDCAD","US dollar to Canadian dollar daily exchange rate"\n'
+    '\n'
+    '"OBSERVATIONS"\n'
+    '"date","FXUSDCAD","FXEURCAD"\n'
+    '"2024-01-02","1.3316","1.4565"\n'
+    '"2024-01-03","1.3368",""\n'
+    '"2024-01-05","1.3378","1.4620"\n'
+)
+
+
+@pytest.fixture
+def fx_rates(tmp_path) -> FXRateStore:
+    filepath = tmp_path / "rates.csv"
+    filepath.write_text(BANK_OF_CANADA_CSV)
+    return FXRateStore.from_csv(str(filepath))
+
+
+class TestFXRateStore:
+
+    def test_load_bank_of_canada(self, fx_rates):
+        assert sorted(fx_rates.pairs()) == [("EUR", "CAD"), ("USD", "CAD")]
+        assert fx_rates.rate("USD", "CAD", datetime.date(2024, 1, 3)) == 1.3368
+
+    def test_as_of(self, fx_rates):
+        # no rate on the 4th (nor for EUR on the 3rd): the last known rate applies
+        assert fx_rates.rate("USD", "CAD", datetime.date(2024, 1, 4)) == 1.3368
+        assert fx_rates.rate("EUR", "CAD", datetime.date(2024, 1, 4)) == 1.4565
+        with pytest.raises(MissingRateError):
+            fx_rates.rate("USD", "CAD", datetime.date(2024, 1, 1))
+
+    def test_inverse_and_same_currency(self, fx_rates):
+        assert fx_rates.rate("CAD", "USD", datetime.date(2024, 1, 2)) == pytest.approx(1 / 1.3316)
+        assert fx_rates.rate("GBP", "GBP", datetime.date(2024, 1, 2)) == 1
+        with pytest.raises(MissingRateError):
+            fx_rates.rate("GBP", "CAD", datetime.date(2024, 1, 2))
+
+    def test_rates_vectorized(self, fx_rates):
+        rates = fx_rates.rates(
+            ["USD", "EUR", "CAD", "USD"],
+            ["CAD", "CAD", "CAD", "CAD"],
+            [datetime.date(2024, 1, 2), datetime.date(2024, 1, 6), datetime.date(2024, 1, 6), datetime.date(2024, 1, 31)],
+        )
+        assert list(rates) == [1.3316, 1.4620, 1, 1.3378]
+
+    def test_add_rates_replaces_existing(self, fx_rates):
+        fx_rates.add_rates("USD", "CAD", [datetime.date(2024, 1, 3)], [1.5])
+        assert fx_rates.rate("USD", "CAD", datetime.date(2024, 1, 3)) == 1.5
+        assert fx_rates.rate("USD", "CAD", datetime.date(2024, 1, 2)) == 1.3316
+
+    def test_long_format(self, tmp_path):
+        filepath = tmp_path / "rates.csv"
+        filepath.write_text("date,from_currency,to_currency,rate\n2024-01-02,USD,CAD,1.33\n2024-01-02,EUR,USD,1.09\n")
+        fx_rates = FXRateStore.from_csv(str(filepath))
+        assert fx_rates.rate("EUR", "USD", datetime.date(2024, 1, 3)) == 1.09
+
+
+class TestAssetExchangeRates:
+
+    def test_purchase_without_exch_rate(self, fx_rates):
+        asset = Asset(NAME, fx_rates=fx_rates)
+        asset.purchase(date= datetime.date(2024, 1, 4), quantity= QUANTITY, unit_price= UNIT_PRICE, closing_costs= CLOSING_COSTS, tx_currency= 'USD')
+
+        purchase = next(asset._tx_history.iter_chronological())
+        assert purchase.exch_rate == 1.3368
+        assert purchase.target_currency == 'CAD'
+
+    def test_purchase_without_fx_rates(self):
+        asset = Asset(NAME)
+        with pytest.raises(MissingRateError):
+            asset.purchase(date= DATE, quantity= QUANTITY, unit_price= UNIT_PRICE, closing_costs= CLOSING_COSTS, tx_currency= 'USD', target_currency= TARGET_CURRENCY)
+        asset.purchase(date= DATE, quantity= QUANTITY, unit_price= UNIT_PRICE, closing_costs= CLOSING_COSTS, tx_currency= 'CAD', target_currency= 'CAD')
+        assert next(asset._tx_history.iter_chronological()).exch_rate == 1
+
+    def test_purchase_many_resolves_missing_rates(self, fx_rates):
+        asset = Asset(NAME, fx_rates=fx_rates)
+        asset.purchase_many({
+            "date": [datetime.date(2024, 1, 2), datetime.date(2024, 1, 3), datetime.date(2024, 1, 5)],
+            "quantity": [QUANTITY] * 3,
+            "unit_price": [UNIT_PRICE] * 3,
+            "closing_costs": [CLOSING_COSTS] * 3,
+            "tx_currency": ['USD', 'EUR', 'USD'],
+            "exch_rate": [None, None, EXCH_RATE],
+        })
+
+        assert [purchase.exch_rate for purchase in asset._tx_history.iter_chronological()] == [1.3316, 1.4565, EXCH_RATE]
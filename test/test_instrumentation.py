@@ -0,0 +1,102 @@
+import json
+import pytest
+from test.globals import *
+
+from src import instrumentation
+from src.asset import Stock
+from src.columnar import ColumnarTransactionHistory
+from src.instrumentation import Metrics, profiling
+from src.transactions import TransactionFinder, PURCHASE
+
+
+@pytest.fixture
+def enabled():
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+
+
+def make_stock(tx_history=None) -> Stock:
+    stock = Stock(NAME, tx_history)
+    stock.purchase(date= DATE, quantity= QUANTITY, unit_price= UNIT_PRICE, closing_costs= CLOSING_COSTS,
+                   tx_currency= TX_CURRENCY, exch_rate= EXCH_RATE, target_currency= TARGET_CURRENCY)
+    stock.sell(date= DATE, time= time(hour=1), quantity= QUANTITY, unit_price= UNIT_PRICE, closing_costs= CLOSING_COSTS,
+               tx_currency= TX_CURRENCY, exch_rate= EXCH_RATE, target_currency= TARGET_CURRENCY)
+    return stock
+
+
+class TestMetrics:
+
+    def test_disabled_by_default(self):
+        stock = make_stock()
+        stock.statistics()
+        assert stock.metrics().to_dict() == {}
+
+    def test_records_operations(self, enabled):
+        stock = make_stock()
+        stock.statistics()
+        TransactionFinder(stock._tx_history, PURCHASE).with_year(DATE.year).find_all()
+
+        metrics = stock.metrics().to_dict()
+        assert metrics["add_purchase"]["calls"] == 1
+        assert metrics["add_sale"]["calls"] == 1
+        assert metrics["find_all"]["calls"] == 1
+        assert metrics["get_arrays_for_statistics"]["calls"] == 1
+        for phase in ("sort", "scan", "aggregate", "materialize"):
+            assert metrics[phase]["calls"] == 1
+            assert metrics[phase]["wall_time"] >= 0
+
+        stock.reset_metrics()
+        assert stock.metrics().to_dict() == {}
+
+    def test_columnar_storage(self, enabled):
+        stock = make_stock(ColumnarTransactionHistory())
+        assert stock.metrics().to_dict()["add_purchase"]["calls"] == 1
+
+    def test_dump(self, enabled, tmp_path):
+        stock = make_stock()
+        filepath = tmp_path / "metrics.json"
+        stock.metrics().dump(filepath)
+        assert json.loads(filepath.read_text())["add_sale"]["calls"] == 1
+
+    def test_merge(self):
+        first, second = Metrics(), Metrics()
+        first.record("scan", 1.0)
+        second.record("scan", 2.0, 10)
+        assert first.merge(second).to_dict() == {"scan": {"calls": 2, "wall_time": 3.0, "allocated_bytes": 10}}
+
+
+class TestProfiling:
+
+    def test_cprofile(self, monkeypatch, tmp_path):
+        filepath = tmp_path / "run.prof"
+        monkeypatch.setenv(instrumentation.PROFILE_ENV_VAR, f"cprofile:{filepath}")
+        with profiling():
+            make_stock().statistics()
+        assert filepath.exists()
+
+    def test_cprofile_report(self, monkeypatch, capsys):
+        # the top functions go to stderr, apart from the output of the program
+        monkeypatch.setenv(instrumentation.PROFILE_ENV_VAR, "cprofile")
+        with profiling():
+            make_stock().statistics()
+        output = capsys.readouterr()
+        assert output.out == ""
+        assert "recalculate_statistics" in output.err
+        assert len(output.err.splitlines()) < instrumentation.CPROFILE_TOP + 20
+
+    def test_tracemalloc(self, monkeypatch, tmp_path):
+        filepath = tmp_path / "allocations.txt"
+        monkeypatch.setenv(instrumentation.PROFILE_ENV_VAR, f"tracemalloc:{filepath}")
+        with profiling():
+            stock = make_stock()
+            stock.statistics()
+        assert filepath.read_text() != ""
+        assert stock.metrics().to_dict()["recalculate_statistics"]["allocated_bytes"] > 0
+        assert not instrumentation.is_enabled()
+
+    def test_invalid_setting(self, monkeypatch):
+        monkeypatch.setenv(instrumentation.PROFILE_ENV_VAR, "perf")
+        with pytest.raises(ValueError):
+            with profiling():
+                pass
@@ -0,0 +1,89 @@
+import pytest
+import datetime
+import os
+from test.globals import *
+
+from src.asset import Asset, StockFactory, RealEstateFactory
+from src.portfolio import Portfolio
+from src.stats import Statistics
+
+
+def make_asset(name: str, gain_per_share: float) -> Asset:
+    asset = Asset(name)
+    asset.purchase(DATE, QUANTITY * 10, UNIT_PRICE, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+    asset.sell(DATE + datetime.timedelta(days=1), QUANTITY, UNIT_PRICE + gain_per_share, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+    asset.sell(DATE + datetime.timedelta(days=366), QUANTITY, UNIT_PRICE + gain_per_share, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+    return asset
+
+
+class TestPortfolio:
+
+    def test_capital_gains_by_year(self):
+        portfolio = Portfolio([make_asset(NAME, 1), make_asset(NAME + '_', 2), Asset(NAME + '__')])
+        totals = portfolio.capital_gains_by_year(max_workers=2)
+
+        assert totals == {2024: pytest.approx(3 * QUANTITY * EXCH_RATE), 2025: pytest.approx(3 * QUANTITY * EXCH_RATE)}
+
+    def test_refresh_skips_up_to_date_assets(self):
+        assets = [make_asset(NAME, 1), make_asset(NAME + '_', 2)]
+        portfolio = Portfolio(assets)
+
+        assert portfolio.refresh_statistics(max_workers=2) == 2
+        assert portfolio.refresh_statistics(max_workers=2) == 0
+
+        assets[0].sell(DATE + datetime.timedelta(days=400), QUANTITY, UNIT_PRICE, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert portfolio.stale_assets() == [assets[0]]
+        assert portfolio.refresh_statistics() == 1
+        assert assets[0].statistics().total_capital_gains_for(2025) == pytest.approx(QUANTITY * EXCH_RATE)
+
+    def test_incremental_update(self, monkeypatch):
+        # an asset that already has statistics only replays the events from its earliest change
+        asset = make_asset(NAME, 1)
+        portfolio = Portfolio([asset, make_asset(NAME + '_', 2)])
+        portfolio.refresh_statistics(max_workers=2)
+
+        monkeypatch.setattr(Statistics, "recalculate_statistics", lambda *args: pytest.fail("statistics were recomputed"))
+        asset.sell(DATE + datetime.timedelta(days=400), QUANTITY, UNIT_PRICE, 0, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert portfolio.refresh_statistics(max_workers=2) == 1
+        assert portfolio.stale_assets() == []
+        assert asset.statistics().total_capital_gains_for(2025) == pytest.approx(QUANTITY * EXCH_RATE)
+
+    def test_same_as_serial(self):
+        parallel = Portfolio([make_asset(NAME, 1), make_asset(NAME + '_', 2)])
+        serial = Portfolio([make_asset(NAME, 1), make_asset(NAME + '_', 2)])
+        assert parallel.capital_gains_by_year(max_workers=2) == serial.capital_gains_by_year(max_workers=1)
+
+    def test_from_factories(self):
+        # separate registries, so that the assets of other tests are not affected
+        class TestStockFactory(StockFactory):
+            _assets = {}
+
+        class TestRealEstateFactory(RealEstateFactory):
+            _assets = {}
+
+        stock = TestStockFactory.get_instance(NAME)
+        real_estate = TestRealEstateFactory.get_instance(NAME)
+        portfolio = Portfolio.from_factories(TestStockFactory, TestRealEstateFactory)
+
+        assert portfolio._assets == [stock, real_estate]
+
+    def test_keeps_statistics_metrics(self):
+        asset = make_asset(NAME, 1)
+        asset._statistics._metrics.record("scan", 1.0)
+        Portfolio([asset]).refresh_statistics()
+
+        assert asset.metrics().to_dict()["scan"]["calls"] == 1
+        assert asset.statistics().total_capital_gains_for(2024) == pytest.approx(QUANTITY * EXCH_RATE)
+
+    def test_uses_statistics_cache(self, tmp_path, monkeypatch):
+        filepath = str(tmp_path / "statistics.npz")
+        asset = make_asset(NAME, 1)
+        asset.set_statistics_cache(filepath)
+        Portfolio([asset]).refresh_statistics()
+        assert os.path.exists(filepath)
+
+        # same history: loaded from the cache, by the portfolio as well as by the asset itself
+        monkeypatch.setattr(Statistics, "recalculate_statistics", lambda *args: pytest.fail("statistics were recomputed"))
+        asset = make_asset(NAME, 1)
+        asset.set_statistics_cache(filepath)
+        assert Portfolio([asset]).capital_gains_by_year() == {2024: pytest.approx(QUANTITY * EXCH_RATE), 2025: pytest.approx(QUANTITY * EXCH_RATE)}
@@ -0,0 +1,183 @@
+import pandas as pd
+import pytest
+import datetime
+from test.globals import *
+
+from src.asset import Stock
+from src.transactions import Split, Transaction, TransactionHistory, TransactionFinder, DuplicateError, SALE, PURCHASE, SPLIT
+from src.sqlite_history import SQLiteTransactionHistory
+from src.stats import Statistics
+from test.test_columnar import make_transaction
+
+
+@pytest.fixture
+def histories():
+    # the same records, stored in both storage engines
+    records = [
+        make_transaction(PURCHASE, quantity=QUANTITY * 10),
+        make_transaction(PURCHASE, time=datetime.time(hour=14, minute=12), tx_currency="USD"),
+        make_transaction(SALE, time=datetime.time(hour=15)),
+        make_transaction(SALE, date=DATE + datetime.timedelta(days=366)),
+        Split(date= DATE + datetime.timedelta(days=1), ratio= RATIO),
+    ]
+    tx_history = TransactionHistory()
+    sqlite_history = SQLiteTransactionHistory(chunk_size=2)
+    for history in [tx_history, sqlite_history]:
+        for record in records:
+            if record.type == PURCHASE:
+                history.add_purchase(record)
+            elif record.type == SALE:
+                history.add_sale(record)
+            else:
+                history.add_split(record)
+    return tx_history, sqlite_history
+
+
+class TestSQLiteTransactionHistory:
+
+    def test_len(self, histories):
+        tx_history, sqlite_history = histories
+        assert len(sqlite_history) == len(tx_history) == 5
+
+    def test_no_duplicate(self, histories):
+        _, sqlite_history = histories
+        with pytest.raises(DuplicateError):
+            sqlite_history.add_purchase(make_transaction(PURCHASE, quantity=QUANTITY * 10))
+        with pytest.raises(DuplicateError):
+            sqlite_history.add_split(Split(date= DATE + datetime.timedelta(days=1), ratio= RATIO))
+        assert len(sqlite_history) == 5
+
+    def test_remove(self, histories):
+        _, sqlite_history = histories
+        sqlite_history.remove_sale(make_transaction(SALE, time=datetime.time(hour=15)))
+        assert len(sqlite_history) == 4
+
+        with pytest.raises(KeyError):
+            sqlite_history.remove_sale(make_transaction(SALE, time=datetime.time(hour=15)))
+
+    def test_iter_chronological(self, histories):
+        tx_history, sqlite_history = histories
+        assert list(sqlite_history.iter_chronological()) == list(tx_history.iter_chronological())
+        assert list(sqlite_history.iter_chronological(SALE)) == list(tx_history.iter_chronological(SALE))
+
+    def test_reopen(self, tmp_path):
+        filepath = str(tmp_path / "history.db")
+        sqlite_history = SQLiteTransactionHistory(filepath)
+        sqlite_history.add_purchase(make_transaction(PURCHASE))
+        sqlite_history.close()
+
+        reopened = SQLiteTransactionHistory(filepath)
+        assert len(reopened) == 1
+        assert reopened.dirty_since() == (DATE, TIME)
+
+    def test_digest(self, histories, tmp_path):
+        tx_history, sqlite_history = histories
+        assert sqlite_history.digest() == tx_history.digest()
+
+        # stored until the next change, and kept when the database is reopened
+        filepath = str(tmp_path / "history.db")
+        sqlite_history = SQLiteTransactionHistory(filepath)
+        sqlite_history.add_many(list(tx_history.iter_chronological()))
+        expected = sqlite_history.digest()
+        sqlite_history.close()
+        reopened = SQLiteTransactionHistory(filepath)
+        assert reopened._connection.execute("SELECT count FROM digest").fetchone() == (5,)
+        assert reopened.digest() == expected
+
+        reopened.remove_sale(make_transaction(SALE, time=datetime.time(hour=15)))
+        assert reopened._connection.execute("SELECT count FROM digest").fetchone() is None
+        assert reopened.digest().count == 4
+
+
+class TestSQLiteFinder:
+
+    def test_finder(self, histories):
+        _, sqlite_history = histories
+        finder = TransactionFinder(tx_history=sqlite_history, tx_type=PURCHASE)
+        assert len(finder.with_year(2024).find_all()) == 2
+        assert len(finder.reset().with_tx_currency("USD").find_all()) == 1
+        assert len(finder.reset().with_quantity_greater_than(QUANTITY).find_all()) == 1
+        assert len(finder.reset().with_time_between(datetime.time(hour=14), datetime.time(hour=15)).find_all()) == 1
+        assert TransactionFinder(tx_history=sqlite_history, tx_type=SPLIT).with_ratio(RATIO).find_all() == [Split(date= DATE + datetime.timedelta(days=1), ratio= RATIO)]
+
+    def test_same_results(self, histories):
+        tx_history, sqlite_history = histories
+        for history_finder in [lambda history: TransactionFinder(history, SALE).with_date_between(DATE, DATE + datetime.timedelta(days=400)),
+                               lambda history: TransactionFinder(history, PURCHASE).with_unit_price_less_than(UNIT_PRICE + 1).with_quantity(QUANTITY)]:
+            assert history_finder(sqlite_history).find_all() == history_finder(tx_history).find_all()
+
+    def test_finder_delete(self, histories):
+        _, sqlite_history = histories
+        assert TransactionFinder(tx_history=sqlite_history, tx_type=SALE).delete() == 2
+        assert len(sqlite_history) == 3
+        assert list(sqlite_history.iter_chronological(SALE)) == []
+
+
+class TestSQLiteAddMany:
+
+    def test_add_many_matches_single_inserts(self, histories):
+        tx_history, _ = histories
+        sqlite_history = SQLiteTransactionHistory()
+        sqlite_history.add_many(pd.DataFrame([obj.to_dict() for obj in tx_history.iter_chronological(PURCHASE)]))
+        sqlite_history.add_many(tx_history.iter_chronological(SALE))
+        assert list(sqlite_history.iter_chronological()) == [obj for obj in tx_history.iter_chronological() if obj.type != SPLIT]
+
+    def test_add_many_rolls_back(self, histories):
+        _, sqlite_history = histories
+        with pytest.raises(DuplicateError):
+            sqlite_history.add_many([make_transaction(SALE, date=DATE + datetime.timedelta(days=10)), make_transaction(PURCHASE, quantity=QUANTITY * 10)])
+        with pytest.raises(DuplicateError):
+            sqlite_history.add_many([make_transaction(SALE, date=DATE + datetime.timedelta(days=10))] * 2)
+        assert len(sqlite_history) == 5
+        assert sqlite_history.on(DATE + datetime.timedelta(days=10)) == []
+
+    def test_invalid_value_is_not_a_duplicate(self, histories):
+        _, sqlite_history = histories
+        with pytest.raises(ValueError, match="NOT NULL") as error:
+            sqlite_history.add_purchase(make_transaction(PURCHASE, quantity=float("nan")))
+        assert not isinstance(error.value, DuplicateError)
+        assert len(sqlite_history) == 5
+
+    def test_remove_all_rolls_back(self, histories):
+        _, sqlite_history = histories
+        with pytest.raises(KeyError):
+            sqlite_history.remove_all([make_transaction(SALE, time=datetime.time(hour=15)), make_transaction(SALE, quantity=QUANTITY * 3)])
+        assert len(sqlite_history) == 5
+        assert len(sqlite_history.on(DATE, SALE)) == 1
+
+
+class TestSQLiteStatistics:
+
+    def test_get_data_for_statistics(self, histories):
+        tx_history, sqlite_history = histories
+        inputs = sqlite_history.get_data_for_statistics()
+        assert list(inputs[PURCHASE].columns) == Transaction.columns()
+        assert list(inputs[SPLIT].columns) == Split.columns()
+        assert list(inputs[PURCHASE]["tx_currency"]) == [TX_CURRENCY, "USD"]
+        assert inputs[SALE]["time"].iloc[0] == pd.Timedelta(hours=15)
+
+    def test_chunks(self, histories):
+        _, sqlite_history = histories
+        chunks = list(sqlite_history.iter_chunks_for_statistics())
+        assert len(chunks) == 3
+        assert sum(len(chunk[tx_type]["date"]) for chunk in chunks for tx_type in chunk) == 5
+
+        since = (DATE + datetime.timedelta(days=1), TIME)
+        assert {tx_type: len(columns["date"]) for tx_type, columns in sqlite_history.get_arrays_for_statistics(since).items()} == {SALE: 1, PURCHASE: 0, SPLIT: 1}
+
+    def test_same_statistics(self, histories):
+        tx_history, sqlite_history = histories
+        expected = Statistics()
+        expected.recalculate_statistics(tx_history.get_arrays_for_statistics())
+        actual = Statistics()
+        actual.recalculate_statistics(sqlite_history.get_arrays_for_statistics())
+
+        assert list(actual.full_history()["ACB"]) == pytest.approx(list(expected.full_history()["ACB"]))
+        assert actual.total_capital_gains_for(2025) == pytest.approx(expected.total_capital_gains_for(2025))
+
+    def test_asset(self):
+        stock = Stock(NAME + "_SQLITE", SQLiteTransactionHistory())
+        stock.purchase(DATE, QUANTITY * 4, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        stock.split(DATE + datetime.timedelta(days=1), RATIO)
+        stock.sell(DATE + datetime.timedelta(days=2), QUANTITY * 2, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert stock.statistics().holdings_at_end_of_day(DATE + datetime.timedelta(days=2)) == QUANTITY * 4 * RATIO - QUANTITY * 2
@@ -0,0 +1,305 @@
+import numpy as np
+import pytest
+import datetime
+from test.globals import *
+
+from src.transactions import Transaction, Split, TransactionHistory, HistoryDigest, SALE, PURCHASE, SPLIT
+from src.stats import Statistics, UncoveredSaleError, _linear_recurrence, _split_factors, _superficial_loss_fractions, SUPERFICIAL_LOSS_DAYS, fingerprint
+
+
+def make_transaction(tx_type, date, quantity, unit_price, closing_costs=0, time=TIME):
+    return Transaction(
+        type= tx_type,
+        date= date,
+        quantity= quantity,
+        unit_price= unit_price,
+        closing_costs= closing_costs,
+        tx_currency= TX_CURRENCY,
+        exch_rate= EXCH_RATE,
+        target_currency= TARGET_CURRENCY,
+        time= time,
+    )
+
+
+@pytest.fixture
+def simple_transaction_history():
+    tx_history = TransactionHistory()
+    tx_history.add_purchase(make_transaction(PURCHASE, DATE, 10, 100, closing_costs=10))
+    tx_history.add_purchase(make_transaction(PURCHASE, DATE + datetime.timedelta(days=1), 10, 120))
+    tx_history.add_sale(make_transaction(SALE, DATE + datetime.timedelta(days=2), 5, 130, closing_costs=5))
+    tx_history.add_sale(make_transaction(SALE, DATE + datetime.timedelta(days=366), 15, 90))
+    return tx_history
+
+
+class TestLinearRecurrence:
+
+    def test_matches_loop(self):
+        rng = np.random.default_rng(0)
+        m = rng.random(1000)
+        m[rng.random(1000) < 0.05] = 0
+        b = rng.random(1000)
+
+        expected = np.empty(1000)
+        x = 2.0
+        for i in range(1000):
+            x = m[i] * x + b[i]
+            expected[i] = x
+
+        assert np.allclose(_linear_recurrence(m, b, 2.0), expected)
+
+    def test_no_underflow(self):
+        # 0.99 ** 100000 underflows to zero, the block-wise scan must not
+        m = np.full(100000, 0.99)
+        b = np.ones(100000)
+        assert np.allclose(_linear_recurrence(m, b)[-1], 100)
+
+
+class TestStatistics:
+
+    @pytest.fixture
+    def statistics(self, simple_transaction_history) -> Statistics:
+        statistics = Statistics()
+        statistics.recalculate_statistics(simple_transaction_history.get_data_for_statistics())
+        return statistics
+
+    def test_full_history(self, statistics):
+        history = statistics.full_history()
+        assert len(history) == 4
+        assert list(history["holdings"]) == [10, 20, 15, 0]
+
+    def test_ACB_at_end_of_day(self, statistics):
+        assert statistics.ACB_at_end_of_day(DATE - datetime.timedelta(days=1)) == 0
+        assert statistics.ACB_at_end_of_day(DATE) == pytest.approx(1010 * EXCH_RATE)
+        assert statistics.ACB_at_end_of_day(DATE + datetime.timedelta(days=1)) == pytest.approx(2210 * EXCH_RATE)
+        assert statistics.ACB_at_end_of_day(DATE + datetime.timedelta(days=2)) == pytest.approx(2210 * 0.75 * EXCH_RATE)
+
+    def test_ACB_at_end_of_day_many(self, statistics):
+        dates = [DATE + datetime.timedelta(days=day) for day in range(-1, 4)]
+        expected = [statistics.ACB_at_end_of_day(day) for day in dates]
+        assert list(statistics.ACB_at_end_of_day_many(dates)) == pytest.approx(expected)
+
+    def test_end_of_day_series(self, statistics):
+        # one entry per day with at least one event
+        assert len(statistics._end_of_day_dates) == 4
+        assert statistics.holdings_at_end_of_day(DATE + datetime.timedelta(days=100)) == 15
+
+    def test_end_of_day_uses_last_event_of_day(self):
+        tx_history = TransactionHistory()
+        tx_history.add_purchase(make_transaction(PURCHASE, DATE, 10, 100))
+        tx_history.add_sale(make_transaction(SALE, DATE, 5, 100, time=datetime.time(hour=16)))
+        statistics = Statistics()
+        statistics.recalculate_statistics(tx_history.get_data_for_statistics())
+
+        assert statistics.ACB_at_end_of_day(DATE) == pytest.approx(500 * EXCH_RATE)
+        assert statistics.holdings_at_end_of_day(DATE) == 5
+
+    def test_capital_gains(self, statistics):
+        assert statistics.total_capital_gains_for(2024) == pytest.approx((5 * 130 - 5 - 2210 / 4) * EXCH_RATE)
+        assert statistics.total_capital_gains_for(2025) == pytest.approx((15 * 90 - 2210 * 0.75) * EXCH_RATE)
+        assert statistics.total_capital_gains_for(2026) == 0
+
+    def test_list_capital_gains(self, statistics):
+        assert len(statistics.list_capital_gains_for(2024)) == 1
+        assert len(statistics.list_capital_gains_for(2025)) == 1
+        assert len(statistics.history_for(2024)) == 3
+
+    def test_yearly_capital_gains(self, statistics):
+        partition = statistics.yearly_capital_gains_for(2025)
+        assert (partition.start, partition.end) == (1, 2)
+        assert partition.proceeds == pytest.approx(15 * 90 * EXCH_RATE)
+        assert partition.ACB == pytest.approx(2210 * 0.75 * EXCH_RATE)
+        assert statistics.yearly_capital_gains_for(2026) is None
+        assert statistics.capital_gains_by_year() == pytest.approx({
+            2024: statistics.total_capital_gains_for(2024),
+            2025: statistics.total_capital_gains_for(2025),
+        })
+
+    def test_same_time_purchase_before_sale(self):
+        tx_history = TransactionHistory()
+        tx_history.add_sale(make_transaction(SALE, DATE, QUANTITY, UNIT_PRICE))
+        tx_history.add_purchase(make_transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE))
+
+        statistics = Statistics()
+        statistics.recalculate_statistics(tx_history.get_data_for_statistics())
+        assert statistics.total_capital_gains_for(DATE.year) == 0
+
+    def test_uncovered_sale(self):
+        tx_history = TransactionHistory()
+        tx_history.add_sale(make_transaction(SALE, DATE, QUANTITY, UNIT_PRICE))
+
+        with pytest.raises(UncoveredSaleError):
+            Statistics().recalculate_statistics(tx_history.get_data_for_statistics())
+
+    def test_empty_history(self):
+        statistics = Statistics()
+        statistics.recalculate_statistics(TransactionHistory().get_data_for_statistics())
+        assert len(statistics.full_history()) == 0
+        assert statistics.total_capital_gains_for(DATE.year) == 0
+        assert statistics.ACB_at_end_of_day(DATE) == 0
+        assert list(statistics.ACB_at_end_of_day_many([DATE])) == [0]
+        assert statistics.capital_gains_by_year() == {}
+        assert len(statistics.list_capital_gains_for(DATE.year)) == 0
+
+
+class TestSuperficialLosses:
+
+    @staticmethod
+    def statistics_for(*transactions) -> Statistics:
+        tx_history = TransactionHistory()
+        tx_history.add_many(transactions)
+        statistics = Statistics()
+        statistics.recalculate_statistics(tx_history.get_arrays_for_statistics())
+        return statistics
+
+    def test_loss_denied_when_repurchased(self):
+        statistics = self.statistics_for(
+            make_transaction(PURCHASE, DATE, 100, 10),
+            make_transaction(SALE, DATE + datetime.timedelta(days=10), 100, 8),
+            make_transaction(PURCHASE, DATE + datetime.timedelta(days=20), 100, 8),
+        )
+        gains = statistics.list_capital_gains_for(DATE.year)
+        assert gains["superficial_loss"].iloc[0] == pytest.approx(200 * EXCH_RATE)
+        assert statistics.total_capital_gains_for(DATE.year) == pytest.approx(0)
+        # the denied loss is added to the ACB of the replacement shares
+        assert statistics.ACB_at_end_of_day(DATE + datetime.timedelta(days=20)) == pytest.approx(1000 * EXCH_RATE)
+
+    def test_partial_denial(self):
+        # min(sold = 100, acquired in the window = 150, held at the end of the window = 50) / sold = 1/2 of the loss is denied
+        statistics = self.statistics_for(
+            make_transaction(PURCHASE, DATE, 100, 10),
+            make_transaction(SALE, DATE + datetime.timedelta(days=10), 100, 8),
+            make_transaction(PURCHASE, DATE + datetime.timedelta(days=20), 50, 8),
+        )
+        assert statistics.total_capital_gains_for(DATE.year) == pytest.approx(-100 * EXCH_RATE)
+        assert statistics.ACB_at_end_of_day(DATE + datetime.timedelta(days=20)) == pytest.approx(500 * EXCH_RATE)
+
+    def test_no_denial_outside_window(self):
+        statistics = self.statistics_for(
+            make_transaction(PURCHASE, DATE, 100, 10),
+            make_transaction(SALE, DATE + datetime.timedelta(days=SUPERFICIAL_LOSS_DAYS + 1), 100, 8),
+            make_transaction(PURCHASE, DATE + datetime.timedelta(days=2 * SUPERFICIAL_LOSS_DAYS + 2), 100, 8),
+        )
+        assert statistics.total_capital_gains_for(DATE.year) == pytest.approx(-200 * EXCH_RATE)
+
+    def test_gains_unaffected(self):
+        statistics = self.statistics_for(
+            make_transaction(PURCHASE, DATE, 100, 10),
+            make_transaction(SALE, DATE + datetime.timedelta(days=10), 50, 12),
+            make_transaction(PURCHASE, DATE + datetime.timedelta(days=20), 100, 8),
+        )
+        assert statistics.total_capital_gains_for(DATE.year) == pytest.approx(100 * EXCH_RATE)
+        assert statistics.yearly_capital_gains_for(DATE.year).superficial_loss == 0
+
+    def test_fractions_match_pairwise_scan(self):
+        rng = np.random.default_rng(0)
+        n = 500
+        days = np.sort(rng.integers(0, 365, size=n))
+        timestamps = np.datetime64("2024-01-01", "ns") + days.astype("timedelta64[D]")
+        is_sale = rng.random(n) < 0.4
+        quantity = rng.integers(1, 10, size=n).astype(float)
+        holdings = np.cumsum(np.where(is_sale, -quantity, quantity)) + 1000
+
+        expected = np.zeros(n)
+        for i in np.flatnonzero(is_sale):
+            acquired = sum(quantity[j] for j in range(n) if not is_sale[j] and abs(days[j] - days[i]) <= SUPERFICIAL_LOSS_DAYS)
+            held = holdings[max(j for j in range(n) if days[j] <= days[i] + SUPERFICIAL_LOSS_DAYS)]
+            expected[i] = min(quantity[i], acquired, held) / quantity[i]
+
+        assert np.allclose(_superficial_loss_fractions(timestamps, is_sale, ~is_sale, quantity, holdings), expected)
+
+
+class TestSplits:
+
+    @staticmethod
+    def statistics_for(*records) -> Statistics:
+        tx_history = TransactionHistory()
+        tx_history.add_many(records)
+        statistics = Statistics()
+        statistics.recalculate_statistics(tx_history.get_arrays_for_statistics())
+        return statistics
+
+    def test_split(self):
+        statistics = self.statistics_for(
+            make_transaction(PURCHASE, DATE, 10, 100),
+            Split(date= DATE + datetime.timedelta(days=1), ratio= 2),
+            make_transaction(SALE, DATE + datetime.timedelta(days=2), 10, 60),
+        )
+        history = statistics.full_history()
+        assert list(history["type"]) == [PURCHASE, SPLIT, SALE]
+        assert list(history["quantity"])[0] == 10  # records aren't rewritten
+        assert list(history["holdings"]) == [10, 20, 10]
+        assert list(history["ACB_per_share"]) == pytest.approx([100 * EXCH_RATE, 50 * EXCH_RATE, 50 * EXCH_RATE])
+        assert statistics.total_capital_gains_for(DATE.year) == pytest.approx((600 - 500) * EXCH_RATE)
+        assert statistics.holdings_at_end_of_day(DATE + datetime.timedelta(days=1)) == 20
+
+    def test_reverse_split(self):
+        statistics = self.statistics_for(
+            make_transaction(PURCHASE, DATE, 100, 1),
+            Split(date= DATE + datetime.timedelta(days=1), ratio= 0.1),
+            make_transaction(SALE, DATE + datetime.timedelta(days=2), 10, 12),
+        )
+        assert list(statistics.full_history()["holdings"]) == pytest.approx([100, 10, 0])
+        assert statistics.total_capital_gains_for(DATE.year) == pytest.approx(20 * EXCH_RATE)
+
+        with pytest.raises(UncoveredSaleError):
+            self.statistics_for(
+                make_transaction(PURCHASE, DATE, 100, 1),
+                Split(date= DATE + datetime.timedelta(days=1), ratio= 0.1),
+                make_transaction(SALE, DATE + datetime.timedelta(days=2), 11, 12),
+            )
+
+    def test_split_applies_before_same_time_transactions(self):
+        statistics = self.statistics_for(
+            make_transaction(PURCHASE, DATE, 10, 100),
+            make_transaction(PURCHASE, DATE + datetime.timedelta(days=1), 10, 50),
+            Split(date= DATE + datetime.timedelta(days=1), ratio= 2),
+        )
+        assert list(statistics.full_history()["holdings"]) == [10, 20, 30]
+
+    def test_split_factors(self):
+        timestamps = np.arange(5).astype("datetime64[D]")
+        is_split = np.array([False, True, False, True, False])
+        ratios = np.array([np.nan, 2, np.nan, 3, np.nan])
+        assert list(_split_factors(timestamps, is_split, ratios)) == [6, 3, 3, 1, 1]
+
+
+class TestStatisticsCache:
+
+    def test_save_load(self, simple_transaction_history, tmp_path):
+        filepath = str(tmp_path / "statistics.npz")
+        simple_transaction_history.add_split(Split(date= DATE + datetime.timedelta(days=3), ratio= RATIO))
+        inputs = simple_transaction_history.get_arrays_for_statistics()
+        expected = Statistics()
+        expected.recalculate_statistics(inputs)
+        expected.save_cache(filepath, fingerprint(HistoryDigest.from_inputs(inputs)))
+
+        loaded = Statistics()
+        assert loaded.is_empty()
+        assert loaded.load_cache(filepath, fingerprint(HistoryDigest.from_inputs(inputs))) == True
+        assert loaded.full_history().equals(expected.full_history())
+        assert loaded.list_capital_gains_for(DATE.year + 1).equals(expected.list_capital_gains_for(DATE.year + 1))
+        assert loaded.yearly_capital_gains_for(DATE.year) == expected.yearly_capital_gains_for(DATE.year)
+        assert loaded.ACB_at_end_of_day(DATE + datetime.timedelta(days=2)) == expected.ACB_at_end_of_day(DATE + datetime.timedelta(days=2))
+
+    def test_key_mismatch(self, simple_transaction_history, tmp_path):
+        filepath = str(tmp_path / "statistics.npz")
+        statistics = Statistics()
+        statistics.recalculate_statistics(simple_transaction_history.get_arrays_for_statistics())
+        statistics.save_cache(filepath, "key")
+
+        loaded = Statistics()
+        assert loaded.load_cache(filepath, "other key") == False
+        assert loaded.load_cache(str(tmp_path / "missing.npz"), "key") == False
+        (tmp_path / "corrupt.npz").write_bytes(b"not a cache")
+        assert loaded.load_cache(str(tmp_path / "corrupt.npz"), "key") == False
+        assert loaded.is_empty()
+
+    def test_fingerprint(self, simple_transaction_history):
+        key = fingerprint(simple_transaction_history.digest())
+        assert key == fingerprint(HistoryDigest.from_inputs(simple_transaction_history.get_arrays_for_statistics()))
+
+        purchase = make_transaction(PURCHASE, DATE + datetime.timedelta(days=5), 1, 100)
+        simple_transaction_history.add_purchase(purchase)
+        assert fingerprint(simple_transaction_history.digest()) != key
+        simple_transaction_history.remove_purchase(purchase)
+        assert fingerprint(simple_transaction_history.digest()) == key
@@ -1,9 +1,14 @@
+import dataclasses
+import sys
+import numpy as np
 import pandas as pd
 import pytest
 import datetime
 from test.globals import *
 
-from src.transactions import Split, Transaction, TransactionHistory, TransactionFinder, DuplicateError, SALE, PURCHASE, SPLIT
+from src.transactions import Split, Transaction, TransactionHistory, TransactionFinder, DuplicateError, HistoryDigest, dates_to_datetime64, SALE, PURCHASE, SPLIT
+from src.columnar import ColumnarTransactionHistory
+from src.sqlite_history import SQLiteTransactionHistory
 
 class TestTransaction:
 
@@ -219,6 +224,41 @@ class TestTransaction:
         with pytest.raises(DuplicateError):
             tx_history.add_split(spl)
 
+    def test_no_duplicate_purchase_copy(self):
+        tx_history = TransactionHistory()
+        purchase = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        purchase_copy = Transaction(PURCHASE, DATE, float(QUANTITY), UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        tx_history.add_purchase(purchase)
+
+        with pytest.raises(DuplicateError):
+            tx_history.add_purchase(purchase_copy)
+
+    def test_same_record_as_purchase_and_sale(self):
+        # duplicates are only detected within the same kind of transaction
+        tx_history = TransactionHistory()
+        tx_history.add_purchase(Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY))
+        tx_history.add_sale(Transaction(SALE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY))
+
+        assert len(tx_history) == 2
+
+    def test_add_after_remove(self):
+        tx_history = TransactionHistory()
+        purchase = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        tx_history.add_purchase(purchase)
+        tx_history.remove_purchase(purchase)
+        tx_history.add_purchase(purchase)
+
+        assert len(tx_history) == 1
+
+    def test_fail_remove_purchase_as_sale(self):
+        tx_history = TransactionHistory()
+        purchase = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        tx_history.add_purchase(purchase)
+
+        with pytest.raises(KeyError):
+            tx_history.remove_sale(purchase)
+        assert len(tx_history) == 1
+
     def test_fail_remove_inexistent_purchase(self):
         tx_history = TransactionHistory()
         purchase1 = Transaction(
@@ -342,6 +382,105 @@ class TestTransaction:
         assert (stats_input.get(SPLIT) == pd.DataFrame(columns=["type", "date", "ratio", "time"])).all().all()
 
 
+class TestRecords:
+
+    def test_transaction_hashable(self):
+        tx1 = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        tx2 = Transaction(PURCHASE, DATE, float(QUANTITY), UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert len({tx1, tx2}) == 1
+        assert {tx1: True}[tx2]
+
+    def test_split_hashable(self):
+        assert len({Split(date= DATE, ratio= RATIO), Split(date= DATE, ratio= RATIO)}) == 1
+
+    def test_transaction_frozen(self):
+        tx = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            tx.quantity = QUANTITY + 1
+
+    def test_transaction_slotted(self):
+        tx = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert not hasattr(tx, "__dict__")
+
+    def test_interned_codes(self):
+        tx1 = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, "".join(["E", "UR"]), EXCH_RATE, TARGET_CURRENCY)
+        tx2 = Transaction("".join(["Purch", "ase"]), DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, "".join(["EU", "R"]), EXCH_RATE, TARGET_CURRENCY)
+        assert tx1.tx_currency is tx2.tx_currency
+        assert tx2.type is PURCHASE
+
+    def test_str_subclass_currencies(self):
+        tx = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, np.array([TX_CURRENCY])[0], EXCH_RATE, np.str_(TARGET_CURRENCY))
+        assert type(tx.tx_currency) is str
+        assert tx.tx_currency is Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY).tx_currency
+
+        tx_history = TransactionHistory()
+        tx_history.add_many(pd.DataFrame({
+            "type": [PURCHASE], "date": [DATE], "quantity": [QUANTITY], "unit_price": [UNIT_PRICE], "closing_costs": [CLOSING_COSTS],
+            "tx_currency": [np.str_("USD")], "exch_rate": [EXCH_RATE], "target_currency": [np.str_(TARGET_CURRENCY)], "time": [TIME],
+        }))
+        assert next(tx_history.iter_chronological()).tx_currency == "USD"
+
+    @pytest.mark.parametrize("ratio", [0, -RATIO, float("nan")])
+    def test_invalid_split_ratio(self, ratio):
+        with pytest.raises(ValueError):
+            Split(date= DATE, ratio= ratio)
+
+    @pytest.mark.parametrize("tx_history", [TransactionHistory, ColumnarTransactionHistory, SQLiteTransactionHistory])
+    def test_add_many_invalid_split_ratio(self, tx_history):
+        history = tx_history()
+        with pytest.raises(ValueError):
+            history.add_many({"type": [SPLIT], "date": [DATE], "ratio": [0.0]})
+        assert len(history) == 0
+
+    def test_dates_to_datetime64(self):
+        dates = [datetime.date(1969, 12, 31), datetime.date(1970, 1, 1), DATE]
+        assert list(dates_to_datetime64(dates)) == list(np.array(dates, dtype="datetime64[D]"))
+        assert dates_to_datetime64([]).dtype == np.dtype("datetime64[D]")
+
+    def test_invalid_type(self):
+        with pytest.raises(AssertionError):
+            Transaction(SPLIT, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+
+
+class TestChronologicalIndex:
+
+    def test_iter_chronological(self, long_transaction_history):
+        items = list(long_transaction_history.iter_chronological())
+        keys = [(item.date, item.time) for item in items]
+        assert len(items) == 13
+        assert keys == sorted(keys)
+
+    def test_iter_chronological_by_type(self, long_transaction_history):
+        items = list(long_transaction_history.iter_chronological(SPLIT))
+        assert len(items) == 5
+        assert all(item.type == SPLIT for item in items)
+
+    def test_insertion_order_within_same_time(self):
+        tx_history = TransactionHistory()
+        spl1 = Split(date= DATE, ratio= RATIO)
+        spl2 = Split(date= DATE, ratio= RATIO + 1)
+        tx_history.add_split(spl1)
+        tx_history.add_split(spl2)
+
+        assert list(tx_history.iter_chronological()) == [spl1, spl2]
+
+    def test_on(self, long_transaction_history):
+        assert len(long_transaction_history.on(DATE)) == 7
+        assert len(long_transaction_history.on(DATE, PURCHASE)) == 2
+        assert len(long_transaction_history.on(DATE + datetime.timedelta(days=2))) == 0
+
+    def test_between(self, long_transaction_history):
+        assert len(long_transaction_history.between(DATE, DATE + datetime.timedelta(days=1))) == 10
+        assert len(long_transaction_history.between(DATE + datetime.timedelta(days=1), datetime.date.max)) == 6
+
+    def test_remove_keeps_index_in_sync(self, long_transaction_history):
+        spl = Split(date= DATE, ratio= RATIO + 1)
+        long_transaction_history.remove_split(spl)
+
+        assert len(long_transaction_history.on(DATE, SPLIT)) == 2
+        assert len(list(long_transaction_history.iter_chronological())) == len(long_transaction_history)
+
+
 @pytest.fixture
 def long_transaction_history():
 
@@ -666,4 +805,248 @@ class TestTransactionFinderSplit:
         list_found = tx_finder.with_date(DATE) \
             .with_ratio(RATIO + 1) \
             .find_all()
-        assert len(list_found) == 1
\ No newline at end of file
+        assert len(list_found) == 1
+
+class TestAddMany:
+
+    @pytest.fixture
+    def batch(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "type": [PURCHASE, SALE, SPLIT],
+            "date": [DATE, DATE, DATE + datetime.timedelta(days=1)],
+            "quantity": [QUANTITY, QUANTITY, None],
+            "unit_price": [UNIT_PRICE, UNIT_PRICE, None],
+            "closing_costs": [CLOSING_COSTS, CLOSING_COSTS, None],
+            "tx_currency": [TX_CURRENCY, TX_CURRENCY, None],
+            "exch_rate": [EXCH_RATE, EXCH_RATE, None],
+            "target_currency": [TARGET_CURRENCY, TARGET_CURRENCY, None],
+            "ratio": [None, None, RATIO],
+            "time": [TIME, datetime.time(hour=10), None],
+        })
+
+    def test_add_many_dataframe(self, batch):
+        tx_history = TransactionHistory()
+        tx_history.add_many(batch)
+
+        assert len(tx_history) == 3
+        assert [item.type for item in tx_history.iter_chronological()] == [PURCHASE, SALE, SPLIT]
+        assert tx_history.on(DATE, SALE)[0].time == datetime.time(hour=10)
+        assert tx_history.dirty_since() == (DATE, TIME)
+
+    @pytest.mark.parametrize("tx_history", [TransactionHistory, ColumnarTransactionHistory, SQLiteTransactionHistory])
+    def test_add_many_string_dates_and_times(self, batch, tx_history):
+        batch["date"] = [DATE.isoformat(), DATE.isoformat(), (DATE + datetime.timedelta(days=1)).isoformat()]
+        batch["time"] = [TIME.isoformat(), "10:00", None]
+        history = tx_history()
+        history.add_many(batch)
+
+        assert [(item.date, item.time) for item in history.iter_chronological()] \
+            == [(DATE, TIME), (DATE, datetime.time(hour=10)), (DATE + datetime.timedelta(days=1), datetime.time.min)]
+
+    @pytest.mark.parametrize("tx_history", [TransactionHistory, ColumnarTransactionHistory, SQLiteTransactionHistory])
+    @pytest.mark.parametrize("column, value", [("date", "not a date"), ("date", 3.5), ("time", "25:00"), ("time", 5)])
+    def test_add_many_invalid_dates_and_times(self, batch, tx_history, column, value):
+        batch[column] = [value] * len(batch)
+        history = tx_history()
+        with pytest.raises(ValueError):
+            history.add_many(batch)
+        assert len(history) == 0
+
+    def test_add_many_records(self, long_transaction_history):
+        tx_history = TransactionHistory()
+        tx_history.add_many(long_transaction_history.iter_chronological())
+
+        assert list(tx_history.iter_chronological()) == list(long_transaction_history.iter_chronological())
+        assert len(TransactionFinder(tx_history, PURCHASE).with_year(2024).find_all()) == 3
+
+    def test_add_many_unsorted_records(self, long_transaction_history):
+        tx_history = TransactionHistory()
+        tx_history.add_many(reversed(list(long_transaction_history.iter_chronological())))
+
+        assert [(item.date, item.time) for item in tx_history.iter_chronological()] \
+            == [(item.date, item.time) for item in long_transaction_history.iter_chronological()]
+        assert tx_history.dirty_since() == long_transaction_history.dirty_since()
+
+    def test_add_many_dataframe_fields(self, batch):
+        tx_history = TransactionHistory()
+        tx_history.add_many(batch)
+        purchase = tx_history.on(DATE, PURCHASE)[0]
+
+        assert purchase == Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        assert purchase.type is PURCHASE
+        assert purchase.tx_currency is sys.intern(TX_CURRENCY)
+
+    def test_add_many_merges_into_existing(self, long_transaction_history):
+        long_transaction_history.add_many([Split(date= DATE - datetime.timedelta(days=1), ratio= RATIO)])
+
+        assert next(long_transaction_history.iter_chronological()).date == DATE - datetime.timedelta(days=1)
+        assert len(long_transaction_history) == 14
+
+    def test_add_many_duplicate_in_batch(self, batch):
+        tx_history = TransactionHistory()
+        with pytest.raises(DuplicateError):
+            tx_history.add_many(pd.concat([batch, batch.head(1)]))
+        assert len(tx_history) == 0
+
+    def test_add_many_duplicate_with_existing(self, batch):
+        tx_history = TransactionHistory()
+        tx_history.add_many(batch.head(1))
+        with pytest.raises(DuplicateError):
+            tx_history.add_many(batch)
+        assert len(tx_history) == 1
+
+    def test_add_many_invalid_type(self, batch):
+        batch.loc[0, "type"] = "Gift"
+        with pytest.raises(ValueError):
+            TransactionHistory().add_many(batch)
+
+    def test_add_many_missing_values(self, batch):
+        batch.loc[0, "quantity"] = None
+        with pytest.raises(ValueError):
+            TransactionHistory().add_many(batch)
+
+
+class TestTransactionFinderIndexes:
+
+    @pytest.fixture
+    def indexed_history(self, long_transaction_history) -> TransactionHistory:
+        for field in ["tx_currency", "quantity", "unit_price", "time"]:
+            long_transaction_history.create_index(field)
+        return long_transaction_history
+
+    def test_create_invalid_index(self, long_transaction_history):
+        with pytest.raises(ValueError):
+            long_transaction_history.create_index("date")
+
+    def test_same_results_with_indexes(self, long_transaction_history):
+        expected = TransactionFinder(long_transaction_history, PURCHASE).with_quantity(QUANTITY + 1).with_tx_currency(TX_CURRENCY).find_all()
+        long_transaction_history.create_index("tx_currency")
+        long_transaction_history.create_index("quantity")
+        found = TransactionFinder(long_transaction_history, PURCHASE).with_quantity(QUANTITY + 1).with_tx_currency(TX_CURRENCY).find_all()
+        assert found == expected
+        assert len(found) == 1
+
+    def test_index_uses_most_selective(self, indexed_history):
+        secondary_index = indexed_history.get_index("tx_currency")
+        assert secondary_index.count(PURCHASE, "USD", "USD") == 1
+        assert secondary_index.count(PURCHASE, TX_CURRENCY, TX_CURRENCY) == 3
+        assert len(TransactionFinder(indexed_history, PURCHASE).with_tx_currency("USD").find_all()) == 1
+
+    def test_index_kept_in_sync(self, indexed_history):
+        usd_purchase = TransactionFinder(indexed_history, PURCHASE).with_tx_currency("USD").find_all()[0]
+        indexed_history.remove_purchase(usd_purchase)
+        assert TransactionFinder(indexed_history, PURCHASE).with_tx_currency("USD").find_all() == []
+
+        indexed_history.add_purchase(usd_purchase)
+        assert TransactionFinder(indexed_history, PURCHASE).with_tx_currency("USD").find_all() == [usd_purchase]
+
+    def test_find_by_date_between(self, indexed_history):
+        finder = TransactionFinder(indexed_history, SALE)
+        assert len(finder.with_date_between(DATE, DATE + datetime.timedelta(days=1)).find_all()) == 3
+        assert len(finder.with_year(2025).find_all()) == 0
+
+    def test_find_by_quantity_greater_than(self, indexed_history):
+        assert len(TransactionFinder(indexed_history, PURCHASE).with_quantity_greater_than(QUANTITY).find_all()) == 2
+        assert len(TransactionFinder(indexed_history, PURCHASE).with_quantity_greater_than(QUANTITY - 1).find_all()) == 4
+
+    def test_find_by_quantity_less_than(self, long_transaction_history):
+        assert len(TransactionFinder(long_transaction_history, PURCHASE).with_quantity_less_than(QUANTITY + 1).find_all()) == 2
+
+    def test_find_by_unit_price_between(self, indexed_history):
+        finder = TransactionFinder(indexed_history, SALE).with_unit_price_between(UNIT_PRICE + 0.5, UNIT_PRICE + 1)
+        assert len(finder.find_all()) == 2
+
+    def test_find_by_time_between(self, indexed_history):
+        finder = TransactionFinder(indexed_history, PURCHASE).with_time_between(datetime.time(hour=12), datetime.time(hour=15))
+        assert len(finder.find_all()) == 1
+
+    def test_equality_and_range_combined(self, indexed_history):
+        finder = TransactionFinder(indexed_history, PURCHASE).with_quantity(QUANTITY).with_quantity_greater_than(QUANTITY)
+        assert finder.find_all() == []
+
+
+class TestRemoveAll:
+
+    def test_remove_all(self, long_transaction_history):
+        matches = TransactionFinder(long_transaction_history, SPLIT).with_ratio(RATIO).find_all()
+        long_transaction_history.remove_all(matches)
+
+        assert len(long_transaction_history) == 9
+        assert len(TransactionFinder(long_transaction_history, SPLIT).find_all()) == 1
+        assert len(list(long_transaction_history.iter_chronological(SPLIT))) == 1
+
+    def test_remove_all_compacts_empty_buckets(self, long_transaction_history):
+        TransactionFinder(long_transaction_history, PURCHASE).with_year(2025).delete()
+        assert 2025 not in long_transaction_history._purchases
+
+        TransactionFinder(long_transaction_history, PURCHASE).with_date(DATE + datetime.timedelta(days=1)).delete()
+        assert DATE + datetime.timedelta(days=1) not in long_transaction_history._purchases[2024]
+
+    def test_remove_compacts_empty_buckets(self):
+        tx_history = TransactionHistory()
+        spl = Split(date= DATE, ratio= RATIO)
+        tx_history.add_split(spl)
+        tx_history.remove_split(spl)
+
+        assert tx_history._splits == {}
+
+    def test_finder_delete(self, long_transaction_history):
+        removed = TransactionFinder(long_transaction_history, SALE).with_date(DATE).delete()
+
+        assert removed == 2
+        assert TransactionFinder(long_transaction_history, SALE).with_date(DATE).find_all() == []
+        assert len(long_transaction_history) == 11
+        assert long_transaction_history.dirty_since() == (DATE, TIME)
+
+    def test_remove_all_inexistent(self, long_transaction_history):
+        spl = Split(date= DATE, ratio= RATIO + 10)
+        matches = TransactionFinder(long_transaction_history, SPLIT).find_all() + [spl]
+
+        with pytest.raises(KeyError):
+            long_transaction_history.remove_all(matches)
+        assert len(long_transaction_history) == 13
+
+
+class TestHistoryDigest:
+
+    @pytest.mark.parametrize("tx_history", [TransactionHistory, ColumnarTransactionHistory, SQLiteTransactionHistory])
+    def test_kept_up_to_date(self, tx_history):
+        history = tx_history()
+        assert history.digest() == HistoryDigest()
+
+        purchase = Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY)
+        sale = Transaction(SALE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, "USD", EXCH_RATE, TARGET_CURRENCY, time=TIME)
+        split = Split(date= DATE + datetime.timedelta(days=1), ratio= RATIO)
+        history.add_purchase(purchase)
+        history.add_many([sale, split])
+        history.add_many(pd.DataFrame({
+            "type": [PURCHASE, SPLIT], "date": [DATE + datetime.timedelta(days=2)] * 2, "quantity": [QUANTITY, None],
+            "unit_price": [-0.0, None], "closing_costs": [CLOSING_COSTS, None], "tx_currency": [TX_CURRENCY, None],
+            "exch_rate": [EXCH_RATE, None], "target_currency": [TARGET_CURRENCY, None], "ratio": [None, RATIO],
+        }))
+        assert history.digest() == HistoryDigest.from_inputs(history.get_arrays_for_statistics())
+        assert history.digest().count == 5
+
+        history.remove_sale(sale)
+        history.remove_all([purchase, split])
+        assert history.digest() == HistoryDigest.from_inputs(history.get_arrays_for_statistics())
+        assert history.digest().count == 2
+
+    def test_same_across_engines(self):
+        # the digest only depends on the records, not on the storage engine nor on the order of insertion
+        records = [
+            Transaction(PURCHASE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, TX_CURRENCY, EXCH_RATE, TARGET_CURRENCY),
+            Transaction(SALE, DATE, QUANTITY, UNIT_PRICE, CLOSING_COSTS, "USD", EXCH_RATE, TARGET_CURRENCY, time=TIME),
+            Split(date= DATE + datetime.timedelta(days=1), ratio= RATIO),
+        ]
+        digests = []
+        for tx_history in (TransactionHistory, ColumnarTransactionHistory, SQLiteTransactionHistory):
+            history = tx_history()
+            history.add_many(records[::-1] if tx_history == ColumnarTransactionHistory else records)
+            digests.append(history.digest())
+        assert digests[0] == digests[1] == digests[2]
+
+        history = TransactionHistory()
+        history.add_many(records[:2])
+        assert history.digest() != digests[0]
+